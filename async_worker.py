@@ -0,0 +1,340 @@
+# async_worker.py
+"""
+asyncio SSH execution engine (asyncssh).
+Runs many sessions concurrently on a single thread, bounded by a fixed-size
+set of worker coroutines.  Accepts the same command_info and returns the same
+result dict as ssh_worker.run_ssh_task.  Selected with ENGINE = "async" in
+config.py.
+"""
+
+import asyncio
+import socket
+import time
+from contextlib import AsyncExitStack
+
+from config import TIMEOUT, DEBUG, ASYNC_MAX_CONCURRENCY, BATCH_COMBINED, MAX_OUTPUT_BYTES, COMMAND_TIMEOUT
+from bastion import AsyncTunnels, JumpHostError
+from credentials import default_auth
+from failures import classify_exception
+from hostkeys import HostKeyError, key_from_openssh
+from parsing import parse_output, build_batch_command, parse_batch_output, parse_batch_results
+from ssh_worker import READ_CHUNK, stamp_times, lap
+from transfer import run_transfer_async
+
+
+async def run_ssh_task_async(host_info, command_info, host_keys=None, auth=None, tunnels=None):
+    """
+    Connect to a single host, execute command, parse result, and return output.
+
+    Args:
+        host_info (dict): Contains 'ip', 'port', 'username', 'password', and 'hostname'.
+        command_info (dict): Contains 'command' and 'parse' regex, or 'batch'
+            mapping command keys to such dicts.
+        host_keys (HostKeyStore): Optional.  In strict and tofu mode a host on
+            record must present a key on record (asyncssh checks it before
+            auth); new keys are learned after connecting.
+        auth (SessionAuth): Session keys, agent and login throttle.  The
+            throttle covers the whole connect, as asyncssh logs in as part of it.
+        tunnels (AsyncTunnels): Optional.  A host with a jump_host is reached
+            through it; without it, every host is connected to directly.
+
+    Returns:
+        dict: Result in the same shape as run_ssh_task.
+    """
+    import asyncssh
+
+    started = time.time()
+    result = {
+        "hostname": host_info.get("hostname"),
+        "ip": host_info.get("ip"),
+        "port": host_info.get("port"),
+        "row_id": host_info.get("row_id"),
+        "output": "",
+        "error": "",
+        "timings": {}
+    }
+    if host_info.get("jump_host"):
+        result["jump_host"] = host_info["jump_host"]  # part of the host's identity (history, cache)
+    timings = result["timings"]
+
+    # With use_agent or a key_file the password may be empty: keys are used instead
+    key_auth = host_info.get("use_agent") or host_info.get("key_file")
+    required_fields = ["ip", "port", "username"] + ([] if key_auth else ["password"])
+    missing_fields = [field for field in required_fields if not host_info.get(field)]
+    if missing_fields:
+        result["error"] = f"Missing required fields: {', '.join(missing_fields)}"
+        result["error_code"] = "input"
+        stamp_times(result, started)
+        return result
+
+    try:
+        if DEBUG:
+            print(f"[DEBUG] Connecting to {host_info['ip']}:{host_info['port']} as {host_info['username']}")
+
+        auth = auth or default_auth()
+        known_hosts = _known_hosts(host_info, host_keys)
+        options = auth.asyncssh_options(host_info)
+        async with AsyncExitStack() as stack:
+            if tunnels is not None and host_info.get("jump_host"):
+                # Taken before the login slot: a bastion login may need one itself
+                options["tunnel"] = await stack.enter_async_context(tunnels.tunnel(host_info, timings))
+            async with auth.throttle.async_slot() as slot:
+                timings["auth_wait"] = slot.waited
+                if "tunnel" not in options:
+                    options["sock"] = await _open_socket(host_info, timings)
+                mark = time.perf_counter()
+                # asyncssh does key exchange and auth in one call; both land in "auth"
+                conn = await asyncssh.connect(
+                    host_info["ip"],
+                    port=int(host_info["port"]),
+                    username=host_info["username"],
+                    known_hosts=known_hosts,
+                    connect_timeout=TIMEOUT,
+                    login_timeout=TIMEOUT,
+                    **options,
+                )
+                lap(timings, "auth", mark)
+            await stack.enter_async_context(conn)
+            _check_server_key(conn, host_info, host_keys, known_hosts)
+            if "transfer" in command_info:
+                await run_transfer_async(conn, host_info, command_info["transfer"], result)
+            elif "batch" in command_info:
+                await _run_batch(conn, command_info["batch"], result)
+            else:
+                output, error_output, exit_status, note = await _run_command(conn, command_info["command"], timings)
+
+                if DEBUG:
+                    print(f"[DEBUG] Raw stdout from {host_info['ip']}:\n{output}")
+                    print(f"[DEBUG] Raw stderr from {host_info['ip']}:\n{error_output}")
+                    print(f"[DEBUG] Exit status: {exit_status}")
+
+                mark = time.perf_counter()
+                parse_output(output, error_output, exit_status, command_info, result, note)
+                lap(timings, "parse", mark)
+
+    except asyncssh.PermissionDenied:
+        result["error"] = "Authentication failed"
+        result["error_code"] = "auth"
+    except HostKeyError as key_err:
+        result["error"] = f"Host key rejected: {key_err}"
+        result["error_code"] = "hostkey"
+    except JumpHostError as jump_err:
+        result["error"] = f"SSH error: {jump_err}"
+        result["error_code"] = "jump"
+    except asyncssh.ChannelOpenError as open_err:
+        # Only a tunnelled connect opens a channel before the session; the bastion refused it
+        reason = open_err.reason or f"channel open failed ({open_err.code})"
+        result["error"] = (f"SSH error: jump host {host_info.get('jump_host')} cannot reach "
+                           f"{host_info['ip']}:{host_info['port']}: {reason}")
+        result["error_code"] = "jump"
+    except asyncssh.HostKeyNotVerifiable as key_err:
+        host_keys.tally("changed", "rejected")
+        result["error"] = f"Host key rejected: {key_err}"
+        result["error_code"] = "hostkey"
+    except asyncssh.Error as ssh_err:
+        result["error"] = f"SSH error: {ssh_err}"
+        result["error_code"] = classify_exception(ssh_err, "ssh")
+    except asyncio.TimeoutError:
+        result["error"] = "Unexpected error: timed out"
+        result["error_code"] = "timeout"
+    except Exception as e:
+        result["error"] = f"Unexpected error: {e}"
+        result["error_code"] = classify_exception(e)
+
+    stamp_times(result, started)
+    return result
+
+
+def _known_hosts(host_info, host_keys):
+    """
+    asyncssh known_hosts argument: the keys on record when they must match,
+    else None (any key; checked by host_keys after connecting).
+
+    Raises:
+        HostKeyError: strict mode and the host is not on record.
+    """
+    import asyncssh
+
+    if host_keys is None or host_keys.mode in ("off", "warn"):
+        return None
+    trusted = host_keys.trusted(host_info)
+    if trusted:
+        return [asyncssh.import_public_key(f"{key.get_name()} {key.get_base64()}") for key in trusted], [], []
+    if host_keys.mode == "strict":
+        raise HostKeyError(f"{host_info['ip']}:{host_info['port']} is not in known_hosts")
+    return None
+
+
+def _check_server_key(conn, host_info, host_keys, known_hosts):
+    """
+    After connecting: count a key asyncssh checked against known_hosts, or
+    have host_keys verify (and learn) the key when it did not check one.
+
+    Raises:
+        HostKeyError: See HostKeyStore.verify.
+    """
+    if known_hosts is not None:
+        host_keys.tally("verified")
+    elif host_keys is not None:
+        server_key = conn.get_server_host_key()
+        if server_key is not None:
+            host_keys.verify(host_info, key_from_openssh(server_key.export_public_key("openssh").decode()))
+
+
+async def _open_socket(host_info, timings):
+    """
+    Non-blocking resolve and TCP connect, recording the "dns" and "connect"
+    phases like ssh_worker.open_socket.
+    """
+    loop = asyncio.get_running_loop()
+    port = int(host_info["port"])
+    mark = time.perf_counter()
+    addresses = await asyncio.wait_for(
+        loop.getaddrinfo(host_info["ip"], port, type=socket.SOCK_STREAM), TIMEOUT
+    )
+    family, socktype, proto, _, address = addresses[0]
+    mark = lap(timings, "dns", mark)
+
+    sock = socket.socket(family, socktype, proto)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, address), TIMEOUT)
+    except BaseException:
+        sock.close()
+        raise
+    lap(timings, "connect", mark)
+    return sock
+
+
+async def _run_command(conn, command, timings=None):
+    """
+    Run command on conn, draining stdout and stderr together with the same
+    byte cap and deadline as ssh_worker.read_channel.  Starting the process
+    counts towards the "exec" phase in timings, draining towards "read".
+
+    Returns:
+        tuple: (stdout, stderr, exit status or None, note)
+    """
+    if DEBUG:
+        print(f"[DEBUG] Executing command: {command}")
+
+    mark = time.perf_counter()
+    proc = await conn.create_process(command, encoding=None)
+    mark = lap(timings, "exec", mark)
+    stdout, stderr = bytearray(), bytearray()
+    truncated = False
+
+    async def drain(stream, buf):
+        nonlocal truncated
+        while True:
+            data = await stream.read(READ_CHUNK)
+            if not data:
+                return
+            keep = data[:max(0, MAX_OUTPUT_BYTES - len(buf))]
+            buf.extend(keep)
+            truncated = truncated or len(keep) < len(data)
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(drain(proc.stdout, stdout), drain(proc.stderr, stderr), proc.wait_closed()),
+            COMMAND_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+        proc.close()
+    lap(timings, "read", mark)
+
+    notes = []
+    if timed_out:
+        notes.append(f"Command timed out after {COMMAND_TIMEOUT}s (partial output)")
+    if truncated:
+        notes.append(f"Output truncated at {MAX_OUTPUT_BYTES} bytes")
+
+    if timed_out:
+        exit_status = None
+    else:
+        exit_status = proc.returncode if proc.returncode is not None else -1
+    return (
+        stdout.decode(errors="replace").strip(),
+        stderr.decode(errors="replace").strip(),
+        exit_status,
+        "; ".join(notes),
+    )
+
+
+async def _run_batch(conn, commands, result):
+    """Run several catalogue commands over one connection, like the thread engine."""
+    timings = result["timings"]
+    if BATCH_COMBINED:
+        script, token = build_batch_command(commands)
+        output, error_output, _, note = await _run_command(conn, script, timings)
+        mark = time.perf_counter()
+        parse_batch_output(output, error_output, token, commands, result, note)
+    else:
+        outputs = {}
+        for key, info in commands.items():
+            outputs[key] = await _run_command(conn, info["command"], timings)
+        mark = time.perf_counter()
+        parse_batch_results(outputs, commands, result)
+    lap(timings, "parse", mark)
+
+
+async def run_fleet_async(hosts, command_info, on_result, concurrency=ASYNC_MAX_CONCURRENCY,
+                          cancel_event=None, resume_event=None, host_keys=None, auth=None, bastions=None,
+                          retries=None):
+    """
+    Run command_info on every host with at most `concurrency` sessions open.
+
+    Args:
+        hosts (iterable): Host dicts, consumed lazily.
+        command_info (dict): Contains 'command' and 'parse' regex.
+        on_result (callable): Called with each result dict as it completes.
+        concurrency (int): Maximum simultaneous SSH sessions.
+        cancel_event (threading.Event): When set, no further hosts are started.
+        resume_event (threading.Event): When cleared, new hosts wait (pause).
+        host_keys (HostKeyStore): Optional, shared by every session.
+        auth (SessionAuth): Optional, shared by every session.
+        bastions (BastionPool): Optional; hosts with a jump_host are reached
+            through bastion connections opened for this run on its settings.
+        retries (RetryQueue): Optional.  Every result is offered to it first;
+            hosts it queues again are run once due instead of being reported.
+            Hosts still queued when the run ends are left in it.
+    """
+    host_iter = iter(hosts)
+    tunnels = AsyncTunnels(bastions) if bastions is not None else None
+    running = 0
+
+    def next_host():
+        host = retries.pop_due() if retries is not None else None
+        return host if host is not None else next(host_iter, None)
+
+    async def worker():
+        # A fixed set of workers pulling from one iterator keeps memory flat:
+        # no task object exists for a host until a slot is free for it.
+        nonlocal running
+        while True:
+            while resume_event is not None and not resume_event.is_set():
+                await asyncio.sleep(0.1)
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            host = next_host()
+            if host is None:
+                # Out of hosts; a host still running may yet be queued for a retry
+                if retries is None or (not running and retries.next_due() is None):
+                    return
+                await asyncio.sleep(min(0.1, retries.next_due() or 0.1))
+                continue
+            running += 1
+            try:
+                result = await run_ssh_task_async(host, command_info, host_keys, auth, tunnels)
+                if retries is None or not retries.offer(host, result):
+                    on_result(result)
+            finally:
+                running -= 1
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        if tunnels is not None:
+            await tunnels.close()
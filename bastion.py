@@ -0,0 +1,337 @@
+# bastion.py
+"""
+Jump host (bastion) connections.
+Hosts with a jump_host are reached through a "direct-tcpip" channel on an
+authenticated connection to that bastion, used as the socket of the host's
+own SSH connection.  One bastion connection carries up to JUMP_CHANNELS
+channels at once, so a run through a bastion costs one bastion login per
+JUMP_CHANNELS hosts in flight rather than one per host, and fewer logins
+count against the bastion's PAM / fail2ban limits.
+
+BastionPool serves the thread engine and lives as long as the session (its
+channels may back pooled connections).  AsyncTunnels serves the asyncio
+engine for one run, as asyncssh connections belong to the run's event loop.
+
+A bastion that cannot be logged in to is not retried for
+JUMP_RETRY_INTERVAL seconds: its hosts fail at once with the same error
+instead of each waiting for the same timeout.
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import paramiko
+
+from config import TIMEOUT, JUMP_CHANNELS, JUMP_RETRY_INTERVAL, DEBUG
+from credentials import default_auth
+from inventory import parse_jump_host
+from ssh_worker import start_transport, lap
+
+
+class JumpHostError(paramiko.SSHException):
+    """A host could not be reached through its jump host."""
+
+
+def jump_info(host_info):
+    """
+    host_info-style dict for host_info's jump host.  The run's username,
+    password and agent setting apply unless the jump_host names a user.
+
+    Raises:
+        JumpHostError: The jump_host cell is not usable.
+    """
+    try:
+        username, host, port = parse_jump_host(host_info["jump_host"])
+    except ValueError as e:
+        raise JumpHostError(str(e)) from None
+    return {
+        "hostname": host_info["jump_host"],
+        "ip": host,
+        "port": port,
+        "username": username or host_info.get("username"),
+        "password": host_info.get("password"),
+        "use_agent": host_info.get("use_agent"),
+    }
+
+
+def _key(bastion):
+    return (bastion["username"], bastion["ip"], bastion["port"])
+
+
+class _Upstream:
+    def __init__(self, transport):
+        self.transport = transport
+        self.channels = []
+        self.pending = 0  # channels being opened
+
+    def load(self):
+        self.channels = [chan for chan in self.channels if not chan.closed]
+        return len(self.channels) + self.pending
+
+
+class BastionPool:
+    """
+    Thread-safe set of authenticated bastion Transports.
+
+    fan_out is the number of channels one bastion connection carries at
+    once; a host arriving when every connection is full gets a new one.
+    New bastion connections are verified with host_keys (HostKeyStore) and
+    logged in with auth (SessionAuth).  stats() counts bastion logins,
+    channels opened and failed logins since the pool was created.
+    """
+
+    def __init__(self, host_keys=None, auth=None, fan_out=JUMP_CHANNELS, retry_interval=JUMP_RETRY_INTERVAL):
+        self.host_keys = host_keys
+        self.auth = auth or default_auth()
+        self.fan_out = max(1, fan_out)
+        self.retry_interval = retry_interval
+        self._upstreams = {}  # (username, ip, port) -> [_Upstream]
+        self._failures = {}  # (username, ip, port) -> (monotonic time, message)
+        self._key_locks = {}
+        self._counts = {"logins": 0, "tunnels": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def tunnel(self, host_info, timings=None):
+        """
+        Open a channel to host_info through its jump host, recording the time
+        taken (bastion login included, when one is needed) as the "connect"
+        phase in timings.  A bastion connection found dropped is replaced once.
+
+        Returns:
+            paramiko.Channel: Usable as the sock of the host's Transport;
+            closing that Transport closes the channel and frees its slot.
+
+        Raises:
+            JumpHostError: The bastion is unavailable or cannot reach the host.
+        """
+        bastion = jump_info(host_info)
+        key = _key(bastion)
+        target = (host_info["ip"], int(host_info["port"]))
+        mark = time.perf_counter()
+        for attempt in range(2):
+            upstream = self._reserve(key, bastion)
+            try:
+                chan = upstream.transport.open_channel("direct-tcpip", target, ("127.0.0.1", 0), timeout=TIMEOUT)
+            except paramiko.ChannelException as e:
+                # The bastion is fine; it refused or could not reach this host
+                self._unreserve(upstream)
+                raise JumpHostError(f"jump host {bastion['hostname']} cannot reach {target[0]}:{target[1]}: "
+                                    f"{e.text}") from None
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                self._unreserve(upstream)
+                if upstream.transport.is_active() or attempt:
+                    raise JumpHostError(f"jump host {bastion['hostname']}: {e or type(e).__name__}") from None
+                if DEBUG:
+                    print(f"[DEBUG] Connection to jump host {bastion['hostname']} went stale, reconnecting")
+                self._drop(key, upstream)
+                continue
+            with self._lock:
+                upstream.pending -= 1
+                upstream.channels.append(chan)
+                self._counts["tunnels"] += 1
+            lap(timings, "connect", mark)
+            return chan
+
+    def tally(self, *outcomes):
+        """Count outcomes ("logins", "tunnels", "failed") of AsyncTunnels."""
+        with self._lock:
+            for outcome in outcomes:
+                self._counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, fan_out=self.fan_out)
+
+    def close_all(self):
+        with self._lock:
+            upstreams = [upstream for group in self._upstreams.values() for upstream in group]
+            self._upstreams.clear()
+        for upstream in upstreams:
+            self._close(upstream)
+
+    def _recent_failure(self, key):
+        """The last login failure of bastion key, or None once retry_interval has passed."""
+        with self._lock:
+            failed = self._failures.get(key)
+        if failed and time.monotonic() - failed[0] < self.retry_interval:
+            return failed[1]
+        return None
+
+    def _fail(self, key, message):
+        with self._lock:
+            self._failures[key] = (time.monotonic(), message)
+            self._counts["failed"] += 1
+
+    def _reserve(self, key, bastion):
+        """A bastion connection with a free channel slot, held as pending; logs in when there is none."""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # One login per bastion at a time; hosts arriving meanwhile use it once it is up
+        with key_lock:
+            failed = self._recent_failure(key)
+            if failed:
+                raise JumpHostError(failed)
+            doomed = []
+            with self._lock:
+                group = self._upstreams.setdefault(key, [])
+                for upstream in list(group):
+                    if not upstream.transport.is_active():
+                        group.remove(upstream)
+                        doomed.append(upstream)
+                idle = [upstream for upstream in group if not upstream.load()]
+                for upstream in idle[1:]:
+                    # Keep one idle connection per bastion for the next run
+                    group.remove(upstream)
+                    doomed.append(upstream)
+                found = next((upstream for upstream in group if upstream.load() < self.fan_out), None)
+                if found is not None:
+                    found.pending += 1
+            for upstream in doomed:
+                self._close(upstream)
+            if found is not None:
+                return found
+
+            try:
+                transport = self._connect(bastion)
+            except Exception as e:
+                message = f"jump host {bastion['hostname']}: {e or type(e).__name__}"
+                self._fail(key, message)
+                raise JumpHostError(message) from None
+            upstream = _Upstream(transport)
+            upstream.pending = 1
+            with self._lock:
+                self._failures.pop(key, None)
+                self._upstreams.setdefault(key, []).append(upstream)
+                self._counts["logins"] += 1
+            return upstream
+
+    def _unreserve(self, upstream):
+        with self._lock:
+            upstream.pending -= 1
+
+    def _drop(self, key, upstream):
+        with self._lock:
+            group = self._upstreams.get(key, [])
+            if upstream in group:
+                group.remove(upstream)
+        self._close(upstream)
+
+    def _connect(self, bastion):
+        if DEBUG:
+            print(f"[DEBUG] Connecting to jump host {bastion['ip']}:{bastion['port']} as {bastion['username']}")
+
+        transport = start_transport(bastion, None, self.host_keys)
+        try:
+            self.auth.authenticate(transport, bastion)
+        except Exception:
+            transport.close()
+            raise
+        return transport
+
+    def _close(self, upstream):
+        try:
+            upstream.transport.close()
+        except Exception:
+            if DEBUG:
+                print("[DEBUG] Failed to close jump host transport")
+
+
+class AsyncTunnels:
+    """
+    Bastion connections for one asyncio run, made with asyncssh on the
+    running loop.  Shares the host key store, credentials, fan-out, retry
+    interval and counters of the BastionPool it is created from.  close()
+    must be awaited before the loop ends.
+    """
+
+    def __init__(self, bastions):
+        self.bastions = bastions
+        self._upstreams = {}  # (username, ip, port) -> [[connection, channels in use]]
+        self._failures = {}
+        self._locks = {}
+
+    @asynccontextmanager
+    async def tunnel(self, host_info, timings=None):
+        """
+        Yield the bastion connection to pass as asyncssh.connect(tunnel=...)
+        for host_info, holding one of its channel slots until exit.  Time
+        spent getting it (a bastion login, when needed) is the "connect" phase.
+
+        Raises:
+            JumpHostError: The bastion is unavailable.
+        """
+        bastion = jump_info(host_info)
+        mark = time.perf_counter()
+        upstream = await self._reserve(_key(bastion), bastion)
+        lap(timings, "connect", mark)
+        self.bastions.tally("tunnels")
+        try:
+            yield upstream[0]
+        finally:
+            upstream[1] -= 1
+
+    async def close(self):
+        connections = [upstream[0] for group in self._upstreams.values() for upstream in group]
+        self._upstreams.clear()
+        for conn in connections:
+            conn.close()
+        for conn in connections:
+            await conn.wait_closed()
+
+    async def _reserve(self, key, bastion):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            failed = self._failures.get(key)
+            if failed and time.monotonic() - failed[0] < self.bastions.retry_interval:
+                raise JumpHostError(failed[1])
+            group = self._upstreams[key] = [
+                upstream for upstream in self._upstreams.get(key, []) if not upstream[0].is_closed()
+            ]
+            for upstream in group:
+                if upstream[1] < self.bastions.fan_out:
+                    upstream[1] += 1
+                    return upstream
+
+            try:
+                conn = await self._connect(bastion)
+            except Exception as e:
+                message = f"jump host {bastion['hostname']}: {e or type(e).__name__}"
+                self._failures[key] = (time.monotonic(), message)
+                self.bastions.tally("failed")
+                raise JumpHostError(message) from None
+            self._failures.pop(key, None)
+            self.bastions.tally("logins")
+            upstream = [conn, 1]
+            group.append(upstream)
+            return upstream
+
+    async def _connect(self, bastion):
+        import asyncssh
+        from async_worker import _known_hosts, _check_server_key
+
+        if DEBUG:
+            print(f"[DEBUG] Connecting to jump host {bastion['ip']}:{bastion['port']} as {bastion['username']}")
+
+        host_keys = self.bastions.host_keys
+        auth = self.bastions.auth
+        known_hosts = _known_hosts(bastion, host_keys)
+        credentials = auth.asyncssh_options(bastion)
+        async with auth.throttle.async_slot():
+            conn = await asyncssh.connect(
+                bastion["ip"],
+                port=int(bastion["port"]),
+                username=bastion["username"],
+                known_hosts=known_hosts,
+                connect_timeout=TIMEOUT,
+                login_timeout=TIMEOUT,
+                **credentials,
+            )
+        try:
+            _check_server_key(conn, bastion, host_keys, known_hosts)
+        except Exception:
+            conn.close()
+            raise
+        return conn
@@ -0,0 +1,114 @@
+# bench/bench_engines.py
+"""
+Compare the thread and asyncio engines against local mock SSH servers.
+Each engine runs in its own subprocess so peak RSS is measured in isolation.
+
+    python bench/bench_engines.py --hosts 300 --threads 5 --async-concurrency 300
+
+The mock server profile options (--latency, --output-bytes, ...) are passed
+through; see mock_ssh_server.py.  bench_sweep.py compares concurrency levels.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_ssh_server import add_profile_arguments, profile_argv
+
+COMMAND_INFO = {"command": "uname -a", "parse": r"(\d+\.\d+\.\S+)"}
+
+
+def peak_rss_kb():
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss // 1024 if sys.platform == "darwin" else rss
+    except ImportError:  # Windows
+        return 0
+
+
+def run_engine(engine, host_count, base_port, workers):
+    """Run one engine in this process and print a JSON line with its numbers."""
+    import config
+    config.DEBUG = False  # must precede the worker imports, which copy it
+
+    import queue
+    from dispatcher import FleetDispatcher
+
+    hosts = [
+        {"hostname": f"mock{i}", "ip": "127.0.0.1", "port": str(base_port + i),
+         "username": "bench", "password": "bench"}
+        for i in range(host_count)
+    ]
+    baseline_kb = peak_rss_kb()
+    start = time.perf_counter()
+    dispatcher = FleetDispatcher(hosts, COMMAND_INFO, queue.Queue(), max_workers=workers, engine=engine,
+                                 adaptive=False)
+    dispatcher.start()
+    dispatcher.wait()
+    wall = time.perf_counter() - start
+    p = dispatcher.progress()
+    peak_kb = peak_rss_kb()
+    print(json.dumps({
+        "engine": engine,
+        "workers": workers,
+        "hosts": host_count,
+        "errors": p["errors"],
+        "wall_s": round(wall, 3),
+        "hosts_per_s": round(host_count / wall, 1),
+        "peak_rss_kb": peak_kb,
+        "kb_per_host": round((peak_kb - baseline_kb) / host_count, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread vs asyncio SSH engines")
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--base-port", type=int, default=22000)
+    parser.add_argument("--threads", type=int, default=5)
+    parser.add_argument("--async-concurrency", type=int, default=200)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--workers", type=int, help=argparse.SUPPRESS)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args.engine, args.hosts, args.base_port, args.workers)
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "mock_ssh_server.py"),
+         "--count", str(args.hosts), "--base-port", str(args.base_port)] + profile_argv(args),
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        if server.stdout.readline().strip() != "READY":
+            sys.exit("mock server failed to start")
+
+        for engine, workers in (("thread", args.threads), ("async", args.async_concurrency)):
+            out = subprocess.run(
+                [sys.executable, __file__, "--engine", engine, "--workers", str(workers),
+                 "--hosts", str(args.hosts), "--base-port", str(args.base_port)],
+                capture_output=True, text=True, cwd=ROOT,
+            )
+            lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+            if not lines:
+                print(f"{engine}: failed\n{out.stderr}")
+                continue
+            r = json.loads(lines[-1])
+            print(f"{r['engine']:>6}  workers={r['workers']:<5} hosts={r['hosts']:<6} errors={r['errors']:<4} "
+                  f"wall={r['wall_s']:>7}s  {r['hosts_per_s']:>7} hosts/s  "
+                  f"peak_rss={r['peak_rss_kb']} KB  ({r['kb_per_host']} KB/host)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# bench/bench_startup.py
+"""
+Startup benchmark: how long the GUI takes to appear and how much memory it
+holds by then.  Every measurement runs in a fresh interpreter, so module
+caches from one do not flatter the next; each is repeated and the median
+reported.
+
+Rows:
+    python      an empty interpreter, the floor everything else sits on
+    import X    importing one module cold (main, and the heavy dependencies
+                it should not load up front: paramiko, openpyxl, asyncssh,
+                ttkbootstrap)
+    window      process start -> first window mapped (time-to-first-window),
+                then -> command list filled, with peak RSS at each point.
+                Needs a display; skipped without one.
+
+    python bench/bench_startup.py
+    python bench/bench_startup.py --repeat 10 --json startup.json
+    python bench/bench_startup.py --budget 1.5    # exit 1 if the window takes longer (CI)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODULES = ("main", "paramiko", "openpyxl", "asyncssh", "ttkbootstrap")
+HEAVY = ("paramiko", "openpyxl", "asyncssh", "ttkbootstrap", "PIL")
+
+
+def peak_rss_kb():
+    # Not bench_engines.peak_rss_kb: importing that module loads paramiko, which would skew every number here
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss // 1024 if sys.platform == "darwin" else rss
+    except ImportError:  # Windows
+        return 0
+
+
+def child_import(module):
+    """Import module and print a JSON line with the time taken and the heavy modules it pulled in."""
+    start = time.perf_counter()
+    __import__(module)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "import_s": round(elapsed, 4),
+        "peak_rss_kb": peak_rss_kb(),
+        "loaded": [name for name in HEAVY if name in sys.modules and name != module],
+    }))
+
+
+def child_window(spawned):
+    """Start the GUI as main.py does and print a JSON line once the window is up and the commands are listed."""
+    import tkinter as tk
+    import main
+
+    root = tk.Tk()
+    try:
+        from ttkbootstrap import Style
+        Style("darkly")
+        themed = True
+    except ImportError:
+        themed = False  # plain ttk; the numbers then exclude the theme
+    app = main.HostLoggerApp(root)
+
+    window_s = window_kb = None
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        root.update()
+        if window_s is None and root.winfo_ismapped():
+            window_s = time.time() - spawned
+            window_kb = peak_rss_kb()
+        if window_s is not None and app.catalogue is not None:
+            break
+        time.sleep(0.001)
+    commands_s = time.time() - spawned if app.catalogue is not None else None
+    print(json.dumps({
+        "window_s": round(window_s, 4) if window_s is not None else None,
+        "commands_s": round(commands_s, 4) if commands_s is not None else None,
+        "window_rss_kb": window_kb,
+        "peak_rss_kb": peak_rss_kb(),
+        "commands": len(app.commands),
+        "themed": themed,
+        "loaded": [name for name in HEAVY if name in sys.modules],
+    }))
+    app.on_close()
+
+
+def measure(argv, repeat):
+    """Run a child command line repeat times; (list of its JSON results, wall seconds of each, error text)."""
+    results, walls = [], []
+    for _ in range(repeat):
+        start = time.time()
+        out = subprocess.run(argv + ["--spawned", repr(start)], capture_output=True, text=True, cwd=ROOT)
+        walls.append(time.time() - start)
+        lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+        if out.returncode or not lines:
+            return results, walls, (out.stderr.strip().splitlines() or ["failed"])[-1]
+        results.append(json.loads(lines[-1]))
+    return results, walls, None
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 4) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sshloop start-up time and memory")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the median is reported")
+    parser.add_argument("--json", metavar="FILE", help="also write all results as JSON")
+    parser.add_argument("--budget", type=float, metavar="S",
+                        help="exit 1 when the median time-to-first-window exceeds S seconds")
+    parser.add_argument("--child", choices=("import", "window"), help=argparse.SUPPRESS)
+    parser.add_argument("--module", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "import":
+        child_import(args.module)
+        return
+    if args.child == "window":
+        child_window(args.spawned)
+        return
+
+    rows = []
+    print(f"{'measurement':<20} {'median s':>9} {'peak RSS KB':>11}  notes")
+
+    _, walls, error = measure([sys.executable, "-c", "pass"], args.repeat)
+    rows.append({"name": "python", "seconds": median(walls)})
+    print(f"{'python':<20} {median(walls):>9}")
+
+    for module in MODULES:
+        results, _, error = measure([sys.executable, __file__, "--child", "import", "--module", module], args.repeat)
+        name = f"import {module}"
+        if error:
+            print(f"{name:<20} {'-':>9} {'-':>11}  {error}")
+            continue
+        row = {"name": name, "seconds": median(r["import_s"] for r in results),
+               "peak_rss_kb": median(r["peak_rss_kb"] for r in results), "loaded": results[-1]["loaded"]}
+        rows.append(row)
+        notes = f"also loads {', '.join(row['loaded'])}" if row["loaded"] else ""
+        print(f"{name:<20} {row['seconds']:>9} {row['peak_rss_kb']:>11}  {notes}")
+
+    window = None
+    results, _, error = measure([sys.executable, __file__, "--child", "window"], args.repeat)
+    if error:
+        print(f"{'window':<20} {'-':>9} {'-':>11}  skipped: {error}")
+    else:
+        window = {"name": "window", "seconds": median(r["window_s"] for r in results),
+                  "peak_rss_kb": median(r["window_rss_kb"] for r in results),
+                  "commands_s": median(r["commands_s"] for r in results),
+                  "commands_rss_kb": median(r["peak_rss_kb"] for r in results),
+                  "commands": results[-1]["commands"], "themed": results[-1]["themed"],
+                  "loaded": results[-1]["loaded"]}
+        rows.append(window)
+        theme = "" if window["themed"] else ", no ttkbootstrap theme"
+        print(f"{'first window':<20} {window['seconds']:>9} {window['peak_rss_kb']:>11}  from process start{theme}")
+        print(f"{'commands listed':<20} {window['commands_s']:>9} {window['commands_rss_kb']:>11}  "
+              f"{window['commands']} commands, loaded by then: {', '.join(window['loaded']) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "results": rows}, f, indent=2)
+
+    if args.budget is not None:
+        if window is None or window["seconds"] is None:
+            sys.exit("no window measurement to check against --budget")
+        if window["seconds"] > args.budget:
+            print(f"Time to first window {window['seconds']}s exceeds the {args.budget}s budget", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
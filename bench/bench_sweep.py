@@ -0,0 +1,221 @@
+# bench/bench_sweep.py
+"""
+Throughput benchmark of the hot path against a local mock SSH fleet.
+Starts the mock servers (with the given latency / output size / auth delay /
+failure profile), writes a matching hosts CSV, then for every mode and
+concurrency level runs a sweep in its own subprocess and reports wall time,
+hosts/s, latency percentiles, peak RSS and peak thread count.
+
+Modes:
+    task      run_ssh_task on a plain ThreadPoolExecutor, one connection per host
+    run       the GUI's start_execution path: FleetDispatcher + connection pool +
+              streaming results file, queue drained in UI_BATCH_SIZE batches,
+              fixed at the given concurrency
+    adaptive  as run, with adaptive concurrency starting at the given level
+    async     as run, with the asyncio engine
+
+    python bench/bench_sweep.py --hosts 300 --concurrency 5,20,50 --modes task,run
+    python bench/bench_sweep.py --hosts 500 --concurrency 50 --latency 0.2 --jitter 0.2 \\
+        --output-bytes 65536 --auth-fail-rate 0.02 --json bench.json
+    python bench/bench_sweep.py --hosts 300 --concurrency 50 --modes run,async --via-bastion
+"""
+
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_engines import peak_rss_kb
+from mock_ssh_server import add_profile_arguments, profile_argv
+
+MODES = ("task", "run", "adaptive", "async")
+COMMAND = "uname -a"
+PARSE = r"(\d+\.\d+\.\S+)"
+
+
+class PeakThreads:
+    """Sample threading.active_count() in the background and keep the maximum."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+
+def _sweep_task(hosts, command_info, workers):
+    """run_ssh_task straight on a thread pool: no dispatcher, pool or writer."""
+    from concurrent.futures import ThreadPoolExecutor
+    from bastion import BastionPool
+    from ssh_worker import run_ssh_task
+
+    results_queue = queue.Queue()
+    bastions = BastionPool()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                lambda host: run_ssh_task(host, command_info, results_queue, bastions=bastions), hosts
+            ))
+    finally:
+        bastions.close_all()
+
+
+def _sweep_run(hosts, command_info, workers, engine, adaptive=False):
+    """What start_execution + poll_queue do, minus Tk."""
+    from config import POOL_ENABLED, RESULTS_FORMAT, UI_BATCH_SIZE
+    from dispatcher import FleetDispatcher
+    from file_handler import open_result_writer
+    from ssh_pool import SSHConnectionPool
+
+    pool = SSHConnectionPool() if POOL_ENABLED and engine == "thread" else None
+    results_queue = queue.Queue()
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = open_result_writer(os.path.join(tmp, f"results.{RESULTS_FORMAT}"))
+        dispatcher = FleetDispatcher(hosts, command_info, results_queue, max_workers=workers,
+                                     engine=engine, pool=pool, writer=writer, adaptive=adaptive)
+        dispatcher.start()
+        results = []
+        while not dispatcher.done or not results_queue.empty():
+            try:
+                for _ in range(UI_BATCH_SIZE):
+                    result = results_queue.get_nowait()
+                    hosts[result["row_id"]].update(result)
+                    results.append(result)
+            except queue.Empty:
+                time.sleep(0.01)
+        writer.close(dispatcher.telemetry.summary())
+        if pool:
+            pool.close_all()
+    return results
+
+
+def run_child(mode, workers, hosts_csv):
+    """Run one sweep in this process and print a JSON line with its numbers."""
+    import config
+    config.DEBUG = False  # must precede the worker imports, which copy it
+
+    from file_handler import load_csv
+    from parsing import compile_parse
+    from telemetry import percentile
+
+    hosts = load_csv(hosts_csv)
+    for host in hosts:
+        host.update({"username": "bench", "password": "bench"})
+    command_info = {"command": COMMAND, "parse": PARSE, "regex": compile_parse(PARSE)}
+
+    baseline_kb = peak_rss_kb()
+    start = time.perf_counter()
+    with PeakThreads() as threads:
+        if mode == "task":
+            results = _sweep_task(hosts, command_info, workers)
+        else:
+            results = _sweep_run(hosts, command_info, workers, "async" if mode == "async" else "thread",
+                                 adaptive=mode == "adaptive")
+    wall = time.perf_counter() - start
+    peak_kb = peak_rss_kb()
+
+    totals = sorted(r.get("duration", 0.0) for r in results)
+    print(json.dumps({
+        "mode": mode,
+        "workers": workers,
+        "hosts": len(hosts),
+        "errors": sum(1 for r in results if r.get("error")),
+        "wall_s": round(wall, 3),
+        "hosts_per_s": round(len(hosts) / wall, 1),
+        "p50_s": percentile(totals, 50),
+        "p95_s": percentile(totals, 95),
+        "peak_rss_kb": peak_kb,
+        "rss_growth_kb": peak_kb - baseline_kb,
+        "peak_threads": threads.peak,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sshloop sweeps against local mock SSH servers")
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--base-port", type=int, default=22000)
+    parser.add_argument("--concurrency", default="5,20,50", help="comma separated worker counts")
+    parser.add_argument("--modes", default="task,run", help=f"comma separated, from {', '.join(MODES)}")
+    parser.add_argument("--json", metavar="FILE", help="also write all results as a JSON list")
+    parser.add_argument("--via-bastion", action="store_true",
+                        help="reach every host through one extra mock server as their jump host")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--workers", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--hosts-csv", help=argparse.SUPPRESS)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workers, args.hosts_csv)
+        return
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+    levels = [int(n) for n in args.concurrency.split(",") if n.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hosts_csv = os.path.join(tmp, "hosts.csv")
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "bench", "mock_ssh_server.py"),
+             "--count", str(args.hosts + args.via_bastion), "--base-port", str(args.base_port),
+             "--hosts-csv", hosts_csv]
+            + (["--via-first"] if args.via_bastion else [])
+            + profile_argv(args),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        rows = []
+        try:
+            if server.stdout.readline().strip() != "READY":
+                sys.exit("mock server failed to start")
+
+            print(f"{'mode':>8} {'workers':>7} {'hosts':>6} {'errors':>6} {'wall s':>8} {'hosts/s':>8} "
+                  f"{'p50 s':>7} {'p95 s':>7} {'peak RSS KB':>11} {'threads':>7}")
+            for mode in modes:
+                for workers in levels:
+                    out = subprocess.run(
+                        [sys.executable, __file__, "--child", mode, "--workers", str(workers),
+                         "--hosts-csv", hosts_csv],
+                        capture_output=True, text=True, cwd=ROOT,
+                    )
+                    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+                    if not lines:
+                        print(f"{mode:>8} {workers:>7}  failed\n{out.stderr}")
+                        continue
+                    r = json.loads(lines[-1])
+                    rows.append(r)
+                    print(f"{r['mode']:>8} {r['workers']:>7} {r['hosts']:>6} {r['errors']:>6} {r['wall_s']:>8} "
+                          f"{r['hosts_per_s']:>8} {r['p50_s']:>7} {r['p95_s']:>7} {r['peak_rss_kb']:>11} "
+                          f"{r['peak_threads']:>7}", flush=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"profile": profile_argv(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
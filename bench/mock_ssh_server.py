@@ -0,0 +1,390 @@
+# bench/mock_ssh_server.py
+"""
+Local stand-in SSH servers for benchmarking.
+Starts N paramiko ServerInterface listeners on consecutive localhost ports.
+Any username/password is accepted and every exec request gets a fixed reply,
+shaped by a MockProfile: command latency, output size, auth delay and
+failure rates.  "direct-tcpip" channels are forwarded as sshd does, so any
+server can stand in for a jump host in front of the others.
+
+With an SFTP root each server also speaks SFTP over its own directory,
+<root>/<port>/, and answers "sha256sum -- <path>" from the file there, so
+file transfers (transfer.py) can be tried against the mock fleet.
+
+Run standalone (prints READY once listening, serves until killed):
+    python bench/mock_ssh_server.py --count 200 --base-port 22000
+    python bench/mock_ssh_server.py --count 200 --latency 0.2 --jitter 0.1 \\
+        --output-bytes 65536 --auth-delay 0.05 --auth-fail-rate 0.01 --drop-rate 0.01
+    python bench/mock_ssh_server.py --count 201 --hosts-csv hosts.csv --via-first
+    python bench/mock_ssh_server.py --count 50 --hosts-csv hosts.csv --sftp-root /tmp/mock_sftp
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import random
+import select
+import shlex
+import socket
+import sys
+import threading
+import time
+
+import paramiko
+
+REPLY = "Linux mockhost 5.14.0-362.el9.x86_64 #1 SMP x86_64 GNU/Linux\n"
+
+
+class MockProfile:
+    """
+    How the mock servers behave.  Rates are probabilities per connection
+    (drop, auth failure) or per command (error).
+
+        latency         seconds before a command replies (+ up to jitter)
+        output_bytes    reply size; REPLY is repeated to reach it (0 = one REPLY)
+        auth_delay      seconds spent checking a password
+        auth_fail_rate  share of logins rejected
+        drop_rate       share of TCP connections closed before the SSH banner
+        error_rate      share of commands exiting 1 with a stderr message
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, output_bytes=0, auth_delay=0.0,
+                 auth_fail_rate=0.0, drop_rate=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.output_bytes = output_bytes
+        self.auth_delay = auth_delay
+        self.auth_fail_rate = auth_fail_rate
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        repeats = max(1, -(-output_bytes // len(REPLY)))
+        self.reply = (REPLY * repeats)[:output_bytes or len(REPLY)].encode()
+
+    def roll(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+    def command_delay(self):
+        return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+DEFAULT_PROFILE = MockProfile()
+
+
+class MockSFTP(paramiko.SFTPServerInterface):
+    """SFTP over one directory, which stands for the host's whole file system."""
+
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def canonicalize(self, path):
+        return os.path.normpath("/" + path)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def list_folder(self, path):
+        try:
+            local = self._local(path)
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)), name)
+                    for name in os.listdir(local)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        local = self._local(path)
+        try:
+            fd = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o644)
+            if flags & os.O_WRONLY:
+                mode = "ab" if flags & os.O_APPEND else "wb"
+            else:
+                mode = "r+b" if flags & os.O_RDWR else "rb"
+            handle = paramiko.SFTPHandle(flags)
+            f = os.fdopen(fd, mode)
+            if mode == "rb":
+                handle.readfile = f
+            else:
+                handle.writefile = f
+                if mode == "r+b":
+                    handle.readfile = f
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if os.path.exists(self._local(newpath)):
+            return paramiko.SFTP_FAILURE  # as SFTP v3 servers do
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            if attr.st_mode is not None:
+                os.chmod(self._local(path), attr.st_mode & 0o7777)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class MockServer(paramiko.ServerInterface):
+    """Accept any password (subject to the profile) and answer every exec with the profile's reply."""
+
+    def __init__(self, profile=DEFAULT_PROFILE, sftp_root=None):
+        self.profile = profile
+        self.sftp_root = sftp_root  # this server's directory when it speaks SFTP
+        self.subsystems = set()  # chanids running a subsystem (SFTP)
+        self.commands = {}  # chanid -> command bytes
+        self.forwards = {}  # chanid -> socket connected to the direct-tcpip destination
+        self.exec_ready = threading.Condition()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        try:
+            self.forwards[chanid] = socket.create_connection(destination, timeout=10)
+        except OSError:
+            return paramiko.OPEN_FAILED_CONNECT_FAILED
+        return paramiko.OPEN_SUCCEEDED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if self.profile.auth_delay:
+            time.sleep(self.profile.auth_delay)
+        if self.profile.roll(self.profile.auth_fail_rate):
+            return paramiko.AUTH_FAILED
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_exec_request(self, channel, command):
+        with self.exec_ready:
+            self.commands[channel.get_id()] = command
+            self.exec_ready.notify_all()
+        return True
+
+    def check_channel_subsystem_request(self, channel, name):
+        if not super().check_channel_subsystem_request(channel, name):
+            return False
+        with self.exec_ready:
+            self.subsystems.add(channel.get_id())
+            self.exec_ready.notify_all()
+        return True
+
+    def reply(self, command):
+        """(stdout, exit status) for command: a file's hash when asked and possible, else the profile's reply."""
+        words = shlex.split(command.decode(errors="replace"))
+        if self.sftp_root and words[:2] == ["sha256sum", "--"] and len(words) > 2:
+            path = os.path.join(self.sftp_root, os.path.normpath("/" + words[2]).lstrip("/"))
+            try:
+                with open(path, "rb") as f:
+                    return f"{hashlib.sha256(f.read()).hexdigest()}  {words[2]}\n".encode(), 0
+            except OSError:
+                return b"", 1
+        return self.profile.reply, 0
+
+
+def _serve_channel(server, chan):
+    profile = server.profile
+    with server.exec_ready:
+        server.exec_ready.wait_for(
+            lambda: chan.get_id() in server.commands or chan.get_id() in server.subsystems or chan.closed, timeout=30
+        )
+        if chan.get_id() in server.subsystems:
+            return  # paramiko's subsystem thread owns the channel
+    try:
+        delay = profile.command_delay()
+        if delay:
+            time.sleep(delay)
+        if profile.roll(profile.error_rate):
+            chan.sendall_stderr(b"mock: command failed\n")
+            chan.send_exit_status(1)
+        else:
+            output, status = server.reply(server.commands.get(chan.get_id(), b""))
+            chan.sendall(output)
+            chan.send_exit_status(status)
+    except (EOFError, OSError):
+        pass  # client went away (e.g. its command timeout fired)
+    finally:
+        chan.close()
+
+
+def _forward(chan, upstream):
+    """Pump bytes between a direct-tcpip channel and its destination until either side closes."""
+    upstream.settimeout(None)
+    try:
+        while not chan.closed:
+            readable, _, _ = select.select([chan, upstream], [], [], 1)
+            if chan in readable:
+                data = chan.recv(32768)
+                if not data:
+                    break
+                upstream.sendall(data)
+            if upstream in readable:
+                data = upstream.recv(32768)
+                if not data:
+                    break
+                chan.sendall(data)
+    except (EOFError, OSError):
+        pass
+    finally:
+        upstream.close()
+        chan.close()
+
+
+def _serve_connection(conn, host_key, profile, sftp_root=None):
+    if profile.roll(profile.drop_rate):
+        conn.close()
+        return
+    transport = paramiko.Transport(conn)
+    transport.add_server_key(host_key)
+    if sftp_root:
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, MockSFTP, sftp_root)
+    server = MockServer(profile, sftp_root)
+    try:
+        transport.start_server(server=server)
+    except (paramiko.SSHException, EOFError, OSError):
+        return
+    # A client may open several channels on one transport (pooled sessions)
+    while transport.is_active():
+        chan = transport.accept(timeout=1)
+        if chan is None:
+            continue
+        upstream = server.forwards.pop(chan.get_id(), None)
+        if upstream is not None:
+            threading.Thread(target=_forward, args=(chan, upstream), daemon=True).start()
+        else:
+            threading.Thread(target=_serve_channel, args=(server, chan), daemon=True).start()
+
+
+def _accept_loop(sock, host_key, profile, sftp_root=None):
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except OSError:
+            return
+        threading.Thread(target=_serve_connection, args=(conn, host_key, profile, sftp_root), daemon=True).start()
+
+
+def start_servers(count, base_port, host="127.0.0.1", profile=DEFAULT_PROFILE, sftp_root=None):
+    """
+    Start `count` listeners on consecutive ports, all behaving per profile.
+    With sftp_root, each also serves SFTP over sftp_root/<port>/ (created).
+
+    Returns:
+        list: (host, port) tuples that are accepting connections.
+    """
+    host_key = paramiko.RSAKey.generate(2048)
+    endpoints = []
+    for port in range(base_port, base_port + count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(128)
+        root = None
+        if sftp_root:
+            root = os.path.join(sftp_root, str(port))
+            os.makedirs(root, exist_ok=True)
+        threading.Thread(target=_accept_loop, args=(sock, host_key, profile, root), daemon=True).start()
+        endpoints.append((host, port))
+    return endpoints
+
+
+def add_profile_arguments(parser):
+    """Add the MockProfile options to an argparse parser."""
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each command replies")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--output-bytes", type=int, default=0, help="reply size in bytes (default: one line)")
+    parser.add_argument("--auth-delay", type=float, default=0.0, help="seconds spent on each password check")
+    parser.add_argument("--auth-fail-rate", type=float, default=0.0, help="share of logins rejected (0-1)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of connections dropped before the banner")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of commands exiting 1")
+    parser.add_argument("--seed", type=int, help="random seed for repeatable failure patterns")
+
+
+def profile_from_args(args):
+    return MockProfile(
+        latency=args.latency, jitter=args.jitter, output_bytes=args.output_bytes,
+        auth_delay=args.auth_delay, auth_fail_rate=args.auth_fail_rate,
+        drop_rate=args.drop_rate, error_rate=args.error_rate, seed=args.seed,
+    )
+
+
+def profile_argv(args):
+    """The MockProfile options of args as a command line, to pass on to a server subprocess."""
+    argv = []
+    for name in ("latency", "jitter", "output_bytes", "auth_delay", "auth_fail_rate", "drop_rate", "error_rate", "seed"):
+        value = getattr(args, name)
+        if value:
+            argv += ["--" + name.replace("_", "-"), str(value)]
+    return argv
+
+
+def write_hosts_csv(endpoints, path, jump_host=None):
+    """Write a hosts CSV in the format load_csv expects, every host behind jump_host if given."""
+    with open(path, "w", newline="") as f:
+        if jump_host:
+            f.write("hostname,ip,port,jump_host\n")
+        else:
+            f.write("hostname,ip,port\n")
+        for i, (host, port) in enumerate(endpoints):
+            f.write(f"mock{i},{host},{port},{jump_host}\n" if jump_host else f"mock{i},{host},{port}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local mock SSH servers")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--base-port", type=int, default=22000)
+    parser.add_argument("--hosts-csv", help="also write a matching hosts CSV here")
+    parser.add_argument("--via-first", action="store_true",
+                        help="list the other servers in the CSV behind the first one as their jump host")
+    parser.add_argument("--sftp-root", help="serve SFTP, each server over its own <port> directory under this one")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    # Dropped connections and banner-only probes are expected; keep paramiko's tracebacks quiet
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    endpoints = start_servers(args.count, args.base_port, profile=profile_from_args(args), sftp_root=args.sftp_root)
+    if args.hosts_csv:
+        if args.via_first:
+            bastion, endpoints = endpoints[0], endpoints[1:]
+            write_hosts_csv(endpoints, args.hosts_csv, jump_host=f"{bastion[0]}:{bastion[1]}")
+        else:
+            write_hosts_csv(endpoints, args.hosts_csv)
+    print("READY", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        sys.exit(0)
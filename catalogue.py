@@ -0,0 +1,179 @@
+# catalogue.py
+"""
+Command catalogue.
+Parses the JSON command files in COMMANDS_DIR and keeps them cached by file
+(mtime + size): refresh() re-stats the directory and re-parses only files
+that were added or changed, and drops entries of deleted files, so the GUI
+can watch the directory and pick up new commands without a restart.
+
+A file may hold any number of commands (and bundles); all of them get the
+category of the file's name prefix ("posix_disk.json" -> "POSIX").
+
+search() runs against a prebuilt index of lowercased keys and command
+strings, and narrows the previous result while the query is being extended,
+so filtering the command list costs nothing per keystroke.
+"""
+
+import json
+import os
+from collections import defaultdict
+
+from config import COMMANDS_DIR, DEBUG
+from parsing import compile_parse
+
+REQUIRED_KEYS = {"command", "parse", "description"}
+BUNDLE_KEYS = {"bundle", "description"}
+
+
+def validate_entry(filename, label, details):
+    """
+    Check one catalogue entry and compile its "parse" into "regex".
+
+    Returns:
+        bool: True if the entry is usable; otherwise the reason is printed.
+    """
+    if isinstance(details, dict) and BUNDLE_KEYS.issubset(details.keys()):
+        if not isinstance(details["bundle"], list) or not details["bundle"]:
+            print(f"Skipping invalid bundle '{label}' in {filename}: 'bundle' must be a non-empty list")
+            return False
+        return True
+    if not isinstance(details, dict) or not REQUIRED_KEYS.issubset(details.keys()):
+        print(f"Skipping invalid command entry '{label}' in {filename}: missing one of {sorted(REQUIRED_KEYS)}")
+        return False
+    # Compile once here so a bad pattern is caught before any host is contacted
+    try:
+        details["regex"] = compile_parse(details["parse"])
+    except ValueError as e:
+        print(f"Skipping command '{label}' with bad parse pattern in {filename}: {e}")
+        return False
+    ttl = details.get("cache_ttl", 0)
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl < 0:
+        print(f"Skipping command '{label}' with invalid cache_ttl in {filename}: must be seconds >= 0")
+        return False
+    return True
+
+
+def parse_command_file(filepath):
+    """
+    Read one JSON command file.
+
+    Returns:
+        dict: {label: command_details} of the valid entries (empty when the
+        file is empty, unreadable or not a JSON object).
+    """
+    filename = os.path.basename(filepath)
+    try:
+        if os.path.getsize(filepath) == 0:
+            print(f"Skipping empty file: {filename}")
+            return {}
+        with open(filepath, 'r') as f:
+            command_data = json.load(f)
+    except json.JSONDecodeError:
+        print(f"Invalid JSON in file: {filename}")
+        return {}
+    except OSError as e:
+        print(f"Error loading {filename}: {e}")
+        return {}
+
+    if not isinstance(command_data, dict) or not command_data:
+        print(f"Skipping malformed JSON structure in: {filename}")
+        return {}
+    return {label: details for label, details in command_data.items() if validate_entry(filename, label, details)}
+
+
+def category_for(filename):
+    """Category of a command file: its uppercased name prefix."""
+    return filename.split('_')[0].upper()
+
+
+class CommandCatalogue:
+    """
+    Cached view of a command directory.
+
+    commands is the flattened {"CATEGORY: Label": command_info} map, sorted
+    by key; it is replaced (not mutated) whenever refresh() finds a change.
+    """
+
+    def __init__(self, directory=COMMANDS_DIR):
+        self.directory = directory
+        self.commands = {}
+        self.categorized = {}
+        self._files = {}  # filename -> ((mtime_ns, size), {label: details})
+        self._index = {}  # key -> "key\ncommand" lowercased, in key order
+        self._last_query = None
+        self._last_matches = []
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-stat the directory and re-parse only new or modified files.
+
+        Returns:
+            list: Filenames that were (re)loaded or removed; empty if the
+            catalogue is unchanged.
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.name.endswith(".json") and entry.is_file()]
+        except OSError as e:
+            print(f"Cannot read command directory {self.directory}: {e}")
+            entries = []
+
+        changed = []
+        seen = set()
+        for entry in entries:
+            seen.add(entry.name)
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            stamp = (st.st_mtime_ns, st.st_size)
+            cached = self._files.get(entry.name)
+            if cached is not None and cached[0] == stamp:
+                continue
+            self._files[entry.name] = (stamp, parse_command_file(entry.path))
+            changed.append(entry.name)
+
+        for filename in [name for name in self._files if name not in seen]:
+            del self._files[filename]
+            changed.append(filename)
+
+        if changed:
+            self._rebuild()
+            if DEBUG:
+                print(f"[DEBUG] Catalogue reloaded {len(changed)} file(s), {len(self.commands)} commands: "
+                      f"{', '.join(sorted(changed)[:10])}")
+        return changed
+
+    def _rebuild(self):
+        categorized = defaultdict(dict)
+        owners = {}
+        for filename in sorted(self._files):
+            category = category_for(filename)
+            for label, details in self._files[filename][1].items():
+                key = f"{category}: {label}"
+                if key in owners:
+                    print(f"Duplicate command '{key}' in {filename} overrides the one in {owners[key]}")
+                owners[key] = filename
+                categorized[category][label] = details
+
+        self.categorized = dict(categorized)
+        self.commands = {f"{category}: {label}": self.categorized[category][label]
+                         for category in sorted(self.categorized)
+                         for label in sorted(self.categorized[category])}
+        self._index = {key: f"{key}\n{info.get('command', '')}".lower() for key, info in self.commands.items()}
+        self._last_query = None
+        self._last_matches = []
+
+    def search(self, text):
+        """Keys whose name or command contains text (case-insensitive), in key order."""
+        query = text.lower()
+        if not query:
+            matches = list(self._index)
+        elif self._last_query is not None and self._last_query in query:
+            # The query only grew: every match must already be among the previous matches
+            matches = [key for key in self._last_matches if query in self._index[key]]
+        else:
+            matches = [key for key, haystack in self._index.items() if query in haystack]
+        self._last_query, self._last_matches = query, matches
+        return matches
@@ -0,0 +1,429 @@
+# cli.py
+"""
+Headless entry point for scheduled fleet sweeps (cron, jump boxes) and a
+small Python API for embedding sweeps in other tooling.
+Reuses the GUI's loaders, dispatcher and workers; no display needed.
+
+    SSHLOOP_PASSWORD=secret python cli.py --hosts assets/hosts.csv \\
+        --command "POSIX: Disk Free" --concurrency 20 --output results.xlsx
+
+--push LOCAL REMOTE / --pull REMOTE copy a file to / from every host over
+SFTP instead (see transfer.py); pulled files land in --dest/<host>/.
+
+Host files are streamed: the first hosts start while the rest of a large
+inventory is still being read (see inventory.py).
+
+Credentials come from SSHLOOP_USERNAME / SSHLOOP_PASSWORD.  Without a
+password, ssh-agent and default key files (or --key-file) are used;
+SSHLOOP_KEY_PASSPHRASE unlocks encrypted keys.
+
+Only per-host lines, --grouped, --diff and --summary - go to stdout;
+progress, the run report and every diagnostic go to stderr.  [DEBUG] lines
+are off unless --debug is given, whatever config.DEBUG says.
+
+Exit codes: 0 all hosts succeeded, 1 one or more hosts failed or host rows
+were skipped as invalid,
+2 bad arguments or input files, 130 interrupted.
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import time
+
+import config
+
+# The shared modules copy DEBUG when they are imported, so it is settled
+# before them: on for the GUI, opt-in here
+config.DEBUG = "--debug" in sys.argv[1:]
+
+from config import (
+    COMMANDS_DIR, BLACKLISTED_COMMAND_WORDS, ENGINE, ADAPTIVE_CONCURRENCY, PRESCAN_ENABLED, CACHE_MODE,
+    RESULT_CACHE_PATH, HISTORY_ENABLED, HISTORY_PATH, HOST_KEY_MODE, KNOWN_HOSTS_PATH, SSH_KEY_FILES, AUTH_RATE,
+    AUTH_CONCURRENCY, JUMP_CHANNELS, RETRY_MAX_ATTEMPTS, TRANSFER_DIR
+)
+from bastion import BastionPool
+from dispatcher import FleetDispatcher
+from failures import RetryQueue
+from history import RunHistory, format_diff
+from grouping import OutputGroups, format_groups
+from credentials import AuthThrottle, SessionAuth
+from hostkeys import HostKeyStore, HOST_KEY_MODES
+from catalogue import CommandCatalogue
+from file_handler import resolve_commands, open_result_writer
+from inventory import InventoryError, check_inventory, iter_hosts
+from parsing import compile_parse, GENERIC_PATTERN
+from result_cache import ResultCache, CACHE_MODES
+from telemetry import format_summary, save_summary
+from transfer import transfer_command
+
+EXIT_OK = 0
+EXIT_HOST_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def run_sweep(hosts, command_info, username=None, password=None, use_agent=False,
+              concurrency=None, engine=ENGINE, pool=None, writer=None, progress=None, progress_interval=1.0,
+              adaptive=ADAPTIVE_CONCURRENCY, prescan=PRESCAN_ENABLED, cache=None, cache_mode=CACHE_MODE,
+              history=None, host_keys=None, auth=None, bastions=None, retries=None):
+    """
+    Run command_info on every host and merge each result into its host dict.
+
+    Args:
+        hosts (iterable): Host dicts as returned by load_csv, or a generator
+            such as inventory.iter_hosts, consumed as workers free up.
+            Per-host 'username' or 'password' values take precedence over
+            the arguments.
+        command_info (dict): A catalogue entry, or {"batch": {key: entry}}.
+        username (str): SSH username for hosts that do not set one.
+        password (str): SSH password; leave empty with use_agent=True for key auth.
+        use_agent (bool): Authenticate with ssh-agent / default keys.
+        concurrency (int): Max simultaneous hosts (engine default if None);
+            the starting point when adaptive.
+        engine (str): "thread" or "async".
+        pool (SSHConnectionPool): Optional, reused between sweeps (thread engine).
+        writer (ResultWriter): Optional, each result is appended as it completes.
+        progress (callable): Called with a stats dict about every
+            progress_interval seconds and once at the end.
+        adaptive (bool): Let the thread engine raise / lower concurrency
+            within CONCURRENCY_FLOOR..CONCURRENCY_CEILING as hosts respond.
+        prescan (bool): Probe every host first; unreachable ones fail fast
+            with an "Unreachable: ..." error and "unreachable": True.
+        cache (ResultCache): Optional; answers hosts per cache_mode
+            ("refresh-stale", "cache-only", "force", "off") and stores new results.
+        history (RunHistory): Optional; the run and its results are recorded.
+        host_keys (HostKeyStore): Optional; server host keys are verified
+            and learned per its mode.  None accepts any key.
+        auth (SessionAuth): Optional; keys, agent and login throttle shared
+            by all hosts.  None logs in unthrottled with the default keys.
+        bastions (BastionPool): Optional; carries hosts with a jump_host.
+            None opens one for the sweep with the default fan-out.
+        retries (RetryQueue): Optional, for this sweep only; decides which
+            failures are tried again.  None retries per the RETRY_* settings.
+
+    Returns:
+        dict: total, completed, errors, cancelled, elapsed (s), rate (hosts/s),
+        telemetry (RunTelemetry.summary(): latency percentiles per phase,
+        utilization, error breakdown), history_run (the run's id in
+        history, or None), hosts (every host read, in order, with its
+        result merged in) and groups (OutputGroups: hosts by identical
+        result; identical outputs are stored once).
+    """
+    by_row = {}
+    groups = OutputGroups()
+    read = []
+
+    def prepare(source):
+        for idx, host in enumerate(source):
+            host.setdefault("row_id", idx)
+            if not host.get("username"):
+                host["username"] = username
+            if not host.get("password"):
+                host["password"] = password
+            host["use_agent"] = use_agent or host.get("use_agent", False)
+            by_row[host["row_id"]] = host
+            read.append(host)
+            yield host
+
+    # A list stays a list so the total is known up front
+    feed = list(prepare(hosts)) if hasattr(hosts, "__len__") else prepare(hosts)
+
+    result_queue = queue.Queue()
+    dispatcher = FleetDispatcher(feed, command_info, result_queue,
+                                 max_workers=concurrency, engine=engine, pool=pool, writer=writer,
+                                 adaptive=adaptive, prescan=prescan, cache=cache, cache_mode=cache_mode,
+                                 history=history, host_keys=host_keys, auth=auth, bastions=bastions,
+                                 retries=retries)
+    start = time.monotonic()
+
+    def drain():
+        while True:
+            try:
+                result = result_queue.get_nowait()
+            except queue.Empty:
+                return
+            host = by_row.get(result.get("row_id"))
+            if host is not None:
+                groups.add(result["row_id"], result)
+                host.update(result)
+
+    def stats():
+        p = dispatcher.progress()
+        elapsed = time.monotonic() - start
+        p["elapsed"] = elapsed
+        p["rate"] = p["completed"] / elapsed if elapsed > 0 else 0.0
+        return p
+
+    dispatcher.start()
+    try:
+        while not dispatcher.wait(progress_interval):
+            drain()
+            if progress:
+                progress(stats())
+    except KeyboardInterrupt:
+        dispatcher.cancel()
+        dispatcher.wait()
+        raise
+    finally:
+        drain()
+
+    summary = stats()
+    if progress:
+        progress(summary)
+    sweep = {key: summary[key] for key in ("total", "completed", "errors", "cancelled", "elapsed", "rate")}
+    sweep["telemetry"] = dispatcher.telemetry.summary()
+    sweep["history_run"] = dispatcher.history_run
+    sweep["hosts"] = read
+    sweep["groups"] = groups
+    return sweep
+
+
+def _print_progress(p):
+    print(
+        f"[{p['elapsed']:7.1f}s] {p['completed']}/{p['total']} complete, "
+        f"{p['errors']} errors, {p['rate']:.1f} hosts/s, limit {p['limit']}"
+        + (f", {p['retrying']} waiting to retry" if p["retrying"] else ""),
+        file=sys.stderr, flush=True,
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a catalogue command across a host CSV without the GUI.")
+    parser.add_argument("--hosts", action="append", default=[], metavar="CSV",
+                        help="hosts CSV (hostname, ip, port; optional username, jump_host, tags); repeat for several")
+    parser.add_argument("--tag", action="append", default=[],
+                        help="only hosts carrying this tag (repeat to allow several)")
+    parser.add_argument("--command", action="append", default=[], metavar="KEY",
+                        help='catalogue key such as "POSIX: Disk Free" (repeat for several, bundles allowed)')
+    parser.add_argument("--manual", metavar="CMD", help="run a manual command instead of catalogue entries")
+    parser.add_argument("--push", nargs=2, metavar=("LOCAL", "REMOTE"),
+                        help="upload the LOCAL file to REMOTE on every host over SFTP instead of running a command")
+    parser.add_argument("--pull", metavar="REMOTE",
+                        help="download the REMOTE file from every host into --dest/<host>/ instead of running a command")
+    parser.add_argument("--dest", default=TRANSFER_DIR, metavar="DIR",
+                        help=f"directory for --pull (default: {TRANSFER_DIR})")
+    parser.add_argument("--username", default=os.environ.get("SSHLOOP_USERNAME", "root"),
+                        help="SSH username (default: $SSHLOOP_USERNAME or root)")
+    parser.add_argument("--agent", action="store_true",
+                        help="use ssh-agent / key files even if SSHLOOP_PASSWORD is set")
+    parser.add_argument("--key-file", action="append", default=[], metavar="PATH",
+                        help="private key to try instead of the default key files (repeatable)")
+    parser.add_argument("--auth-rate", type=float, default=AUTH_RATE, metavar="N",
+                        help=f"new logins started per second, 0 = unlimited (default: {AUTH_RATE})")
+    parser.add_argument("--auth-concurrency", type=int, default=AUTH_CONCURRENCY, metavar="N",
+                        help=f"logins in progress at once, 0 = unlimited (default: {AUTH_CONCURRENCY})")
+    parser.add_argument("--jump-channels", type=int, default=JUMP_CHANNELS, metavar="N",
+                        help=f"hosts carried by one jump host login at once (default: {JUMP_CHANNELS})")
+    parser.add_argument("--retries", type=int, default=RETRY_MAX_ATTEMPTS - 1, metavar="N",
+                        help="times a host failing with a transient error (timeout, refused, reset, no banner) is tried again "
+                             f"(default: {RETRY_MAX_ATTEMPTS - 1})")
+    parser.add_argument("--concurrency", type=int,
+                        help="simultaneous hosts, the starting point when adaptive (default from config.py)")
+    parser.add_argument("--adaptive", action=argparse.BooleanOptionalAction, default=ADAPTIVE_CONCURRENCY,
+                        help="tune concurrency to how hosts respond (thread engine)")
+    parser.add_argument("--prescan", action=argparse.BooleanOptionalAction, default=PRESCAN_ENABLED,
+                        help="probe all hosts first and fail unreachable ones fast")
+    parser.add_argument("--cache", choices=CACHE_MODES, default=CACHE_MODE,
+                        help=f"result cache mode (default: {CACHE_MODE})")
+    parser.add_argument("--history", action=argparse.BooleanOptionalAction, default=HISTORY_ENABLED,
+                        help="record the run in the run history")
+    parser.add_argument("--diff", action="store_true",
+                        help="after the run, list hosts whose parsed value changed since the previous run")
+    parser.add_argument("--diff-threshold", type=float, metavar="N",
+                        help="with --diff, report numeric changes only when they cross N (e.g. 90 for disk use)")
+    parser.add_argument("--host-key-mode", choices=HOST_KEY_MODES, default=HOST_KEY_MODE,
+                        help=f"host key checking against known_hosts (default: {HOST_KEY_MODE})")
+    parser.add_argument("--engine", choices=("thread", "async"), default=ENGINE)
+    parser.add_argument("--output", help="stream results to this .xlsx, .csv or .jsonl file as hosts complete")
+    parser.add_argument("--summary", metavar="FILE",
+                        help='write the run summary (timings, percentiles, errors) as JSON; "-" for stdout')
+    parser.add_argument("--grouped", action="store_true",
+                        help="print one line per distinct result with its host count instead of one per host")
+    parser.add_argument("--quiet", action="store_true", help="no progress, per-host lines or run report")
+    parser.add_argument("--debug", action="store_true",
+                        help="print [DEBUG] diagnostics (connections, raw output) to stderr")
+    parser.add_argument("--list-commands", action="store_true", help="list catalogue keys and exit")
+    return parser
+
+
+def _script_path(path):
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # What the shared modules print (errors, [DEBUG] lines) is meant for a
+    # console; keep it off stdout so the sweep's output stays machine readable
+    out, sys.stdout = sys.stdout, sys.stderr
+    try:
+        return _main(args, out)
+    finally:
+        sys.stdout = out
+
+
+def _main(args, out):
+    commands = CommandCatalogue(_script_path(COMMANDS_DIR)).commands
+    if args.list_commands:
+        for key in commands:
+            print(key, file=out)
+        return EXIT_OK
+
+    if not args.hosts:
+        print("--hosts is required", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.push or args.pull:
+        try:
+            if args.push:
+                command_info = transfer_command("push", args.push[1], local=args.push[0])
+            else:
+                command_info = transfer_command("pull", args.pull, dest=_script_path(args.dest))
+        except ValueError as e:
+            print(f"Cannot transfer: {e}", file=sys.stderr)
+            return EXIT_USAGE
+    elif args.manual:
+        if any(bad_word in args.manual.lower() for bad_word in BLACKLISTED_COMMAND_WORDS):
+            print("The command contains a restricted word. Execution denied.", file=sys.stderr)
+            return EXIT_USAGE
+        command_info = {"command": args.manual, "parse": GENERIC_PATTERN, "regex": compile_parse(GENERIC_PATTERN)}
+    else:
+        unknown = [key for key in args.command if key not in commands]
+        if not args.command or unknown:
+            print(f"Unknown or missing --command: {', '.join(unknown) or '(none)'}  (see --list-commands)",
+                  file=sys.stderr)
+            return EXIT_USAGE
+        resolved = resolve_commands(commands, args.command)
+        if not resolved:
+            print("Selection contains no runnable commands", file=sys.stderr)
+            return EXIT_USAGE
+        command_info = next(iter(resolved.values())) if len(resolved) == 1 else {"batch": resolved}
+
+    try:
+        check_inventory(args.hosts)
+    except InventoryError as e:
+        print(f"Cannot use hosts file: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    skipped = []
+    hosts = iter_hosts(args.hosts, skipped, tags=args.tag)
+
+    writer = None
+    if args.output:
+        command_keys = list(command_info["batch"]) if "batch" in command_info else []
+        try:
+            writer = open_result_writer(args.output, command_keys)
+        except (ValueError, OSError) as e:
+            print(f"Cannot write results: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    cache = None
+    if args.cache != "off":
+        try:
+            cache = ResultCache(_script_path(RESULT_CACHE_PATH))
+        except Exception as e:
+            print(f"Cannot open result cache: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    history = None
+    if args.history or args.diff:
+        try:
+            history = RunHistory(_script_path(HISTORY_PATH))
+        except Exception as e:
+            print(f"Cannot open run history: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    host_keys = None
+    if args.host_key_mode != "off":
+        try:
+            host_keys = HostKeyStore(_script_path(KNOWN_HOSTS_PATH), mode=args.host_key_mode)
+        except Exception as e:
+            print(f"Cannot load known hosts: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    password = "" if args.agent else os.environ.get("SSHLOOP_PASSWORD", "")
+    auth = SessionAuth(
+        passphrase=os.environ.get("SSHLOOP_KEY_PASSPHRASE"),
+        key_files=args.key_file or SSH_KEY_FILES,
+        throttle=AuthThrottle(rate=args.auth_rate, concurrency=args.auth_concurrency),
+    )
+    bastions = BastionPool(host_keys=host_keys, auth=auth, fan_out=args.jump_channels)
+    summary = None
+    try:
+        summary = run_sweep(
+            hosts, command_info,
+            username=args.username,
+            password=password,
+            use_agent=not password,
+            concurrency=args.concurrency,
+            engine=args.engine,
+            adaptive=args.adaptive,
+            prescan=args.prescan,
+            cache=cache,
+            cache_mode=args.cache,
+            history=history,
+            host_keys=host_keys,
+            auth=auth,
+            bastions=bastions,
+            retries=RetryQueue(max_attempts=args.retries + 1),
+            writer=writer,
+            progress=None if args.quiet else _print_progress,
+        )
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    finally:
+        if writer:
+            writer.close(summary["telemetry"] if summary else None)
+        bastions.close_all()
+        auth.close()
+        if cache:
+            cache.close()
+        if history and not args.diff:
+            history.close()
+
+    for row in skipped:
+        print(f"Skipped host row {row}", file=sys.stderr)
+
+    if args.grouped and not args.quiet:
+        print(format_groups(summary["groups"].groups(), limit=None), file=out)
+    elif not args.quiet:
+        for host in summary["hosts"]:
+            status = "UNREACHABLE" if host.get("unreachable") else "ERROR" if host.get("error") else "OK"
+            first_line = (host.get("error") or host.get("output") or "").splitlines()[:1]
+            print(f"{status}\t{host.get('hostname', '')}\t{host.get('ip')}:{host.get('port')}\t{''.join(first_line)}",
+                  file=out)
+
+    if not args.quiet:
+        print(format_summary(summary["telemetry"]), file=sys.stderr)
+
+    if writer:
+        print(f"Results saved to: {writer.path}", file=sys.stderr)
+
+    if args.diff:
+        previous = history.previous_run(summary["history_run"]) if summary["history_run"] else None
+        if previous is None:
+            print("No previous run of the same command(s) to diff against", file=sys.stderr)
+        else:
+            print(format_diff(history.diff(previous, summary["history_run"], threshold=args.diff_threshold),
+                              limit=None), file=out)
+        history.close()
+
+    if args.summary == "-":
+        print(json.dumps(summary["telemetry"], indent=2), file=out)
+    elif args.summary:
+        try:
+            save_summary(summary["telemetry"], args.summary)
+        except OSError as e:
+            print(f"Cannot write run summary: {e}", file=sys.stderr)
+
+    if summary["errors"] or summary["completed"] < summary["total"] or skipped:
+        return EXIT_HOST_ERRORS
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
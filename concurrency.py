@@ -0,0 +1,255 @@
+# concurrency.py
+"""
+Adaptive concurrency for the thread engine.
+Instead of a fixed MAX_THREADS, the number of hosts in flight grows while
+handshakes stay fast and error free, and is cut back when they slow down or
+start failing (additive increase / multiplicative decrease, starting with a
+doubling phase).  The same controller also runs per host group - a subnet,
+or the jump host a host is reached through - so a fragile segment backs off
+on its own while healthy ones keep going.
+"""
+
+import ipaddress
+import threading
+from collections import OrderedDict, deque
+
+from config import (
+    MAX_THREADS, CONCURRENCY_FLOOR, CONCURRENCY_CEILING, SUBNET_PREFIX, GROUP_LIMITS, DEFAULT_GROUP_LIMIT,
+    LATENCY_TOLERANCE, LATENCY_SLACK, CONGESTION_ERROR_RATE, DEBUG
+)
+from failures import classify
+
+# Failure classes that point at an overloaded server or bastion (MaxStartups,
+# resets, handshakes left waiting) rather than a bad password or a failing command
+CONGESTION_CODES = {"banner", "reset", "timeout"}
+HANDSHAKE_PHASES = ("dns", "connect", "kex", "auth")
+
+
+def group_for(host, prefix=SUBNET_PREFIX):
+    """Group key for host: its jump host when it has one, else its /prefix subnet (or the raw address)."""
+    if host.get("jump_host"):
+        return f"via {host['jump_host']}"
+    try:
+        ip = ipaddress.ip_address(host.get("ip"))
+    except ValueError:
+        return str(host.get("ip"))
+    bits = prefix if ip.version == 4 else min(128, prefix + 40)  # /24 -> /64
+    return str(ipaddress.ip_network(f"{ip}/{bits}", strict=False))
+
+
+def handshake_signal(result):
+    """
+    Returns:
+        tuple: (handshake seconds or None when no new connection was made,
+        True if the failure's class (failures.classify) is a congestion one)
+    """
+    timings = result.get("timings") or {}
+    phases = [timings[p] for p in HANDSHAKE_PHASES if p in timings]
+    congested = classify(result) in CONGESTION_CODES
+    latency = sum(phases) if phases and not result.get("error") else None
+    return latency, congested
+
+
+class AdaptiveLimit:
+    """
+    One concurrency limit between floor and ceiling.
+
+    Observations are judged once per window of `limit` completions.  The
+    window's median handshake time is compared with the best median seen so
+    far; more than LATENCY_TOLERANCE times that (plus LATENCY_SLACK), or a
+    congestion error rate above CONGESTION_ERROR_RATE, cuts the limit to 70%.
+    Otherwise it doubles until the first cut, then grows by one.
+    """
+
+    BACKOFF = 0.7
+
+    def __init__(self, floor, ceiling, initial, name="overall"):
+        self.name = name
+        self.floor = max(1, min(floor, ceiling))
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = max(self.floor, min(initial, self.ceiling))
+        self.peak = self.limit
+        self.in_flight = 0
+        self.backoffs = 0
+        self.baseline = None
+        self._slow_start = True
+        self._reset_window()
+
+    def _reset_window(self):
+        self._samples = 0
+        self._congested = 0
+        self._latencies = []
+
+    @property
+    def available(self):
+        return self.in_flight < self.limit
+
+    def observe(self, latency, congested):
+        self._samples += 1
+        if latency is not None:
+            self._latencies.append(latency)
+        if congested:
+            self._congested += 1
+        if self._samples >= self.limit:
+            self._adjust()
+
+    def _adjust(self):
+        median = None
+        if self._latencies:
+            median = sorted(self._latencies)[len(self._latencies) // 2]
+            self.baseline = median if self.baseline is None else min(self.baseline, median)
+
+        slow = median is not None and median > self.baseline * LATENCY_TOLERANCE + LATENCY_SLACK
+        failing = self._congested / self._samples > CONGESTION_ERROR_RATE
+        old = self.limit
+        if slow or failing:
+            self.limit = max(self.floor, int(self.limit * self.BACKOFF))
+            self._slow_start = False
+            self.backoffs += 1
+        elif self._slow_start:
+            self.limit = min(self.ceiling, self.limit * 2)
+        else:
+            self.limit = min(self.ceiling, self.limit + 1)
+        self.peak = max(self.peak, self.limit)
+        self._reset_window()
+
+        if DEBUG and self.limit != old:
+            reason = "slow handshakes" if slow else "congestion errors" if failing else "healthy"
+            print(f"[DEBUG] Concurrency {self.name}: {old} -> {self.limit} ({reason}, median {median})")
+
+    def stats(self):
+        return {"limit": self.limit, "peak": self.peak, "backoffs": self.backoffs, "baseline_s": self.baseline}
+
+
+class AdaptiveScheduler:
+    """
+    Hands out hosts to the dispatcher as the overall and per-group limits allow.
+
+    Hosts are queued per group and picked round-robin, so a saturated group
+    does not hold up hosts of other groups behind it.  acquire() blocks until
+    a host may start; release() reports its result and frees the slot.
+    hosts may be any iterable; with lookahead set, only that many hosts are
+    read ahead of the workers (round-robin then works within that window).
+    retries is an optional RetryQueue: its hosts go ahead of the others in
+    their group once due, and acquire() keeps waiting while hosts are in
+    flight or queued there.  The dispatcher must offer() a result before it
+    calls release() for it.
+    """
+
+    def __init__(self, hosts, initial=MAX_THREADS, floor=CONCURRENCY_FLOOR, ceiling=CONCURRENCY_CEILING,
+                 group_limits=GROUP_LIMITS, default_group_limit=DEFAULT_GROUP_LIMIT, lookahead=None,
+                 retries=None):
+        self.overall = AdaptiveLimit(floor, ceiling, initial)
+        self.group_limits = dict(group_limits or {})
+        self.default_group_limit = default_group_limit or ceiling
+        self.floor = floor
+        self.initial = initial
+        self._groups = {}
+        self._pending = OrderedDict()  # group -> deque of hosts waiting to start
+        self._queued = 0
+        self._source = iter(hosts)
+        self.lookahead = lookahead
+        self.retries = retries
+        self._cond = threading.Condition()
+        self._fill()
+
+    def _fill(self):
+        """Queue hosts from the source until lookahead hosts are waiting (all of them without lookahead)."""
+        while self._source is not None and (self.lookahead is None or self._queued < self.lookahead):
+            host = next(self._source, None)
+            if host is None:
+                self._source = None
+                break
+            self._pending.setdefault(group_for(host), deque()).append(host)
+            self._queued += 1
+
+    @property
+    def ceiling(self):
+        return self.overall.ceiling
+
+    @property
+    def limit(self):
+        return self.overall.limit
+
+    @property
+    def in_flight(self):
+        return self.overall.in_flight
+
+    def _group(self, key):
+        gate = self._groups.get(key)
+        if gate is None:
+            ceiling = self.group_limits.get(key, self.default_group_limit)
+            gate = AdaptiveLimit(min(self.floor, ceiling), ceiling, min(self.initial, ceiling), name=key)
+            self._groups[key] = gate
+        return gate
+
+    def acquire(self, cancel_event=None, poll=0.2):
+        """
+        Block until a host may start.
+
+        Returns:
+            tuple: (host, group key), or None once every host has been handed
+            out (and none can come back for a retry) or cancel_event is set.
+        """
+        with self._cond:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                self._fill()
+                self._requeue_due()
+                if not self._pending:
+                    if self.retries is None:
+                        return None
+                    due = self.retries.next_due()
+                    if due is None and not self.overall.in_flight:
+                        return None
+                    self._cond.wait(min(poll, due if due is not None else poll))
+                    continue
+                if self.overall.available:
+                    for key in list(self._pending):
+                        gate = self._group(key)
+                        if not gate.available:
+                            continue
+                        queued = self._pending[key]
+                        host = queued.popleft()
+                        self._queued -= 1
+                        if queued:
+                            self._pending.move_to_end(key)
+                        else:
+                            del self._pending[key]
+                        gate.in_flight += 1
+                        self.overall.in_flight += 1
+                        return host, key
+                self._cond.wait(poll)
+
+    def _requeue_due(self):
+        while self.retries is not None:
+            host = self.retries.pop_due()
+            if host is None:
+                return
+            key = group_for(host)
+            self._pending.setdefault(key, deque()).appendleft(host)
+            self._pending.move_to_end(key, last=False)
+            self._queued += 1
+
+    def release(self, key, result):
+        """Free the slot taken for a host of group key and learn from its result."""
+        latency, congested = handshake_signal(result or {})
+        with self._cond:
+            gate = self._group(key)
+            gate.in_flight -= 1
+            self.overall.in_flight -= 1
+            gate.observe(latency, congested)
+            self.overall.observe(latency, congested)
+            self._cond.notify_all()
+
+    def wake(self):
+        """Wake a blocked acquire() so it can notice cancellation."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = self.overall.stats()
+            stats["groups"] = {key: gate.stats() for key, gate in self._groups.items()}
+        return stats
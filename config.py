@@ -4,17 +4,125 @@ Global configuration for the SSH Host Logger tool.
 Defines threading, logging, file structure, and input validation.
 """
 
-MAX_THREADS = 5
+MAX_THREADS = 5  # fixed worker count, or the starting point with ADAPTIVE_CONCURRENCY
 TIMEOUT = 10  # seconds
+COMMAND_TIMEOUT = 60  # seconds a remote command may run before partial output is returned
+MAX_OUTPUT_BYTES = 1048576  # per host, per stream; the rest is read and discarded
+
+# Execution engine: "thread" (paramiko, one thread per host) or "async" (asyncssh)
+ENGINE = "thread"
+ASYNC_MAX_CONCURRENCY = 500  # simultaneous sessions for the async engine
+
+# Adaptive concurrency (thread engine): grow the number of hosts in flight
+# while handshakes stay fast and error free, back off when they degrade
+ADAPTIVE_CONCURRENCY = False  # opt in: the limit can then rise to CONCURRENCY_CEILING
+CONCURRENCY_FLOOR = 2
+CONCURRENCY_CEILING = 64
+LATENCY_TOLERANCE = 2.0  # back off when median handshake time exceeds this multiple of the best seen...
+LATENCY_SLACK = 0.05  # ...plus this many seconds
+CONGESTION_ERROR_RATE = 0.1  # ...or when this share of hosts fail with banner/reset/timeout errors
+# The same limits apply per group of hosts: the host's jump_host if set,
+# else its /SUBNET_PREFIX subnet.  GROUP_LIMITS caps named groups, e.g.
+# {"10.20.30.0/24": 4, "via bastion-east": 8}; others get DEFAULT_GROUP_LIMIT
+SUBNET_PREFIX = 24
+GROUP_LIMITS = {}
+DEFAULT_GROUP_LIMIT = 32
+
+# Reachability pre-scan: probe every ip:port in parallel before any SSH
+# handshake; hosts that don't answer within PRESCAN_TIMEOUT are reported
+# unreachable at once and live ones are started slowest first
+PRESCAN_ENABLED = False
+PRESCAN_TIMEOUT = 2.0  # seconds per probe
+PRESCAN_BANNER = True  # also wait for the "SSH-" banner, not just the TCP connect
+PRESCAN_CONCURRENCY = 500  # probe sockets open at once (mind the open file limit)
+
+# Result cache (SQLite): catalogue commands with "cache_ttl" (seconds) in their
+# JSON are answered from the cache while fresh.  CACHE_MODE is the default of
+# "refresh-stale" (serve fresh, run the rest), "cache-only" (never connect),
+# "force" (run all, refresh the cache) or "off"
+CACHE_MODE = "refresh-stale"
+RESULT_CACHE_PATH = "cache/results.db"
+CACHE_DEFAULT_TTL = 0  # seconds, for commands without cache_ttl (0 = not cached)
+
+# Run history (SQLite): every run's per-host outputs, parsed values, errors and
+# timings, so a run can be diffed against the previous run of the same commands
+HISTORY_ENABLED = True
+HISTORY_PATH = "cache/history.db"
+HISTORY_MAX_RUNS = 200  # oldest runs are dropped beyond this (0 = keep all)
+
+# Host key checking: "strict" (known hosts only), "tofu" (record new keys,
+# reject changed ones), "warn" (record new keys, report changed ones) or "off".
+# Learned keys are appended to KNOWN_HOSTS_PATH; KNOWN_HOSTS_SYSTEM is trusted too
+HOST_KEY_MODE = "tofu"
+KNOWN_HOSTS_PATH = "cache/known_hosts"
+KNOWN_HOSTS_SYSTEM = "~/.ssh/known_hosts"  # read only; "" to ignore
+
+# Authentication: with a password only the password is tried; without one,
+# ssh-agent keys and then SSH_KEY_FILES (decrypted once per session, with
+# SSHLOOP_KEY_PASSPHRASE or the password).  A key_file inventory column
+# overrides both for its host.  New logins are spread out to stay under
+# PAM / fail2ban limits: at most AUTH_RATE per second and AUTH_CONCURRENCY
+# at once (0 = unlimited); reused pooled connections don't log in again
+SSH_KEY_FILES = ["~/.ssh/id_ed25519", "~/.ssh/id_ecdsa", "~/.ssh/id_rsa"]
+SSH_USE_AGENT = True
+AUTH_RATE = 50
+AUTH_CONCURRENCY = 20
+
+# Jump hosts: hosts with a jump_host inventory column are reached through
+# direct-tcpip channels over one authenticated connection to that bastion,
+# instead of a bastion login per host.  jump_host is "[user@]host[:port]" or
+# a name in JUMP_HOSTS, e.g. {"bastion-east": "admin@203.0.113.10:2222"}.
+# The bastion login uses the run's username (unless given), password and keys
+JUMP_HOSTS = {}
+JUMP_CHANNELS = 64  # channels per bastion connection; beyond that another connection is opened
+JUMP_RETRY_INTERVAL = 30  # seconds a failed bastion login is reported to its hosts before it is retried
+
+# Retries: hosts failing with one of RETRY_CODES (see failures.py) are queued
+# again after an exponential backoff with jitter - RETRY_BACKOFF_BASE seconds,
+# doubling per try up to RETRY_BACKOFF_CAP - for at most RETRY_MAX_ATTEMPTS
+# tries (1 = no retries).  A run retries at most RETRY_BUDGET per host it ran
+# (0.1 = one retry per ten hosts), and at least RETRY_BUDGET_MIN times
+RETRY_CODES = ("timeout", "refused", "reset", "banner")
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_CAP = 30.0
+RETRY_BUDGET = 0.1
+RETRY_BUDGET_MIN = 10
+
+# File transfers (transfer.py): pulled files land in TRANSFER_DIR/<host>/.
+# Up to TRANSFER_MAX_REQUESTS SFTP requests are kept in flight per host
+TRANSFER_DIR = "output/files"
+TRANSFER_MAX_REQUESTS = 64
+
+# Keep authenticated connections open between runs (thread engine)
+POOL_ENABLED = True
+POOL_MAX_SIZE = 500  # pooled connections kept open at most
+POOL_IDLE_TIMEOUT = 300  # seconds before an unused connection is closed
+
+# Multi-command runs: True sends all commands as one shell invocation split by
+# markers (POSIX shells); False runs each on its own channel over one connection
+BATCH_COMBINED = True
 DEBUG = True
+UI_BATCH_SIZE = 500  # results applied to the host table per GUI tick
+GROUP_HOSTS_SHOWN = 200  # hosts listed in the output pane for a selected result group
 VERSION = .03
 
 LOG_PATH = "logs/error.log"
 COMMANDS_DIR = "config"
+CATALOGUE_WATCH_INTERVAL = 2  # seconds between checks of COMMANDS_DIR for new/changed files (0 = off)
 HOST_CSV = "assets/hosts.csv"
 
-# Required CSV columns (case-sensitive)
+# Every GUI run streams its results to RESULTS_DIR/results_TIMESTAMP.<format>
+# as hosts complete; Export copies that file.  "xlsx", "csv" or "jsonl"; all
+# three survive a crash ("xlsx" through its results_TIMESTAMP.partial.jsonl sidecar)
+RESULTS_DIR = "output"
+RESULTS_FORMAT = "xlsx"
+
+# Required CSV columns (case-sensitive); optional: username, key_file, jump_host, tags
 CSV_REQUIRED_COLUMNS = ["hostname", "ip", "port"]
+DEFAULT_SSH_PORT = 22  # for rows with a blank port
+INVENTORY_MAX_CIDR_HOSTS = 65536  # largest CIDR range an "ip" cell may expand to
+INVENTORY_LOOKAHEAD = 1024  # hosts read ahead of the workers when the inventory is streamed
 
 # Don't need to run these on a list of servers, at least not using this script!
 BLACKLISTED_COMMAND_WORDS = ["testblacklist","rm", "cp", "mv", "shutdown", "reboot", "dd", ":(){", "mkfs", ">:"]
\ No newline at end of file
@@ -0,0 +1,281 @@
+# credentials.py
+"""
+SSH authentication for both engines.
+SessionAuth holds what a session needs to log in to many hosts: private
+keys decrypted once (not once per host), the ssh-agent connection, and an
+AuthThrottle that spreads logins out so a fleet-wide run does not trip
+PAM / fail2ban rate limits on shared auth backends.
+
+Per host, authenticate() tries:
+    1. the host's own key_file (inventory column), if any
+    2. with a password: the password only
+    3. without one: ssh-agent keys, then SSH_KEY_FILES
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+import paramiko
+
+from config import SSH_KEY_FILES, SSH_USE_AGENT, AUTH_RATE, AUTH_CONCURRENCY, DEBUG
+
+
+class AuthThrottle:
+    """
+    Limits logins to rate per second (0 = unlimited) and concurrency at once
+    (0 = unlimited).  Slots are handed out in order, evenly spaced, so a
+    burst of workers reaching auth together is spread over time instead of
+    hitting the server at once.  Usable from threads (slot) and asyncio
+    (async_slot).
+    """
+
+    def __init__(self, rate=AUTH_RATE, concurrency=AUTH_CONCURRENCY):
+        self.rate = rate
+        self.concurrency = concurrency
+        self._next = 0.0  # monotonic time the next login may start
+        self._active = 0
+        self._lock = threading.Lock()
+        self._free = threading.Condition(self._lock)
+
+    def _reserve(self):
+        """Claim the next start time; returns seconds to wait for it."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + 1.0 / self.rate
+            return start - now
+
+    def _try_enter(self):
+        with self._lock:
+            if self.concurrency and self._active >= self.concurrency:
+                return False
+            self._active += 1
+            return True
+
+    def _leave(self):
+        with self._lock:
+            self._active -= 1
+            self._free.notify()
+
+    def slot(self):
+        """Context manager for one login (thread engine); blocks until it may start."""
+        return _ThreadSlot(self)
+
+    def async_slot(self):
+        """Async context manager for one login (asyncio engine)."""
+        return _AsyncSlot(self)
+
+
+class _ThreadSlot:
+    def __init__(self, throttle):
+        self.throttle = throttle
+        self.waited = 0.0
+
+    def __enter__(self):
+        started = time.perf_counter()
+        throttle = self.throttle
+        if throttle.concurrency:
+            with throttle._lock:
+                while throttle._active >= throttle.concurrency:
+                    throttle._free.wait()
+                throttle._active += 1
+        else:
+            with throttle._lock:
+                throttle._active += 1
+        delay = throttle._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        self.waited = time.perf_counter() - started
+        return self
+
+    def __exit__(self, *exc):
+        self.throttle._leave()
+
+
+class _AsyncSlot:
+    def __init__(self, throttle):
+        self.throttle = throttle
+        self.waited = 0.0
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        while not self.throttle._try_enter():
+            await asyncio.sleep(0.05)
+        delay = self.throttle._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.waited = time.perf_counter() - started
+        return self
+
+    async def __aexit__(self, *exc):
+        self.throttle._leave()
+
+
+class SessionAuth:
+    """
+    Credentials shared by every worker of a session.
+
+    passphrase unlocks encrypted key files (a host's own password is tried
+    too, as SSHClient did).  Keys are read and decrypted on first use and
+    kept; a key that cannot be loaded is remembered as such, so a wrong
+    passphrase costs one attempt per session rather than one per host.
+    """
+
+    def __init__(self, passphrase=None, key_files=SSH_KEY_FILES, use_agent=SSH_USE_AGENT, throttle=None):
+        self.passphrase = passphrase
+        self.key_files = [os.path.expanduser(path) for path in key_files]
+        self.use_agent = use_agent
+        self.throttle = throttle if throttle is not None else AuthThrottle()
+        self._keys = {}  # path -> paramiko key, or None if it could not be loaded
+        self._async_keys = {}  # path -> asyncssh key, or None
+        self._agent = None
+        self._agent_keys = None
+        self._lock = threading.Lock()
+
+    def key(self, path, password=None):
+        """Decrypted paramiko key for path (None if missing or unreadable)."""
+        path = os.path.expanduser(path)
+        with self._lock:
+            if path in self._keys:
+                return self._keys[path]
+            key = None
+            if os.path.exists(path):
+                for passphrase in dict.fromkeys([None, self.passphrase, password]):
+                    try:
+                        key = paramiko.PKey.from_path(path, passphrase=passphrase.encode() if passphrase else None)
+                        break
+                    except OSError as e:
+                        if DEBUG:
+                            print(f"[DEBUG] Skipping key file {path}: {e}")
+                        break
+                    except Exception:
+                        continue  # encrypted, or the wrong passphrase (the error type varies by key format)
+                if key is None:
+                    print(f"Cannot load key file {path} (unreadable, or no passphrase matched)")
+            self._keys[path] = key
+            return key
+
+    def agent_keys(self):
+        """ssh-agent keys, listed once per session (empty without an agent)."""
+        if not self.use_agent:
+            return []
+        with self._lock:
+            if self._agent_keys is None:
+                try:
+                    self._agent = paramiko.Agent()
+                    self._agent_keys = list(self._agent.get_keys())
+                except paramiko.SSHException as e:
+                    print(f"ssh-agent unavailable: {e}")
+                    self._agent_keys = []
+            return self._agent_keys
+
+    def authenticate(self, transport, host_info, timings=None):
+        """
+        Log in on a negotiated transport (thread engine), waiting for the
+        throttle first.  The login counts towards timings["auth"]; time spent
+        waiting goes to timings["auth_wait"], so it does not read as a slow
+        server (or slow down the adaptive concurrency).
+
+        Raises:
+            paramiko.AuthenticationException: Nothing was accepted.
+        """
+        with self.throttle.slot() as slot:
+            mark = time.perf_counter()
+            try:
+                self._authenticate(transport, host_info)
+            finally:
+                if timings is not None:
+                    timings["auth_wait"] = timings.get("auth_wait", 0.0) + slot.waited
+                    timings["auth"] = timings.get("auth", 0.0) + time.perf_counter() - mark
+
+    def _authenticate(self, transport, host_info):
+        username = host_info["username"]
+        password = host_info.get("password")
+        if host_info.get("key_file"):
+            key = self.key(host_info["key_file"], password)
+            if key is None:
+                raise paramiko.AuthenticationException(f"Cannot load key file {host_info['key_file']}")
+            transport.auth_publickey(username, key)
+            return
+        if password:
+            transport.auth_password(username, password)
+            return
+
+        keys = list(self.agent_keys())
+        keys += [key for key in (self.key(path) for path in self.key_files) if key is not None]
+        for key in keys:
+            try:
+                transport.auth_publickey(username, key)
+                return
+            except paramiko.AuthenticationException:
+                continue
+        raise paramiko.AuthenticationException("No ssh-agent key or key file was accepted")
+
+    def asyncssh_options(self, host_info):
+        """
+        Keyword arguments for asyncssh.connect() with the same order of
+        preference: the host's key_file, else the password, else agent and
+        SSH_KEY_FILES (decrypted once per session).
+        """
+        import asyncssh
+
+        password = host_info.get("password")
+        if host_info.get("key_file"):
+            key = self._asyncssh_key(host_info["key_file"], password)
+            if key is None:
+                raise asyncssh.PermissionDenied(f"Cannot load key file {host_info['key_file']}")
+            return {"client_keys": [key], "password": None, "agent_path": None}
+        if password:
+            return {"client_keys": None, "password": password, "agent_path": None}
+        keys = [key for key in (self._asyncssh_key(path) for path in self.key_files) if key is not None]
+        return {
+            "client_keys": keys or (),  # () lets asyncssh look for keys itself
+            "password": None,
+            "agent_path": () if self.use_agent else None,  # () = $SSH_AUTH_SOCK
+        }
+
+    def _asyncssh_key(self, path, password=None):
+        import asyncssh
+
+        path = os.path.expanduser(path)
+        with self._lock:
+            if path in self._async_keys:
+                return self._async_keys[path]
+            key = None
+            if os.path.exists(path):
+                for passphrase in dict.fromkeys([None, self.passphrase, password]):
+                    try:
+                        key = asyncssh.read_private_key(path, passphrase)
+                        break
+                    except OSError:
+                        break
+                    except (asyncssh.KeyImportError, asyncssh.KeyEncryptionError):
+                        continue  # encrypted, or the wrong passphrase
+                if key is None:
+                    print(f"Cannot load key file {path} (unreadable, or no passphrase matched)")
+            self._async_keys[path] = key
+            return key
+
+    def close(self):
+        with self._lock:
+            if self._agent is not None:
+                self._agent.close()
+            self._agent = None
+            self._agent_keys = None
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_auth():
+    """Process-wide SessionAuth without a throttle, for callers that pass none."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SessionAuth(throttle=AuthThrottle(rate=0, concurrency=0))
+        return _default
@@ -0,0 +1,436 @@
+# dispatcher.py
+"""
+Background fleet dispatcher.
+Feeds hosts to a worker pool from its own thread so the GUI never blocks,
+and exposes start / cancel / pause / resume plus live progress counters.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bastion import BastionPool
+from concurrency import AdaptiveScheduler
+from config import (
+    MAX_THREADS, DEBUG, ENGINE, ASYNC_MAX_CONCURRENCY, ADAPTIVE_CONCURRENCY, CONCURRENCY_CEILING, PRESCAN_ENABLED,
+    CACHE_MODE, INVENTORY_LOOKAHEAD
+)
+from failures import RetryQueue
+from ssh_worker import run_ssh_task, stamp_times
+from telemetry import RunTelemetry
+
+
+class FleetDispatcher:
+    """
+    Run one command across a list of hosts without blocking the caller.
+    hosts may also be a generator (inventory.iter_hosts): it is consumed as
+    workers free up, so a large inventory starts before it is fully read,
+    and total grows as hosts are read.  The pre-scan needs every host up
+    front and reads the whole inventory first.
+
+    Results are put on the shared queue as hosts finish, so the GUI keeps
+    draining it with poll_queue.  Counters can be read at any time via
+    progress().  engine selects the thread pool ("thread") or the asyncio
+    engine ("async"); max_workers defaults to the matching config limit.
+    pool is an optional SSHConnectionPool reused by the thread engine.
+    adaptive lets the thread engine tune concurrency per run, starting at
+    max_workers and staying within the CONCURRENCY_* bounds (see concurrency.py).
+    writer is an optional ResultWriter each result is appended to as it lands.
+    prescan probes every host first (see prescan.py): unreachable ones are
+    reported straight away and the rest are started slowest first.
+    cache is an optional ResultCache: hosts it can answer (per cache_mode)
+    are reported without connecting, and fresh results are stored in it.
+    history is an optional RunHistory the run and every result are recorded
+    in; history_run is the run's id there.  Passing history_run (a re-run of
+    that run's failed hosts) records the results into it instead of a new run.
+    host_keys is an optional HostKeyStore every new connection is verified
+    against; keys it learns are saved when the run ends.
+    auth is an optional SessionAuth (keys, agent, login throttle) shared by
+    every worker; without it logins are unthrottled.
+    bastions is an optional BastionPool hosts with a jump_host are reached
+    through; without it the run opens (and at the end closes) its own.
+    retries is the RetryQueue deciding which failures are tried again
+    (failures.py), one per run; by default a new one on the RETRY_*
+    settings.  A retried host is reported once, with its last result.
+    telemetry aggregates every result's phase timings; telemetry.summary()
+    gives the run report.
+    """
+
+    def __init__(self, hosts, command_info, result_queue, max_workers=None, engine=ENGINE, pool=None,
+                 writer=None, adaptive=ADAPTIVE_CONCURRENCY, prescan=PRESCAN_ENABLED, cache=None,
+                 cache_mode=CACHE_MODE, history=None, history_run=None, host_keys=None, auth=None, bastions=None,
+                 retries=None):
+        if engine not in ("thread", "async"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if max_workers is None:
+            max_workers = ASYNC_MAX_CONCURRENCY if engine == "async" else MAX_THREADS
+        # The asyncio engine has no per-host thread to save; it keeps its fixed limit
+        self.adaptive = adaptive and engine == "thread"
+        self.scheduler = None  # AdaptiveScheduler, created once the hosts to run are known
+        self.prescan = prescan
+        # A transfer's result says nothing about the next one: the files may have changed
+        self.cache = cache if cache_mode != "off" and "transfer" not in command_info else None
+        self._by_row = {}  # row_id -> host, to key cache entries
+        self.cache_mode = cache_mode
+        self.history = history
+        self.history_run = history_run
+        self._merge_history = history_run is not None
+        self.host_keys = host_keys
+        self.auth = auth
+        self._own_bastions = bastions is None
+        self.bastions = bastions if bastions is not None else BastionPool(host_keys=host_keys, auth=auth)
+        self.retries = retries if retries is not None else RetryQueue()
+        self._history_keys = list(command_info["batch"]) if "batch" in command_info else [""]
+        self.stage = "pending"  # "cache", "prescan", then "running"
+
+        self.hosts = hosts
+        self.command_info = command_info
+        self.queue = result_queue
+        self.max_workers = max_workers
+        self.engine = engine
+        self.pool = pool
+        self.writer = writer
+
+        self.streaming = not hasattr(hosts, "__len__")
+        self.total = 0 if self.streaming else len(hosts)
+        self.completed = 0
+        self.errors = 0
+        self.telemetry = RunTelemetry(self.total, CONCURRENCY_CEILING if self.adaptive else max_workers, engine)
+
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._done = threading.Event()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._running = 0  # hosts submitted and not yet decided on (fixed thread pool)
+        self._thread = None
+
+    def start(self):
+        """Spawn the dispatcher thread and return immediately."""
+        if self._thread is not None:
+            raise RuntimeError("Dispatcher already started")
+        self._thread = threading.Thread(target=self._run, name="fleet-dispatcher", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop handing out hosts.  Connections already in flight are allowed to finish."""
+        self._cancel.set()
+        self.retries.close()
+        self._resume.set()  # wake a paused dispatcher so it can exit
+        scheduler = self.scheduler
+        if scheduler:
+            scheduler.wake()
+
+    def pause(self):
+        """Hold back hosts that have not started yet."""
+        self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until every submitted host has reported back."""
+        return self._done.wait(timeout)
+
+    def progress(self):
+        """Return a snapshot of the run counters (limit is the current concurrency limit)."""
+        scheduler = self.scheduler
+        with self._lock:
+            return {
+                "total": self.total,
+                "completed": self.completed,
+                "errors": self.errors,
+                "retrying": len(self.retries),
+                "limit": scheduler.limit if scheduler else self.max_workers,
+                "stage": self.stage,
+                "paused": self.paused,
+                "cancelled": self.cancelled,
+                "done": self.done,
+            }
+
+    def _run(self):
+        host_keys_before = self.host_keys.stats() if self.host_keys is not None else None
+        bastions_before = self.bastions.stats()
+        if self.history is not None and not self._merge_history:
+            try:
+                self.history_run = self.history.begin_run(self.command_info, self.total, self.engine)
+            except Exception as e:
+                print(f"Run history disabled for this run: {e}")
+        try:
+            hosts = self._read_hosts(self.hosts)
+            if self.cache is not None:
+                self.stage = "cache"
+                hosts = self._serve_cached(hosts)
+            if self.prescan:
+                hosts = list(hosts)
+                if hosts:
+                    self.stage = "prescan"
+                    hosts = self._prescan(hosts)
+            self.stage = "running"
+            if self.engine == "async":
+                self._run_async(hosts)
+            else:
+                self._run_threads(hosts)
+        finally:
+            # Hosts still waiting for a retry (cancelled run) keep their last failure
+            for result in self.retries.drain():
+                self._report(result)
+            retries = self.retries.stats()
+            if retries["retried"]:
+                self.telemetry.extra["retries"] = retries
+            if self.scheduler:
+                self.telemetry.extra["concurrency"] = self.scheduler.stats()
+            if self.cache is not None:
+                self.cache.flush()
+            if self.host_keys is not None:
+                self.host_keys.save()
+                # The store is shared across runs; report this run's share
+                self.telemetry.extra["host_keys"] = {
+                    key: value - host_keys_before[key] if isinstance(value, int) else value
+                    for key, value in self.host_keys.stats().items()
+                }
+            jump_hosts = {key: value - bastions_before[key] for key, value in self.bastions.stats().items()}
+            jump_hosts["fan_out"] = self.bastions.fan_out
+            if jump_hosts["tunnels"] or jump_hosts["failed"]:
+                self.telemetry.extra["jump_hosts"] = jump_hosts
+            if self._own_bastions:
+                self.bastions.close_all()
+            self.telemetry.finish(cancelled=self.cancelled)
+            if self.history_run is not None:
+                self.history.finish_run(self.history_run, self.telemetry.summary(), merged=self._merge_history)
+            self._done.set()
+            if DEBUG:
+                print(f"[DEBUG] Dispatcher finished: {self.progress()}")
+
+    def _read_hosts(self, hosts):
+        """Yield hosts, counting them into total when the inventory is streamed."""
+        try:
+            for host in hosts:
+                if self.streaming:
+                    with self._lock:
+                        self.total += 1
+                    self.telemetry.total = self.total
+                yield host
+        except Exception as e:
+            # A streamed inventory can fail part way; hosts already read still run
+            print(f"Host inventory failed after {self.total} hosts: {e}")
+
+    def _serve_cached(self, hosts):
+        """Report every host the cache can answer; yield the ones that still need a connection."""
+        served = remaining = 0
+        for host in hosts:
+            if self._cancel.is_set():
+                break
+            self._by_row[host.get("row_id")] = host
+            try:
+                result = self.cache.lookup(host, self.command_info, self.cache_mode)
+            except Exception as e:
+                print(f"Result cache lookup failed for {host.get('ip')}: {e}")
+                result = None
+            if result is None:
+                remaining += 1
+                yield host
+                continue
+            served += 1
+            self._report(result)
+        if DEBUG:
+            print(f"[DEBUG] Cache ({self.cache_mode}): {served} served, {remaining} to run")
+
+    def _prescan(self, hosts):
+        """
+        Probe hosts, report the unreachable ones as results right away and
+        return the live ones, slowest to answer first.  Hosts whose probe
+        failed in a transient way (refused, reset, no banner) go to the retry
+        queue, which hands them to the workers after a backoff.
+        """
+        from prescan import probe_hosts
+        from telemetry import percentile
+
+        started = time.time()
+        probes = probe_hosts(hosts, cancel_event=self._cancel)
+        live = []
+        for host, probe in zip(hosts, probes):
+            if probe is None:
+                continue  # cancelled before it was probed
+            if probe.alive:
+                live.append((probe.rtt, host))
+                continue
+            dead = probe.code == "unreachable"
+            result = {
+                "hostname": host.get("hostname"),
+                "ip": host.get("ip"),
+                "port": host.get("port"),
+                "row_id": host.get("row_id"),
+                "output": "",
+                "error": f"{'Unreachable: ' if dead else ''}{probe.error} (pre-scan)",
+                "error_code": probe.code,
+                "timings": {},
+            }
+            if dead:
+                result["unreachable"] = True
+            stamp_times(result, time.time() - probe.rtt)
+            if not self.retries.offer(host, result):
+                self._report(result)
+
+        live.sort(key=lambda item: item[0], reverse=True)
+        rtts = sorted(rtt for rtt, _ in live)
+        self.telemetry.extra["prescan"] = {
+            "probed": sum(1 for probe in probes if probe is not None),
+            "alive": len(live),
+            "unreachable": sum(1 for probe in probes if probe is not None and probe.code == "unreachable"),
+            "failed": sum(1 for probe in probes if probe is not None and probe.code not in ("", "unreachable")),
+            "elapsed_s": round(time.time() - started, 3),
+            "rtt_p50_s": round(percentile(rtts, 50), 4) if rtts else None,
+            "rtt_p95_s": round(percentile(rtts, 95), 4) if rtts else None,
+        }
+        if DEBUG:
+            print(f"[DEBUG] Pre-scan: {self.telemetry.extra['prescan']}")
+        return [host for _, host in live]
+
+    def _run_async(self, hosts):
+        from async_worker import run_fleet_async
+
+        asyncio.run(run_fleet_async(
+            hosts, self.command_info, self._report,
+            concurrency=self.max_workers,
+            cancel_event=self._cancel,
+            resume_event=self._resume,
+            host_keys=self.host_keys,
+            auth=self.auth,
+            bastions=self.bastions,
+            retries=self.retries,
+        ))
+
+    def _run_threads(self, hosts):
+        if self.adaptive:
+            self.scheduler = AdaptiveScheduler(hosts, initial=self.max_workers,
+                                               lookahead=INVENTORY_LOOKAHEAD if self.streaming else None,
+                                               retries=self.retries)
+            return self._run_adaptive()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for host in self._with_retries(hosts):
+                # Only acquire a slot once the previous one is free, so pause
+                # and cancel take effect for every host not yet submitted.
+                self._resume.wait()
+                if self._cancel.is_set():
+                    break
+                self._slots.acquire()
+                if self._cancel.is_set():
+                    self._slots.release()
+                    break
+                with self._lock:
+                    self._running += 1
+                executor.submit(self._run_one, host)
+
+    def _with_retries(self, hosts):
+        """
+        hosts for the fixed thread pool, with hosts queued for a retry going
+        first once due; after the last host, wait for the retries still to come.
+        """
+        for host in hosts:
+            retry = self.retries.pop_due()
+            while retry is not None:
+                yield retry
+                retry = self.retries.pop_due()
+            yield host
+        while not self._cancel.is_set():
+            retry = self.retries.pop_due()
+            if retry is not None:
+                yield retry
+                continue
+            due = self.retries.next_due()
+            with self._lock:
+                running = self._running
+            if due is None and not running:
+                return
+            time.sleep(min(0.1, due if due is not None else 0.1))
+
+    def _run_adaptive(self):
+        # Threads are only created as the limit grows, never beyond the ceiling
+        with ThreadPoolExecutor(max_workers=self.scheduler.ceiling) as executor:
+            while True:
+                self._resume.wait()
+                picked = self.scheduler.acquire(self._cancel)
+                if picked is None:
+                    break
+                host, group = picked
+                executor.submit(self._run_one, host, group)
+
+    def _run_one(self, host, group=None):
+        result = {}
+        started = time.time()
+        try:
+            result = run_ssh_task(host, self.command_info, None, pool=self.pool, host_keys=self.host_keys,
+                                  auth=self.auth, bastions=self.bastions)
+        except Exception as e:
+            # run_ssh_task reports its own errors; this only guards the counters and keeps the host's row
+            result = {
+                "hostname": host.get("hostname"),
+                "ip": host.get("ip"),
+                "port": host.get("port"),
+                "row_id": host.get("row_id"),
+                "output": "",
+                "error": f"Unexpected error: {e}",
+                "error_code": "other",
+                "timings": {},
+            }
+            if host.get("jump_host"):
+                result["jump_host"] = host["jump_host"]
+            stamp_times(result, started)
+        finally:
+            # Decided before the slot is freed, so the feeder sees the retry before it sees an idle pool
+            retried = self.retries.offer(host, result)
+            if self.scheduler:
+                self.scheduler.release(group, result)
+            else:
+                with self._lock:
+                    self._running -= 1
+                self._slots.release()
+        if not retried:
+            self._report(result)
+
+    def _report(self, result):
+        """Hand a final result to the caller's queue and record it."""
+        self.queue.put(result)
+        self._record(result)
+
+    def _record(self, result):
+        with self._lock:
+            self.completed += 1
+            if result and result.get("error"):
+                self.errors += 1
+        self.telemetry.record(result)
+
+        if self.writer is not None and result.get("ip") is not None:
+            try:
+                self.writer.write(result)
+            except Exception as e:
+                print(f"Failed to write result for {result.get('ip')}: {e}")
+
+        if self.cache is not None and not result.get("cached"):
+            host = self._by_row.get(result.get("row_id"))
+            if host is not None:
+                try:
+                    self.cache.store(host, self.command_info, result)
+                except Exception as e:
+                    print(f"Failed to cache result for {result.get('ip')}: {e}")
+
+        if self.history_run is not None:
+            try:
+                self.history.record(self.history_run, result, self._history_keys)
+            except Exception as e:
+                print(f"Failed to record history for {result.get('ip')}: {e}")
@@ -0,0 +1,214 @@
+# failures.py
+"""
+Failure classification and automatic retries.
+Every failed result carries an error_code next to its error message:
+
+    timeout      connect, banner or login timed out
+    refused      TCP connection refused (sshd down or restarting)
+    reset        connection reset or closed during the handshake (MaxStartups, load balancers)
+    banner       no SSH banner in time (sshd overloaded)
+    dns          the name does not resolve
+    unreachable  no route to the host, or the pre-scan found it dead
+    auth         no credential was accepted
+    hostkey      host key unknown (strict) or changed
+    jump         the jump host is unavailable or cannot reach the host
+    ssh          any other SSH protocol error
+    exec         the command failed (exit status, stderr, timeout, truncated output)
+    parse        the output did not match the command's parse pattern(s)
+    transfer     a file push / pull failed or arrived corrupted (transfer.py)
+    input        the host lacks required fields
+    other        anything else
+
+Hosts failing with a transient code (RETRY_CODES) are queued again by
+RetryQueue after an exponential backoff with jitter, instead of being
+reported, so a flaky host costs a few seconds of one worker rather than a
+second sweep of the fleet.
+"""
+
+import asyncio
+import errno
+import heapq
+import random
+import socket
+import threading
+import time
+from collections import Counter
+
+from config import (
+    RETRY_CODES, RETRY_MAX_ATTEMPTS, RETRY_BACKOFF_BASE, RETRY_BACKOFF_CAP, RETRY_BUDGET, RETRY_BUDGET_MIN, DEBUG
+)
+
+ERROR_CODES = ("timeout", "refused", "reset", "banner", "dns", "unreachable", "auth", "hostkey", "jump",
+               "ssh", "exec", "parse", "transfer", "input", "other")
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN}
+
+
+def classify_exception(exc, default="other"):
+    """Error code for an exception raised while connecting; default when nothing more specific fits."""
+    if isinstance(exc, (socket.timeout, TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(exc, ConnectionRefusedError):
+        return "refused"
+    if isinstance(exc, (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, EOFError)):
+        return "reset"
+    if isinstance(exc, socket.gaierror):
+        return "dns"
+    if isinstance(exc, OSError) and exc.errno in UNREACHABLE_ERRNOS:
+        return "unreachable"
+    # paramiko and asyncssh wrap most of these in their own exception types
+    text = str(exc).lower()
+    if "banner" in text:
+        return "banner"
+    if "timed out" in text or "timeout" in text:
+        return "timeout"
+    if "refused" in text:
+        return "refused"
+    if "reset" in text or "connection lost" in text or "closed by" in text:
+        return "reset"
+    return default
+
+
+def classify(result):
+    """error_code of a result: the one its worker set, else guessed from the message ("" on success)."""
+    error = result.get("error") or ""
+    if not error:
+        return ""
+    if result.get("error_code"):
+        return result["error_code"]
+    if result.get("unreachable") or error.startswith("Unreachable"):
+        return "unreachable"
+    if error.startswith("Authentication failed"):
+        return "auth"
+    if error.startswith("Host key rejected"):
+        return "hostkey"
+    if error.startswith("Missing required fields"):
+        return "input"
+    if error.startswith(("Parse failed", "Regex error")):
+        return "parse"
+    if error.startswith("Exit Code"):
+        return "exec"
+    if error.startswith("Transfer failed"):
+        return "transfer"
+    return classify_exception(Exception(error), "ssh" if error.startswith("SSH error") else "other")
+
+
+class RetryQueue:
+    """
+    Transient failures waiting to be tried again, shared by the dispatcher
+    and its workers (thread-safe).
+
+    offer() is given every result before it is reported.  A result with a
+    code in retryable, from a host below max_attempts tries, is held back
+    and its host queued again after a delay of base * 2 ** (tries - 1)
+    seconds, capped at cap, of which a random half is taken off (jitter), so
+    hosts that failed together do not come back together.  A run retries at
+    most budget times its hosts (counted as their results come in), and at
+    least budget_min times, so a dead segment cannot multiply the run's work.
+    A host whose command was started (its timings have "exec") is never
+    retried: the command may have run.
+
+    The last result of a queued host is held until the host reports again;
+    drain() hands back the results of hosts that never did.
+    """
+
+    def __init__(self, retryable=RETRY_CODES, max_attempts=RETRY_MAX_ATTEMPTS, base=RETRY_BACKOFF_BASE,
+                 cap=RETRY_BACKOFF_CAP, budget=RETRY_BUDGET, budget_min=RETRY_BUDGET_MIN):
+        self.retryable = set(retryable)
+        self.max_attempts = max(1, max_attempts)
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+        self.budget_min = budget_min
+        self._heap = []  # (due monotonic time, sequence, host)
+        self._seq = 0
+        self._held = {}  # id(host) -> last result, from being queued until the next result
+        self._attempts = {}  # id(host) -> tries so far, for hosts that were retried
+        self._hosts = 0  # hosts whose first result came in
+        self._counts = {"retried": 0, "recovered": 0, "exhausted": 0}
+        self._codes = Counter()
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def allowed(self):
+        """Retries the run may make so far."""
+        return max(self.budget_min, int(self.budget * self._hosts))
+
+    def delay(self, attempt):
+        """Seconds to wait before try attempt + 1."""
+        ceiling = min(self.cap, self.base * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def offer(self, host, result):
+        """
+        Decide on a finished host.  Returns True when it was queued again (do
+        not report the result); False when the result is final, in which case
+        result["attempts"] is set if the host was tried more than once.
+        """
+        code = classify(result)
+        started = "exec" in (result.get("timings") or {})
+        with self._lock:
+            self._held.pop(id(host), None)
+            attempt = self._attempts.pop(id(host), 1)
+            if attempt == 1:
+                self._hosts += 1
+            if code in self.retryable:
+                if (not self._closed and not started and attempt < self.max_attempts
+                        and self._counts["retried"] < self.allowed()):
+                    self._attempts[id(host)] = attempt + 1
+                    self._held[id(host)] = result
+                    self._counts["retried"] += 1
+                    self._codes[code] += 1
+                    self._seq += 1
+                    delay = self.delay(attempt)
+                    heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, host))
+                    if DEBUG:
+                        print(f"[DEBUG] Retrying {host.get('ip')} in {delay:.1f}s ({code}, try {attempt + 1})")
+                    return True
+                self._counts["exhausted"] += 1
+            elif attempt > 1 and not code:
+                self._counts["recovered"] += 1
+        if attempt > 1:
+            result["attempts"] = attempt
+        return False
+
+    def pop_due(self):
+        """A host whose backoff is over, or None."""
+        with self._lock:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                return heapq.heappop(self._heap)[2]
+        return None
+
+    def next_due(self):
+        """Seconds until the next queued host is due (0 if one is), or None when none is queued."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def close(self):
+        """Queue nothing more (run cancelled); results offered from now on are final."""
+        with self._lock:
+            self._closed = True
+
+    def drain(self):
+        """
+        Give up on every host queued, or taken from the queue but not run
+        again (run cancelled or over).  Returns their last results, to be
+        reported as they are.
+        """
+        with self._lock:
+            held, self._held = self._held, {}
+            self._heap = []
+            for key, result in held.items():
+                tried = self._attempts.pop(key, 2) - 1
+                if tried > 1:
+                    result["attempts"] = tried
+        return list(held.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, budget=self.allowed(), codes=dict(self._codes.most_common()))
@@ -1,141 +1,315 @@
 # file_handler.py
 """
 Handles reading CSV host files and individual JSON command files,
-as well as saving results to XLSX.
+as well as saving results to XLSX, and streaming them to XLSX/CSV/JSONL
+while a run is in progress.
+openpyxl is imported when a workbook is first written, not at import time,
+so loading this module (and the GUI) does not pay for it.
 """
 
 import csv
 import json
 import os
+import re
+import threading
 
-from openpyxl import Workbook
 from datetime import datetime
 
-def save_results(hosts, output_path):
-    """Write results to XLSX."""
+from failures import classify
+from telemetry import PHASES
+
+# Per-phase seconds from result["timings"]; "total" is already Duration (s)
+TIMING_PHASES = [phase for phase in PHASES if phase != "total"]
+RESULT_HEADERS = (["Hostname", "IP", "Port", "Start", "End", "Duration (s)"]
+                  + [f"{phase.upper() if phase in ('dns', 'kex') else phase.title()} (s)" for phase in TIMING_PHASES]
+                  + ["Output", "Error", "Error Code", "Attempts"])
+
+def _result_row(host, sub=None, fallback_time=""):
+    """One output row; sub is a per-command result for batch sheets/columns."""
+    source = host if sub is None else sub
+    timings = host.get("timings") or {}
+    return [
+        host.get("hostname", ""),
+        host.get("ip", ""),
+        host.get("port", ""),
+        host.get("started_at", fallback_time),
+        host.get("finished_at", fallback_time),
+        host.get("duration", ""),
+    ] + [timings.get(phase, "") for phase in TIMING_PHASES] + [
+        source.get("output", ""),
+        source.get("error", ""),
+        classify(source),
+        host.get("attempts", ""),
+    ]
+
+def _summary_rows(summary):
+    """Rows for a "Run Summary" sheet built from RunTelemetry.summary()."""
+    rows = [[key, json.dumps(value) if isinstance(value, (dict, list)) else value]
+            for key, value in summary.items() if key not in ("latency", "errors")]
+    rows += [[], ["Phase", "Count", "Mean (s)", "p50 (s)", "p95 (s)", "p99 (s)", "Max (s)"]]
+    for phase, stats in summary["latency"].items():
+        rows.append([phase, stats["count"], stats["mean"], stats["p50"], stats["p95"], stats["p99"], stats["max"]])
+    if summary["errors"]:
+        rows += [[], ["Error", "Count"]]
+        rows += [[kind, count] for kind, count in summary["errors"].items()]
+    return rows
+
+def save_results(hosts, output_path, summary=None):
+    """
+    Write results to XLSX.
+    Batch runs (hosts carrying per-command "results") get one extra sheet per command.
+    A run summary (RunTelemetry.summary()) adds a "Run Summary" sheet.
+    """
     try:
+        from openpyxl import Workbook
+
         wb = Workbook()
         ws = wb.active
         ws.title = "SSH Results"
 
         # Header
-        headers = ["Hostname", "IP", "Port", "Timestamp", "Output", "Error"]
-        ws.append(headers)
+        ws.append(RESULT_HEADERS)
 
+        # Hosts that never ran have no times of their own
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         for host in hosts:
-            ws.append([
-                host.get("hostname", ""),
-                host.get("ip", ""),
-                host.get("port", ""),
-                timestamp,
-                host.get("output", ""),
-                host.get("error", ""),
-            ])
+            ws.append(_result_row(host, fallback_time=timestamp))
+
+        command_keys = []
+        for host in hosts:
+            for key in host.get("results", {}):
+                if key not in command_keys:
+                    command_keys.append(key)
+
+        used_titles = {ws.title}
+        for key in command_keys:
+            sheet = wb.create_sheet(_sheet_title(key, used_titles))
+            sheet.append(["Command", key])
+            sheet.append(RESULT_HEADERS)
+            for host in hosts:
+                sub = host.get("results", {}).get(key, {})
+                sheet.append(_result_row(host, sub, fallback_time=timestamp))
+
+        if summary:
+            sheet = wb.create_sheet(_sheet_title("Run Summary", used_titles))
+            for row in _summary_rows(summary):
+                sheet.append(row)
 
         wb.save(output_path)
         print(f"Results saved to: {output_path}")
     except Exception as e:
         print(f"Failed to save XLSX: {e}")
+        raise
 
-def load_csv(file_path):
-    """Read CSV and return list of host dictionaries."""
-    hosts = []
-    with open(file_path, newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            hosts.append({
-                "hostname": row.get("hostname", ""),
-                "ip": row.get("ip"),
-                "port": row.get("port"),
-            })
-    return hosts
-
-def load_json_commands(directory):
+class ResultWriter:
     """
-    Load all JSON command files from a directory, grouped by uppercased prefix.
-
-    Returns:
-        dict: {
-            "CP": {"Show Syslog": {...}},
-            "POSIX": {"Disk Usage": {...}},
-        }
+    Append results to disk as each host completes.
+    Use open_result_writer() to pick the format from the file extension.
+    write() is thread-safe; close() finalizes the file and may be called twice.
+    A summary passed to close() is included by formats that have room for it.
     """
-    from collections import defaultdict
 
-    command_map = defaultdict(dict)
-    required_keys = {"command", "parse", "description"}
+    def __init__(self, path, command_keys=()):
+        self.path = path
+        self.command_keys = list(command_keys)
+        self.summary = None
+        self.rows = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._open()
 
-    for filename in os.listdir(directory):
-        if filename.endswith(".json"):
-            filepath = os.path.join(directory, filename)
-            try:
-                if os.path.getsize(filepath) == 0:
-                    print(f"Skipping empty file: {filename}")
-                    continue
+    def write(self, result):
+        with self._lock:
+            if self.closed:
+                return
+            self._write(result)
+            self.rows += 1
 
-                with open(filepath, 'r') as f:
-                    command_data = json.load(f)
-                    if len(command_data) != 1:
-                        print(f"Skipping malformed JSON structure in: {filename}")
-                        continue
+    def close(self, summary=None):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.summary = summary
+            self._close()
 
-                    key = list(command_data.keys())[0]
-                    command_details = command_data[key]
+class CsvResultWriter(ResultWriter):
+    """One row per host, flushed immediately; batch runs add Output/Error columns per command."""
 
-                    if not isinstance(command_details, dict) or not required_keys.issubset(command_details.keys()):
-                        print(f"Skipping invalid command entry in {filename}: missing one of {sorted(required_keys)}")
-                        continue
+    def _open(self):
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        self._csv = csv.writer(self._file)
+        headers = list(RESULT_HEADERS)
+        for key in self.command_keys:
+            headers += [f"{key} Output", f"{key} Error"]
+        self._csv.writerow(headers)
+        self._file.flush()
 
-                    category = filename.split('_')[0].upper()
-                    command_map[category][key] = command_details
+    def _write(self, result):
+        row = _result_row(result)
+        for key in self.command_keys:
+            sub = result.get("results", {}).get(key, {})
+            row += [sub.get("output", ""), sub.get("error", "")]
+        self._csv.writerow(row)
+        self._file.flush()
 
-            except json.JSONDecodeError:
-                print(f"Invalid JSON in file: {filename}")
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
-    return dict(command_map)
+    def _close(self):
+        self._file.close()
+
+class JsonlResultWriter(ResultWriter):
+    """One JSON object per line with the full result dict, flushed immediately."""
+
+    def _open(self):
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def _write(self, result):
+        self._file.write(json.dumps(result, default=str) + "\n")
+        self._file.flush()
 
-def load_json_commands2(directory):
+    def _close(self):
+        self._file.close()
+
+class XlsxResultWriter(ResultWriter):
+    """
+    An .xlsx only exists once it is saved, so during the run results go to a
+    JSONL sidecar (results_TIMESTAMP.partial.jsonl), flushed per host.
+    close() converts it to the workbook and removes it; after a crash the
+    sidecar is left holding every result written (see jsonl_to_xlsx).
     """
-    Load all JSON command files from a directory, grouped by prefix.
 
-    Returns:
-        dict: {
-            "CP": {"Show Syslog": {...}},
-            "POSIX": {"Disk Usage": {...}},
-        }
+    def _open(self):
+        self.sidecar = os.path.splitext(self.path)[0] + ".partial.jsonl"
+        self._file = open(self.sidecar, "w", encoding="utf-8")
+
+    def _write(self, result):
+        self._file.write(json.dumps(result, default=str) + "\n")
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+        jsonl_to_xlsx(self.sidecar, self.path, self.command_keys, self.summary)
+        os.remove(self.sidecar)
+
+def jsonl_to_xlsx(jsonl_path, xlsx_path, command_keys=(), summary=None):
+    """
+    Write the results in a JSONL file (the jsonl format, or a sidecar left by
+    an interrupted XLSX run) as a workbook laid out like XlsxResultWriter's.
+    openpyxl's write-only mode streams rows to temp files, so the sheet is
+    never built in memory.
     """
-    from collections import defaultdict
+    from openpyxl import Workbook
 
-    command_map = defaultdict(dict)
-    for filename in os.listdir(directory):
-        if filename.endswith(".json"):
-            filepath = os.path.join(directory, filename)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("SSH Results")
+    ws.append(RESULT_HEADERS)
+    titles = {"SSH Results"}
+    sheets = {}
+    for key in command_keys:
+        sheet = wb.create_sheet(_sheet_title(key, titles))
+        sheet.append(["Command", key])
+        sheet.append(RESULT_HEADERS)
+        sheets[key] = sheet
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
             try:
-                if os.path.getsize(filepath) == 0:
-                    print(f"Skipping empty file: {filename}")
-                    continue
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable line in {jsonl_path}: {line[:80]!r}")  # cut off by a crash
+                continue
+            ws.append(_result_row(result))
+            for key, sheet in sheets.items():
+                sheet.append(_result_row(result, result.get("results", {}).get(key, {})))
+    if summary:
+        sheet = wb.create_sheet(_sheet_title("Run Summary", titles))
+        for row in _summary_rows(summary):
+            sheet.append(row)
+    wb.save(xlsx_path)
 
-                with open(filepath, 'r') as f:
-                    command_data = json.load(f)
-                    if len(command_data) != 1:
-                        print(f"Skipping malformed JSON structure in: {filename}")
-                        continue
+RESULT_WRITERS = {
+    ".xlsx": XlsxResultWriter,
+    ".csv": CsvResultWriter,
+    ".jsonl": JsonlResultWriter,
+}
 
-                    key = list(command_data.keys())[0]
-                    command_details = command_data[key]
+def open_result_writer(path, command_keys=()):
+    """
+    Open a streaming writer chosen by the extension of path (.xlsx, .csv, .jsonl).
+    command_keys are the catalogue keys of a batch run (one sheet/column pair each).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in RESULT_WRITERS:
+        raise ValueError(f"Unsupported results format '{ext}': use {', '.join(RESULT_WRITERS)}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return RESULT_WRITERS[ext](path, command_keys)
 
-                    # Extract category from filename prefix
-                    category = filename.split('_')[0].upper()
-                    command_map[category][key] = command_details
+def _sheet_title(key, used_titles):
+    """Excel sheet names: max 31 chars, no []:*?/\\ and unique per workbook."""
+    title = re.sub(r"[\[\]:*?/\\]", "-", key)[:31].strip() or "Command"
+    base, n = title, 2
+    while title in used_titles:
+        suffix = f" ({n})"
+        title = base[:31 - len(suffix)] + suffix
+        n += 1
+    used_titles.add(title)
+    return title
 
-            except json.JSONDecodeError:
-                print(f"Invalid JSON in file: {filename}")
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
-    return dict(command_map)
+def load_csv(file_path):
+    """
+    Read CSV and return list of host dictionaries.
+    Each host gets a row_id (its position) that results carry back to the GUI.
+    Rows are validated and deduplicated by inventory.iter_hosts; skipped rows
+    are printed.  Optional username, jump_host and tags columns are kept.
+
+    Raises:
+        InventoryError: The file cannot be read or lacks a required column.
+    """
+    from inventory import load_inventory
 
+    hosts, errors = load_inventory([file_path])
+    for error in errors:
+        print(f"Skipping host row {error}")
+    return hosts
 
+def load_json_commands(directory):
+    """
+    Load all JSON command files from a directory, grouped by uppercased prefix.
+    One-shot wrapper around catalogue.CommandCatalogue; see there for the
+    entry format (commands, bundles, "parse", "cache_ttl").
 
+    Returns:
+        dict: {
+            "CP": {"Show Syslog": {...}},
+            "POSIX": {"Disk Usage": {...}},
+        }
+    """
+    from catalogue import CommandCatalogue
+
+    return CommandCatalogue(directory).categorized
 
+def flatten_commands(categorized):
+    """Flatten load_json_commands output to {"CATEGORY: Label": command_info}."""
+    commands = {}
+    for category in sorted(categorized.keys()):
+        for label in sorted(categorized[category].keys()):
+            commands[f"{category}: {label}"] = categorized[category][label]
+    return commands
+
+def resolve_commands(commands, keys):
+    """
+    Expand selected keys (including bundles) into an ordered
+    {full_key: command_info} map of runnable catalogue entries.
+    Unknown keys are reported and skipped.
+    """
+    resolved = {}
+    for key in keys:
+        command_info = commands.get(key, {})
+        members = command_info["bundle"] if "bundle" in command_info else [key]
+        for member in members:
+            member_info = commands.get(member)
+            if member_info and "command" in member_info:
+                resolved[member] = member_info
+            else:
+                print(f"Skipping unknown command '{member}' in selection")
+    return resolved
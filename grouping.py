@@ -0,0 +1,116 @@
+# grouping.py
+"""
+Output deduplication and grouping.
+On a fleet of near identical servers most hosts return the same text.
+OutputGroups keeps one copy of each distinct output / error string (the
+dict lookup hashes the content, so a repeat is found without comparing it
+against every host) and files every host under its (output, error) pair, so
+a run of 5,000 hosts reads as a handful of groups:
+
+    4,812 hosts: 5.14.0-362.el9.x86_64
+       37 hosts: 4.18.0-513.el8.x86_64
+        3 hosts: Error: Authentication failed
+"""
+
+LABEL_WIDTH = 80
+
+
+def group_label(key, width=LABEL_WIDTH):
+    """One-line description of a group key: the error if any, else the output (first line, shortened)."""
+    output, error = key
+    text = f"Error: {error}" if error else output or "(no output)"
+    lines = text.strip().splitlines() or [""]
+    line = lines[0] + (" ..." if len(lines) > 1 else "")
+    return line if len(line) <= width else line[:width - 3] + "..."
+
+
+class OutputGroups:
+    """
+    Shared storage for host results, plus the grouping of hosts by result.
+
+    add() replaces a result's strings with the stored copy before the result
+    is merged into its host, so identical outputs across hosts are one string
+    in memory.  Hosts are identified by their index (row_id).  A host added
+    again (a result for it arrives twice) moves to its new group.
+    """
+
+    def __init__(self):
+        self._strings = {}  # text -> the single stored copy
+        self._groups = {}  # (output, error) -> set of host indices
+        self._members = {}  # host index -> (output, error)
+
+    def intern(self, text):
+        if not isinstance(text, str) or not text:
+            return text
+        return self._strings.setdefault(text, text)
+
+    def add(self, index, result):
+        """Intern result's output / error strings (in place) and file host index under them."""
+        self._intern_fields(result)
+        for sub in (result.get("results") or {}).values():
+            self._intern_fields(sub)
+        key = (result.get("output") or "", result.get("error") or "")
+        self.discard(index)
+        self._groups.setdefault(key, set()).add(index)
+        self._members[index] = key
+        return key
+
+    def _intern_fields(self, result):
+        for field in ("output", "error"):
+            if field in result:
+                result[field] = self.intern(result[field])
+        fields = result.get("fields")
+        if fields:
+            for name, value in fields.items():
+                fields[name] = self.intern(value)
+
+    def discard(self, index):
+        key = self._members.pop(index, None)
+        if key is not None:
+            members = self._groups[key]
+            members.discard(index)
+            if not members:
+                del self._groups[key]
+
+    def clear(self):
+        """Forget every host and stored string (new run)."""
+        self._strings.clear()
+        self._groups.clear()
+        self._members.clear()
+
+    def key_of(self, index):
+        """(output, error) of host index, or None if it has no result yet."""
+        return self._members.get(index)
+
+    def members(self, key):
+        return self._groups.get(key, set())
+
+    def groups(self):
+        """[(key, host indices)] largest group first, then successes before errors."""
+        return sorted(self._groups.items(), key=lambda item: (-len(item[1]), bool(item[0][1]), item[0]))
+
+    def summary(self, limit=None):
+        """
+        Plain data for reports: a list of {"output", "error", "count", "rows"}
+        dicts, largest first (at most limit groups).
+        """
+        return [
+            {"output": key[0], "error": key[1], "count": len(members), "rows": sorted(members)}
+            for key, members in self.groups()[:limit]
+        ]
+
+    def __len__(self):
+        return len(self._groups)
+
+
+def format_groups(groups, limit=20):
+    """
+    Text rendering of OutputGroups.groups(): one line per group, hosts per
+    group first.  Beyond limit groups (None = all) the rest are counted.
+    """
+    shown = groups if limit is None else groups[:limit]
+    lines = [f"{len(members):>7,} hosts: {group_label(key)}" for key, members in shown]
+    hidden = groups[len(shown):]
+    if hidden:
+        lines.append(f"... and {len(hidden):,} more groups ({sum(len(m) for _, m in hidden):,} hosts)")
+    return "\n".join(lines)
@@ -0,0 +1,327 @@
+# history.py
+"""
+Run history (SQLite).
+Every run is recorded as it happens: one row per run (command, counters,
+run summary) and one row per host and command with its output, parsed value,
+error and timings.  Results are indexed by (run_id, ip, port, jump_host,
+command_key), the same private address behind two bastions being two hosts
+(jump_host as inventory.jump_host_key resolves it), so diffing two runs is a
+single indexed join in the database rather than reloading the exported
+workbooks.
+
+Re-running a run's failed hosts adds no run of its own: the new results
+replace the failed ones in the original run (finish_run(merged=True)), so
+"the previous run" is always a complete sweep.
+
+The "value" compared between runs is what the parse patterns extracted: the
+named fields (as sorted JSON) when the command has them, else the output.
+Hosts that failed have no value.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from config import HISTORY_PATH, HISTORY_MAX_RUNS
+from inventory import jump_host_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    label TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    engine TEXT,
+    total INTEGER NOT NULL,
+    completed INTEGER,
+    failed INTEGER,
+    cancelled INTEGER,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_signature ON runs (signature, id);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    jump_host TEXT NOT NULL DEFAULT '',
+    command_key TEXT NOT NULL,
+    hostname TEXT,
+    output TEXT,
+    value TEXT,
+    error TEXT,
+    duration REAL,
+    timings TEXT,
+    PRIMARY KEY (run_id, ip, port, jump_host, command_key)
+);
+"""
+
+_RESULT_COLUMNS = "run_id, ip, port, jump_host, command_key, hostname, output, value, error, duration, timings"
+
+
+def _migrate(db):
+    """Bring a history file written by an older version up to _SCHEMA."""
+    columns = [row[1] for row in db.execute("PRAGMA table_info(results)")]
+    if columns and "jump_host" not in columns:
+        # The primary key changes, so the table is rebuilt; old rows had no jump host
+        db.execute("ALTER TABLE results RENAME TO results_old")
+        db.executescript(_SCHEMA)
+        kept = _RESULT_COLUMNS.replace("jump_host, ", "")
+        db.execute(f"INSERT INTO results ({kept}) SELECT {kept} FROM results_old")
+        db.execute("DROP TABLE results_old")
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def command_signature(command_info):
+    """
+    Identify what a run executed: the (key, command, parse) of each command.
+    Runs with the same signature are comparable.
+    """
+    commands = command_info["batch"] if "batch" in command_info else {"": command_info}
+    return json.dumps([[key, info["command"], info["parse"]] for key, info in sorted(commands.items())])
+
+
+def command_label(command_info):
+    if "batch" in command_info:
+        return ", ".join(command_info["batch"])
+    return command_info["command"]
+
+
+def parsed_value(sub):
+    """The comparable value of one command's result, or None if it failed."""
+    if sub.get("error"):
+        return None
+    if sub.get("fields"):
+        return json.dumps(sub["fields"], sort_keys=True)
+    return sub.get("output", "")
+
+
+def first_number(value):
+    """First number in a value ("87%" -> 87.0), or None."""
+    match = _NUMBER.search(value or "")
+    return float(match.group()) if match else None
+
+
+class RunHistory:
+    """
+    Thread-safe wrapper around one SQLite history file.
+
+    record() buffers rows and commits every `batch` rows (and on
+    finish_run/close), so recording a large sweep costs a handful of commits.
+    """
+
+    def __init__(self, path=HISTORY_PATH, batch=500, max_runs=HISTORY_MAX_RUNS):
+        self.path = path
+        self.batch = batch
+        self.max_runs = max_runs
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        _migrate(self._db)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def begin_run(self, command_info, total, engine=None):
+        """Create the run row; returns its id."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO runs (started_at, label, signature, engine, total) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), command_label(command_info), command_signature(command_info), engine, total),
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def record(self, run_id, result, command_keys=("",)):
+        """
+        Buffer one host's result: one row per command key ("" for a single
+        command, the batch keys for a batch).
+        """
+        if result.get("ip") is None:
+            return
+        ip, port, jump_host = str(result["ip"]), int(result.get("port") or 0), jump_host_key(result.get("jump_host"))
+        timings = json.dumps(result.get("timings") or {})
+        duration = result.get("duration")
+        subs = result.get("results") or {}
+        rows = []
+        for key in command_keys:
+            sub = subs.get(key) if key else result
+            if sub is None:
+                # The host failed before its commands ran; the error is on the host only
+                sub = {"output": "", "error": result.get("error") or "No result"}
+            rows.append((run_id, ip, port, jump_host, key, result.get("hostname"), sub.get("output", ""),
+                         parsed_value(sub), sub.get("error", ""), duration, timings))
+        with self._lock:
+            self._pending.extend(rows)
+            if len(self._pending) >= self.batch:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        try:
+            self._db.executemany(f"INSERT OR REPLACE INTO results ({_RESULT_COLUMNS}) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Failed to write run history {self.path}: {e}")
+        self._pending = []
+
+    def finish_run(self, run_id, summary=None, merged=False):
+        """
+        Flush the run's rows, store its summary and drop runs beyond max_runs.
+
+        merged: the rows were a re-run of some of run_id's hosts, recorded
+        over their earlier results; run_id keeps its own summary and totals
+        and only its failed count is recounted from the merged results.
+        """
+        summary = summary or {}
+        with self._lock:
+            self._flush_locked()
+            try:
+                if merged:
+                    self._merge_locked(run_id)
+                else:
+                    self._db.execute(
+                        "UPDATE runs SET finished_at=?, total=COALESCE(?, total), completed=?, failed=?, "
+                        "cancelled=?, summary=? WHERE id=?",
+                        (time.time(), summary.get("total"), summary.get("completed"), summary.get("failed"),
+                         int(bool(summary.get("cancelled"))), json.dumps(summary), run_id),
+                    )
+                self._prune_locked()
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Failed to write run history {self.path}: {e}")
+
+    def _merge_locked(self, run_id):
+        failed = self._db.execute(
+            "SELECT COUNT(*) FROM (SELECT DISTINCT ip, port, jump_host FROM results "
+            "WHERE run_id=? AND error IS NOT NULL AND error != '')", (run_id,)
+        ).fetchone()[0]
+        row = self._db.execute("SELECT summary FROM runs WHERE id=?", (run_id,)).fetchone()
+        if row is None:
+            return
+        summary = json.loads(row[0]) if row[0] else {}
+        summary["failed"] = failed
+        summary["reruns"] = summary.get("reruns", 0) + 1
+        self._db.execute("UPDATE runs SET failed=?, summary=? WHERE id=?", (failed, json.dumps(summary), run_id))
+
+    def _prune_locked(self):
+        if not self.max_runs:
+            return
+        old = [row[0] for row in self._db.execute(
+            "SELECT id FROM runs ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_runs,))]
+        if old:
+            marks = ",".join("?" * len(old))
+            self._db.execute(f"DELETE FROM results WHERE run_id IN ({marks})", old)
+            self._db.execute(f"DELETE FROM runs WHERE id IN ({marks})", old)
+
+    def runs(self, limit=20):
+        """Latest runs first, as dicts (without their summaries)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, started_at, finished_at, label, engine, total, completed, failed, cancelled "
+                "FROM runs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        keys = ("id", "started_at", "finished_at", "label", "engine", "total", "completed", "failed", "cancelled")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def previous_run(self, run_id):
+        """
+        Id of the latest finished run before run_id with the same commands, or
+        None.  Re-runs of failed hosts are merged into their run, so this is
+        always a full sweep.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM runs WHERE signature = (SELECT signature FROM runs WHERE id=?) "
+                "AND id < ? AND finished_at IS NOT NULL ORDER BY id DESC LIMIT 1", (run_id, run_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def diff(self, old_run, new_run, threshold=None):
+        """
+        Hosts whose parsed value differs between two runs.
+
+        A host counts as changed when its value changed, or it succeeded in
+        one run and failed in the other.  With threshold, changes between two
+        numeric values (the first number in each, e.g. "87%") are only
+        reported when they cross it; other changes are always reported.
+
+        Returns:
+            dict: old_run, new_run, compared (rows present in both),
+            changed (list of dicts: hostname, ip, port, jump_host,
+            command_key, old, new, old_error, new_error), added and removed
+            ((ip, port, jump_host) present in only one of the runs).
+        """
+        with self._lock:
+            self._flush_locked()
+            compared = self._db.execute(
+                "SELECT COUNT(*) FROM results n JOIN results o "
+                "ON o.run_id=? AND o.ip=n.ip AND o.port=n.port AND o.jump_host=n.jump_host "
+                "AND o.command_key=n.command_key WHERE n.run_id=?", (old_run, new_run)
+            ).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT n.hostname, n.ip, n.port, n.jump_host, n.command_key, o.value, n.value, o.error, n.error "
+                "FROM results n JOIN results o "
+                "ON o.run_id=? AND o.ip=n.ip AND o.port=n.port AND o.jump_host=n.jump_host "
+                "AND o.command_key=n.command_key "
+                "WHERE n.run_id=? AND o.value IS NOT n.value "
+                "ORDER BY n.ip, n.port, n.jump_host, n.command_key", (old_run, new_run)
+            ).fetchall()
+            added = self._only_in(new_run, old_run)
+            removed = self._only_in(old_run, new_run)
+
+        changed = []
+        for hostname, ip, port, jump_host, key, old, new, old_error, new_error in rows:
+            if threshold is not None and old is not None and new is not None:
+                a, b = first_number(old), first_number(new)
+                if a is not None and b is not None and not min(a, b) < threshold <= max(a, b):
+                    continue
+            changed.append({
+                "hostname": hostname, "ip": ip, "port": port, "jump_host": jump_host, "command_key": key,
+                "old": old, "new": new, "old_error": old_error, "new_error": new_error,
+            })
+        return {"old_run": old_run, "new_run": new_run, "compared": compared,
+                "changed": changed, "added": added, "removed": removed}
+
+    def _only_in(self, run_id, other_run):
+        return self._db.execute(
+            "SELECT DISTINCT a.ip, a.port, a.jump_host FROM results a WHERE a.run_id=? AND NOT EXISTS "
+            "(SELECT 1 FROM results b WHERE b.run_id=? AND b.ip=a.ip AND b.port=a.port AND b.jump_host=a.jump_host) "
+            "ORDER BY a.ip, a.port, a.jump_host", (run_id, other_run)
+        ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._db.close()
+
+
+def format_diff(diff, limit=500):
+    """Human-readable rendering of RunHistory.diff() for the GUI and CLI (at most limit changes listed)."""
+    changed = diff["changed"]
+    lines = [
+        f"Run {diff['new_run']} vs run {diff['old_run']}: {len(changed)} changed of {diff['compared']} compared"
+        + (f", {len(diff['added'])} new hosts" if diff["added"] else "")
+        + (f", {len(diff['removed'])} hosts missing" if diff["removed"] else ""),
+    ]
+    for row in changed[:limit]:
+        old = row["old"] if row["old"] is not None else f"ERROR {row['old_error']}"
+        new = row["new"] if row["new"] is not None else f"ERROR {row['new_error']}"
+        where = f"{row['hostname'] or ''} {row['ip']}:{row['port']}".strip()
+        if row.get("jump_host"):
+            where += f" via {row['jump_host']}"
+        if row["command_key"]:
+            where += f" [{row['command_key']}]"
+        lines.append(f"{where}: {old!r} -> {new!r}")
+    if limit is not None and len(changed) > limit:
+        lines.append(f"... {len(changed) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,444 @@
+# host_table.py
+"""
+Virtualized host table for the GUI.
+Only the rows that fit on screen exist as Treeview items; scrolling re-fills
+them from the host list.  Supports sorting by column, filtering by status (or
+to the hosts a run diff marked as changed) and keeps running
+Pending/Complete/Error/Unreachable counts.  "Group by output" folds hosts
+with identical results (grouping.OutputGroups) into one expandable row each.
+"""
+
+import ipaddress
+import tkinter as tk
+from tkinter import ttk
+
+from grouping import group_label
+
+COLUMNS = ("Hostname", "IP", "Port", "Status")
+STATUSES = ("Pending", "Complete", "Error", "Unreachable")
+FILTERS = ("All",) + STATUSES + ("Changed",)
+
+
+def _ip_key(value):
+    try:
+        ip = ipaddress.ip_address(value)
+        return (0, ip.version, int(ip), "")
+    except ValueError:
+        return (1, 0, 0, str(value or "").lower())
+
+
+def _port_key(value):
+    try:
+        return (0, int(value))
+    except (TypeError, ValueError):
+        return (1, 0)
+
+
+SORT_KEYS = {
+    "Hostname": lambda host: str(host.get("hostname") or "").lower(),
+    "IP": lambda host: _ip_key(host.get("ip")),
+    "Port": lambda host: _port_key(host.get("port")),
+    "Status": lambda host: host.get("status", "Pending"),
+}
+
+
+class VirtualHostTable(ttk.Frame):
+    """
+    Scrollable host table that materializes only visible rows.
+
+    Hosts are the dicts from load_csv; the table reads hostname/ip/port and a
+    "status" key it maintains through set_status().  on_select is called with
+    the index (row_id) of the host the user selects.
+
+    When grouped, group rows ("group", key) head the hosts sharing that
+    result, largest group first; hosts show under a group once it is
+    expanded (click it, or Enter).  on_group_select is called with the key
+    ((output, error), or None for hosts without a result yet) and the
+    group's host indices that pass the filter.
+    """
+
+    def __init__(self, parent, on_select=None, on_group_select=None):
+        super().__init__(parent)
+        self.on_select = on_select
+        self.on_group_select = on_group_select
+        self.hosts = []
+        self.view = []  # host indices (and ("group", key) rows) in display order after filter + sort
+        self.offset = 0  # view position of the first visible row
+        self.visible_rows = 20
+        self.sort_column = None
+        self.sort_reverse = False
+        self.status_filter = "All"
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self.changed = None  # host indices from the latest diff, None when not diffed
+        self.selected_index = None  # host index or ("group", key) of the selected row
+        self.groups = None  # OutputGroups the grouped view is built from
+        self.grouped = False
+        self.expanded = set()  # group keys showing their hosts
+        self._group_members = {}  # group key -> host indices in the view
+        self._member_keys = {}  # host index -> its group key in the view
+        self._view_stale = False
+        self._moved = set()  # host indices whose status changed since the view was built
+        self._items = []  # Treeview item ids, one per visible row
+        self._item_hosts = {}  # item id -> host index currently shown in it
+
+        # Filter bar and aggregate counts
+        bar = ttk.Frame(self)
+        bar.pack(fill="x", pady=(0, 2))
+        ttk.Label(bar, text="Show:").pack(side="left")
+        self.filter_var = tk.StringVar(value="All")
+        filter_box = ttk.Combobox(bar, textvariable=self.filter_var, values=FILTERS, state="readonly", width=12)
+        filter_box.pack(side="left", padx=(5, 10))
+        filter_box.bind("<<ComboboxSelected>>", self._on_filter)
+        self.grouped_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(bar, text="Group by output", variable=self.grouped_var,
+                        command=self._on_group_toggle).pack(side="left", padx=(0, 10))
+        self.counts_label = ttk.Label(bar, text="")
+        self.counts_label.pack(side="left", fill="x")
+
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True)
+
+        self.tree = ttk.Treeview(body, columns=COLUMNS, show="headings", selectmode="browse")
+        for column in COLUMNS:
+            self.tree.heading(column, text=column, anchor="w", command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, anchor="w")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<Return>", lambda e: self._toggle_group(self.selected_index))
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self.visible_rows))
+
+        self._update_counts_label()
+
+    # Data
+
+    def set_hosts(self, hosts):
+        """Replace the host list; every host starts Pending."""
+        self.hosts = hosts
+        for host in hosts:
+            host["status"] = "Pending"
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self.counts["Pending"] = len(hosts)
+        self.changed = None
+        self.expanded.clear()
+        if self.status_filter == "Changed":
+            self.status_filter = "All"
+            self.filter_var.set("All")
+        self.offset = 0
+        self.selected_index = None
+        self._rebuild_view()
+        self.refresh()
+
+    def reset_statuses(self):
+        """Mark every host Pending again (new run over the same list)."""
+        self.set_hosts(self.hosts)
+
+    def set_status(self, index, status):
+        """Record a host's new status.  Call refresh() once after a batch of updates."""
+        host = self.hosts[index]
+        old = host.get("status", "Pending")
+        if old == status:
+            return
+        self.counts[old] -= 1
+        self.counts[status] += 1
+        host["status"] = status
+        # Status only changes membership / order when filtering or sorting on
+        # it, or when grouped (the host has a result to be grouped by now)
+        if self.status_filter != "All" or self.sort_column == "Status" or self.grouped:
+            self._moved.add(index)
+
+    def set_changed(self, indices):
+        """Remember the hosts a diff found changed and show only them ("Changed" filter)."""
+        self.changed = set(indices)
+        self.filter_var.set("Changed")
+        self._on_filter()
+
+    def set_groups(self, groups):
+        """Use groups (OutputGroups, kept up to date by the caller) for the grouped view."""
+        self.groups = groups
+        if self.grouped:
+            self._view_stale = True
+
+    def refresh(self):
+        """Redraw the visible rows and counts."""
+        if self._view_stale:
+            self._rebuild_view()
+        elif self._moved:
+            self._move_rows()
+        self._render()
+        self._update_counts_label()
+
+    # Sorting / filtering
+
+    def sort_by(self, column):
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column, self.sort_reverse = column, False
+        for c in COLUMNS:
+            arrow = (" v" if self.sort_reverse else " ^") if c == self.sort_column else ""
+            self.tree.heading(c, text=c + arrow)
+        self._rebuild_view()
+        self.refresh()
+
+    def _on_group_toggle(self):
+        self.grouped = self.grouped_var.get() and self.groups is not None
+        self.offset = 0
+        self._rebuild_view()
+        self.refresh()
+
+    def _on_filter(self, event=None):
+        self.status_filter = self.filter_var.get()
+        self.offset = 0
+        self._rebuild_view()
+        self.refresh()
+
+    def _rebuild_view(self):
+        indices = range(len(self.hosts))
+        if self.status_filter == "Changed":
+            changed = self.changed or set()
+            indices = [i for i in indices if i in changed]
+        elif self.status_filter != "All":
+            wanted = self.status_filter
+            indices = [i for i in indices if self.hosts[i].get("status", "Pending") == wanted]
+        if self.sort_column:
+            key = SORT_KEYS[self.sort_column]
+            indices = sorted(indices, key=lambda i: key(self.hosts[i]), reverse=self.sort_reverse)
+        self.view = self._group_view(indices) if self.grouped else list(indices)
+        self._view_stale = False
+        self._moved.clear()
+        self._clamp_offset()
+
+    def _move_rows(self):
+        """
+        Update the view for the hosts whose status changed since it was built:
+        take them out and insert the ones still passing the filter at their
+        sorted position, instead of re-filtering and re-sorting every host on
+        each refresh of a large run.
+        """
+        moved, self._moved = self._moved, set()
+        if self.grouped:
+            old_keys = {self._member_keys.pop(index) for index in moved if index in self._member_keys}
+            for key in old_keys:
+                if key in self._group_members:
+                    rows = [i for i in self._group_members[key] if i not in moved]
+                    if rows:
+                        self._group_members[key] = rows
+                    else:
+                        del self._group_members[key]
+            for index in sorted(moved):
+                if self._passes(index):
+                    key = self.groups.key_of(index)
+                    self._insert(self._group_members.setdefault(key, []), index)
+                    self._member_keys[index] = key
+            self.view = self._assemble_groups()
+        else:
+            self.view = [i for i in self.view if i not in moved]
+            for index in sorted(moved):
+                if self._passes(index):
+                    self._insert(self.view, index)
+        self._clamp_offset()
+
+    def _passes(self, index):
+        if self.status_filter == "Changed":
+            return index in (self.changed or ())
+        return self.status_filter == "All" or self.hosts[index].get("status", "Pending") == self.status_filter
+
+    def _insert(self, rows, index):
+        """Insert host index into rows (ordered as _rebuild_view sorts them) by binary search."""
+        lo, hi = 0, len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._before(rows[mid], index):
+                lo = mid + 1
+            else:
+                hi = mid
+        rows.insert(lo, index)
+
+    def _before(self, a, b):
+        """True if host a sorts ahead of host b (ties keep host order, as sorted() does)."""
+        if self.sort_column:
+            key = SORT_KEYS[self.sort_column]
+            key_a, key_b = key(self.hosts[a]), key(self.hosts[b])
+            if key_a != key_b:
+                return key_b < key_a if self.sort_reverse else key_a < key_b
+        return a < b
+
+    def _group_view(self, indices):
+        """Group rows in place of the hosts, each followed by its hosts when expanded."""
+        members = {}
+        keys = {}
+        for index in indices:
+            key = keys[index] = self.groups.key_of(index)
+            members.setdefault(key, []).append(index)
+        self._group_members = members
+        self._member_keys = keys
+        return self._assemble_groups()
+
+    def _assemble_groups(self):
+        members = self._group_members
+        view = []
+        for key in [key for key, _ in self.groups.groups()] + [None]:
+            if key in members:
+                view.append(("group", key))
+                if key in self.expanded:
+                    view += members[key]
+        return view
+
+    def _toggle_group(self, entry):
+        if not isinstance(entry, tuple):
+            return
+        key = entry[1]
+        if key in self.expanded:
+            self.expanded.discard(key)
+        else:
+            self.expanded.add(key)
+        self._rebuild_view()
+        self.refresh()
+        return "break"
+
+    # Rendering
+
+    def _render(self):
+        # Grow or shrink the pool of Treeview items to the visible row count
+        wanted = min(self.visible_rows, max(0, len(self.view) - self.offset))
+        while len(self._items) < wanted:
+            self._items.append(self.tree.insert("", "end", values=("", "", "", "")))
+        while len(self._items) > wanted:
+            self.tree.delete(self._items.pop())
+
+        self._item_hosts = {}
+        selected_item = None
+        for pos, item_id in enumerate(self._items):
+            index = self.view[self.offset + pos]
+            if isinstance(index, tuple):
+                self.tree.item(item_id, values=self._group_values(index[1]))
+            else:
+                host = self.hosts[index]
+                self.tree.item(item_id, values=(
+                    ("    " if self.grouped else "") + str(host.get("hostname", "")),
+                    host.get("ip", ""), host.get("port", ""), host.get("status", "Pending")
+                ))
+            self._item_hosts[item_id] = index
+            if index == self.selected_index:
+                selected_item = item_id
+
+        # Keep the highlight on the selected host, not on a screen position
+        current = self.tree.selection()
+        if selected_item and current != (selected_item,):
+            self.tree.selection_set(selected_item)
+            self.tree.focus(selected_item)
+        elif not selected_item and current:
+            self.tree.selection_remove(*current)
+
+        total = len(self.view)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _group_values(self, key):
+        arrow = "-" if key in self.expanded else "+"
+        count = len(self._group_members.get(key, ()))
+        if key is None:
+            return (f"[{arrow}] {count:,} hosts: no result yet", "", "", "Pending")
+        return (f"[{arrow}] {count:,} hosts: {group_label(key)}", "", "", "Error" if key[1] else "Complete")
+
+    def _update_counts_label(self):
+        c = self.counts
+        self.counts_label.config(
+            text=f"{len(self.hosts)} hosts | Pending {c['Pending']} | Complete {c['Complete']} | Error {c['Error']}"
+                 + (f" | Unreachable {c['Unreachable']}" if c["Unreachable"] else "")
+                 + (f" | Changed {len(self.changed)}" if self.changed is not None else "")
+                 + (f" | {len(self.groups)} distinct results" if self.grouped else "")
+        )
+
+    # Scrolling
+
+    def scroll(self, rows):
+        self.offset += rows
+        self._clamp_offset()
+        self._render()
+
+    def _clamp_offset(self):
+        self.offset = max(0, min(self.offset, len(self.view) - self.visible_rows))
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.offset = int(float(amount) * len(self.view))
+            self._clamp_offset()
+            self._render()
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll(int(amount) * step)
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(float(style.lookup("Treeview", "rowheight") or 20))
+        # One row's worth of height is taken by the heading
+        rows = max(1, event.height // row_height - 1)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._clamp_offset()
+            self._render()
+
+    # Selection
+
+    def _on_click(self, event):
+        # A click on a group row expands / collapses it, selected or not
+        entry = self._item_hosts.get(self.tree.identify_row(event.y))
+        if not isinstance(entry, tuple):
+            return None
+        self.selected_index = entry
+        self._toggle_group(entry)
+        self._notify(entry)
+        return "break"
+
+    def _on_tree_select(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        index = self._item_hosts.get(selection[0])
+        if index is None or index == self.selected_index:
+            return
+        self.selected_index = index
+        self._notify(index)
+
+    def _notify(self, entry):
+        if isinstance(entry, tuple):
+            if self.on_group_select:
+                self.on_group_select(entry[1], self._group_members.get(entry[1], []))
+        elif self.on_select:
+            self.on_select(entry)
+
+    def _move_selection(self, step):
+        if not self.view:
+            return "break"
+        try:
+            pos = self.view.index(self.selected_index) + step
+        except ValueError:
+            pos = self.offset
+        pos = max(0, min(pos, len(self.view) - 1))
+        if pos < self.offset:
+            self.offset = pos
+        elif pos >= self.offset + self.visible_rows:
+            self.offset = pos - self.visible_rows + 1
+        self.selected_index = self.view[pos]
+        self._render()
+        self._notify(self.selected_index)
+        return "break"
@@ -0,0 +1,220 @@
+# hostkeys.py
+"""
+Host key verification.
+One HostKeyStore is loaded per session (GUI) or run (CLI) and shared by all
+workers: the known_hosts files are parsed once into a dict keyed by host
+name, so checking a key is a dict lookup rather than a file read or a scan
+of every entry.  Keys learned during the run are appended to KNOWN_HOSTS_PATH
+by save().
+
+Modes (HOST_KEY_MODE):
+    strict  only hosts already in known_hosts; unknown or changed keys are rejected
+    tofu    trust on first use: unknown keys are recorded, changed keys rejected
+    warn    like tofu, but a changed key is only reported
+    off     no checking (paramiko's AutoAddPolicy behaviour)
+
+The store also remembers which host key type and cipher each host
+negotiated.  prefer() puts them first on the next connection, so the server
+keeps presenting the key type that is on record (instead of a second key of
+another type that would read as unknown) and the same cipher is picked.
+"""
+
+import os
+import threading
+
+import paramiko
+from paramiko.hostkeys import HostKeyEntry
+
+from config import HOST_KEY_MODE, KNOWN_HOSTS_PATH, KNOWN_HOSTS_SYSTEM, DEBUG
+from inventory import parse_jump_host
+
+HOST_KEY_MODES = ("strict", "tofu", "warn", "off")
+
+# Signature algorithms a stored key of each type can be negotiated as
+KEY_ALGORITHMS = {
+    "ssh-rsa": ("rsa-sha2-512", "rsa-sha2-256", "ssh-rsa"),
+}
+
+
+class HostKeyError(paramiko.SSHException):
+    """A host key was rejected (unknown in strict mode, or changed)."""
+
+
+def _address_name(ip, port):
+    return ip if int(port) == 22 else f"[{ip}]:{port}"
+
+
+def host_key_name(host_info):
+    """
+    known_hosts name of a host: "ip" on port 22, "[ip]:port" otherwise.  A
+    host behind a jump host is qualified with the bastion ("10.0.0.5%bastion1",
+    "[10.0.0.5]:2222%[bastion1]:2200"), as the same private address behind
+    two bastions is two machines with their own keys.
+    """
+    name = _address_name(host_info["ip"], host_info["port"])
+    jump_host = host_info.get("jump_host")
+    if jump_host:
+        try:
+            _, host, port = parse_jump_host(jump_host)
+            name += "%" + _address_name(host, port)
+        except ValueError:
+            name += "%" + jump_host.strip()
+    return name
+
+
+def fingerprint(key):
+    return ":".join(f"{b:02x}" for b in key.get_fingerprint())
+
+
+def key_from_openssh(text):
+    """paramiko key from an OpenSSH public key line ("type base64 [comment]"), or None."""
+    entry = HostKeyEntry.from_line(f"host {text.strip()}")
+    return entry.key if entry else None
+
+
+class HostKeyStore:
+    """
+    Thread-safe known_hosts cache.
+
+    system_path (the user's ~/.ssh/known_hosts) is trusted but never written;
+    path is read and appended to.  stats() counts verified, learned, changed
+    and rejected keys since the store was created.
+    """
+
+    def __init__(self, path=KNOWN_HOSTS_PATH, mode=HOST_KEY_MODE, system_path=KNOWN_HOSTS_SYSTEM):
+        if mode not in HOST_KEY_MODES:
+            raise ValueError(f"Unknown host key mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._keys = {}  # host name -> {key type: key}
+        self._hashed = []  # (hashed name, key) entries, checked only when a name is not in _keys
+        self._new = []  # entries learned since the last save()
+        self._algorithms = {}  # host name -> (host key type, cipher) last negotiated
+        self._counts = {"verified": 0, "learned": 0, "changed": 0, "rejected": 0}
+        self._lock = threading.Lock()
+        if system_path:
+            self._load(os.path.expanduser(system_path))
+        self._load(path)
+
+    def _load(self, path):
+        try:
+            with open(path, "r") as f:
+                for lineno, line in enumerate(f, 1):
+                    try:
+                        entry = HostKeyEntry.from_line(line, lineno)
+                    except (paramiko.SSHException, ValueError):
+                        continue
+                    if entry is None or entry.key is None:
+                        continue
+                    for name in entry.hostnames:
+                        if name.startswith("|1|"):
+                            self._hashed.append((name, entry.key))
+                        else:
+                            self._keys.setdefault(name, {})[entry.key.get_name()] = entry.key
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Cannot read known hosts {path}: {e}")
+
+    def _known_locked(self, name):
+        known = self._keys.get(name)
+        if known is None:
+            # Hashed entries cost one HMAC each; scan them once per name and keep the outcome
+            known = self._keys[name] = {}
+            for hashed, key in self._hashed:
+                if paramiko.HostKeys.hash_host(name, hashed) == hashed:
+                    known[key.get_name()] = key
+        return known
+
+    def trusted(self, host_info):
+        """Keys on record for host_info (empty list if unknown)."""
+        with self._lock:
+            return list((self._known_locked(host_key_name(host_info)) or {}).values())
+
+    def prefer(self, transport, host_info):
+        """Before start_client(): put the key types on record and the last cipher first."""
+        if self.mode == "off":
+            return
+        name = host_key_name(host_info)
+        with self._lock:
+            known = self._known_locked(name)
+            key_type, cipher = self._algorithms.get(name, (None, None))
+        wanted = []
+        for kind in ([key_type] if key_type else []) + list(known or ()):
+            wanted += [alg for alg in KEY_ALGORITHMS.get(kind, (kind,)) if alg not in wanted]
+        options = transport.get_security_options()
+        if wanted:
+            supported = list(options.key_types)
+            first = [alg for alg in wanted if alg in supported]
+            if first:
+                options.key_types = first + [alg for alg in supported if alg not in first]
+        if cipher and cipher in options.ciphers:
+            options.ciphers = [cipher] + [c for c in options.ciphers if c != cipher]
+
+    def check(self, transport, host_info):
+        """After start_client(): verify the server's key and remember what was negotiated."""
+        self.verify(host_info, transport.get_remote_server_key())
+        with self._lock:
+            self._algorithms[host_key_name(host_info)] = (
+                getattr(transport, "host_key_type", None), getattr(transport, "local_cipher", None)
+            )
+
+    def verify(self, host_info, key):
+        """
+        Accept, record or reject key for host_info according to the mode.
+
+        Raises:
+            HostKeyError: The key is unknown (strict) or differs from the one on record (strict, tofu).
+        """
+        if self.mode == "off":
+            return
+        name = host_key_name(host_info)
+        with self._lock:
+            known = self._known_locked(name)
+            if not known:
+                if self.mode == "strict":
+                    self._counts["rejected"] += 1
+                    raise HostKeyError(f"{name} is not in known_hosts ({key.get_name()} {fingerprint(key)})")
+                self._keys.setdefault(name, {})[key.get_name()] = key
+                self._new.append(HostKeyEntry([name], key))
+                self._counts["learned"] += 1
+                if DEBUG:
+                    print(f"[DEBUG] Learned host key for {name}: {key.get_name()} {fingerprint(key)}")
+                return
+            if known.get(key.get_name()) == key:
+                self._counts["verified"] += 1
+                return
+            self._counts["changed"] += 1
+            on_record = ", ".join(f"{kind} {fingerprint(k)}" for kind, k in known.items())
+            message = f"{name} presented {key.get_name()} {fingerprint(key)}, known_hosts has {on_record}"
+            if self.mode == "warn":
+                print(f"WARNING: host key changed: {message}")
+                return
+            self._counts["rejected"] += 1
+            raise HostKeyError(f"host key changed: {message}")
+
+    def save(self):
+        """Append the keys learned since the last save to path."""
+        with self._lock:
+            new, self._new = self._new, []
+        if not new:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                for entry in new:
+                    f.write(entry.to_line())
+        except OSError as e:
+            print(f"Failed to save known hosts {self.path}: {e}")
+            with self._lock:
+                self._new = new + self._new
+
+    def tally(self, *outcomes):
+        """Count outcomes ("verified", "changed", "rejected") of checks made elsewhere (asyncssh)."""
+        with self._lock:
+            for outcome in outcomes:
+                self._counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, mode=self.mode)
@@ -0,0 +1,230 @@
+# inventory.py
+"""
+Host inventory loader.
+Streams one or more CSV inventories row by row and yields validated host
+dicts, so a dispatcher can start on the first hosts of a 100k-line file
+before the rest has been read.
+
+Required columns are CSV_REQUIRED_COLUMNS (hostname, ip, port).  Optional:
+    username    overrides the run's username for that host
+    key_file    private key to log in with instead of the run's password / keys
+    jump_host   bastion the host is reached through (see bastion.py), also its
+                concurrency group: "[user@]host[:port]" or a JUMP_HOSTS name
+    tags        ';' / ',' / space separated labels, selectable with tags=
+
+"ip" may be an address, a DNS name or a CIDR range ("10.0.0.0/28"), which
+expands to one host per address.  A blank port means DEFAULT_SSH_PORT.
+Rows with a bad address, port or jump host, and repeats of an (ip, port)
+already seen behind the same jump host (or none) in any of the files, are
+skipped and described in the errors list.  Jump hosts are compared by the
+bastion they resolve to (jump_host_key), so an alias and its "user@ip:port"
+are the same one.
+"""
+
+import csv
+import ipaddress
+import re
+
+from config import CSV_REQUIRED_COLUMNS, DEFAULT_SSH_PORT, INVENTORY_MAX_CIDR_HOSTS, JUMP_HOSTS
+
+HOSTNAME_RE = re.compile(r"^(?=.{1,253}$)[A-Za-z0-9_]([A-Za-z0-9_-]{0,62})(\.[A-Za-z0-9_]([A-Za-z0-9_-]{0,62}))*\.?$")
+TAG_SPLIT_RE = re.compile(r"[;,\s]+")
+
+
+class InventoryError(ValueError):
+    """An inventory file that cannot be used at all (unreadable, missing columns)."""
+
+
+def check_inventory(paths):
+    """
+    Read only the header of each file.
+
+    Raises:
+        InventoryError: A file cannot be opened or lacks a required column.
+    """
+    for path in paths:
+        try:
+            with open(path, newline='') as f:
+                header = next(csv.reader(f), [])
+        except (OSError, UnicodeDecodeError) as e:
+            raise InventoryError(f"Cannot read {path}: {e}") from e
+        missing = [column for column in CSV_REQUIRED_COLUMNS if column not in [h.strip() for h in header]]
+        if missing:
+            raise InventoryError(f"{path}: missing required column(s): {', '.join(missing)}")
+
+
+def parse_port(value):
+    """Port number from a CSV cell; blank means DEFAULT_SSH_PORT."""
+    value = (value or "").strip()
+    if not value:
+        return DEFAULT_SSH_PORT
+    if not value.isdigit() or not 1 <= int(value) <= 65535:
+        raise ValueError(f"invalid port '{value}'")
+    return int(value)
+
+
+def parse_tags(value):
+    return [tag for tag in TAG_SPLIT_RE.split(value or "") if tag]
+
+
+def parse_jump_host(value):
+    """
+    (username or "", host, port) of a jump_host cell, looked up in JUMP_HOSTS
+    first.  "[user@]host[:port]"; an IPv6 address with a port is "[addr]:port".
+
+    Raises:
+        ValueError: No host, or an invalid port.
+    """
+    value = (value or "").strip()
+    spec = JUMP_HOSTS.get(value, value)
+    username, _, address = spec.rpartition("@")
+    host, port = address, ""
+    if address.startswith("["):
+        host, _, rest = address[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else rest
+    elif address.count(":") == 1:
+        host, _, port = address.partition(":")
+    if not host:
+        raise ValueError(f"invalid jump host '{value}'")
+    try:
+        return username, host.lower(), parse_port(port)
+    except ValueError as e:
+        raise ValueError(f"jump host '{value}': {e}") from None
+
+
+def jump_host_key(value):
+    """
+    The bastion a jump_host cell resolves to, as "host:port" ("[addr]:port"
+    for IPv6): what identifies a host behind it in the inventory, run history
+    and result cache.  "" for no jump host; the stripped cell if it does not parse.
+    """
+    value = (value or "").strip()
+    if not value:
+        return ""
+    try:
+        _, host, port = parse_jump_host(value)
+    except ValueError:
+        return value
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+def expand_address(value):
+    """
+    Addresses for an "ip" cell: the normalized address, the hosts of a CIDR
+    range, or the DNS name unchanged.
+
+    Raises:
+        ValueError: Not an address, range or valid host name, or a range
+        larger than INVENTORY_MAX_CIDR_HOSTS.
+    """
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("missing ip")
+    if "/" in value:
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            raise ValueError(f"invalid CIDR range '{value}'") from None
+        if network.num_addresses > INVENTORY_MAX_CIDR_HOSTS:
+            raise ValueError(f"CIDR range '{value}' exceeds {INVENTORY_MAX_CIDR_HOSTS} addresses")
+        return (str(address) for address in network.hosts())
+    try:
+        return [str(ipaddress.ip_address(value))]
+    except ValueError:
+        pass
+    if HOSTNAME_RE.match(value) and not value.replace(".", "").isdigit():
+        return [value.lower()]
+    raise ValueError(f"invalid ip or host name '{value}'")
+
+
+def iter_hosts(paths, errors=None, tags=None, start_row=0):
+    """
+    Yield host dicts from the inventory files in order, one row at a time.
+
+    Args:
+        paths (list): CSV files; a host already seen in an earlier file is a duplicate.
+        errors (list): Optional; a "file:line: reason" string is appended for
+            every skipped row.
+        tags (iterable): Optional; only hosts carrying at least one of these tags.
+        start_row (int): row_id of the first host.  row_id counts yielded hosts,
+            so it is the host's index in a list built from this generator.
+
+    Raises:
+        InventoryError: A file cannot be read or lacks a required column
+        (raised when that file is reached; call check_inventory() first to
+        fail before any host is used).
+    """
+    wanted = set(tags or ())
+    seen = {}  # (ip, port, jump_host_key) -> "file:line" of its first occurrence
+    row_id = start_row
+
+    def skip(location, reason):
+        if errors is not None:
+            errors.append(f"{location}: {reason}")
+
+    for path in paths:
+        check_inventory([path])
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+            for row in reader:
+                location = f"{path}:{reader.line_num}"
+                if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+                    continue  # blank line
+                row_tags = parse_tags(row.get("tags"))
+                if wanted and not wanted.intersection(row_tags):
+                    continue
+                jump_host = (row.get("jump_host") or "").strip()
+                try:
+                    port = parse_port(row.get("port"))
+                    addresses = expand_address(row.get("ip"))
+                    if jump_host:
+                        parse_jump_host(jump_host)
+                    jump_key = jump_host_key(jump_host)
+                except ValueError as e:
+                    skip(location, e)
+                    continue
+
+                hostname = (row.get("hostname") or "").strip()
+                username = (row.get("username") or "").strip()
+                key_file = (row.get("key_file") or "").strip()
+                for ip in addresses:
+                    # The same private address behind two bastions is two hosts
+                    key = (ip, port, jump_key)
+                    if key in seen:
+                        via = f" via {jump_host}" if jump_host else ""
+                        skip(location, f"duplicate {ip}:{port}{via} (first at {seen[key]})")
+                        continue
+                    seen[key] = location
+                    host = {
+                        "hostname": hostname or ip,
+                        "ip": ip,
+                        "port": port,
+                        "row_id": row_id,
+                    }
+                    if username:
+                        host["username"] = username
+                    if key_file:
+                        host["key_file"] = key_file
+                    if jump_host:
+                        host["jump_host"] = jump_host
+                    if row_tags:
+                        host["tags"] = row_tags
+                    row_id += 1
+                    yield host
+
+
+def load_inventory(paths, tags=None):
+    """
+    Read the inventory files completely.
+
+    Returns:
+        tuple: (hosts list, list of "file:line: reason" strings for skipped rows)
+
+    Raises:
+        InventoryError: See iter_hosts.
+    """
+    check_inventory(paths)
+    errors = []
+    hosts = list(iter_hosts(paths, errors, tags=tags))
+    return hosts, errors
@@ -2,20 +2,36 @@
 """
 Main GUI for the SSH Host Logger tool.
 Layout: Hosts tree (left), command dropdown + preview + output display (right).
+
+The window is built before anything slow happens: the command catalogue is
+parsed on a background thread and fills the list when ready, and the SSH
+backend (paramiko, through the dispatcher) is imported there afterwards and
+set up on the first run.  openpyxl loads with the first XLSX written.
 """
-from concurrent.futures import ThreadPoolExecutor 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from ttkbootstrap import Style
 
 import os
+import shutil
 import threading
 import queue
 
-from config import MAX_THREADS, COMMANDS_DIR, BLACKLISTED_COMMAND_WORDS, VERSION
-
-from file_handler import load_csv, load_json_commands, save_results
-from ssh_worker import run_ssh_task
+from config import (
+    COMMANDS_DIR, BLACKLISTED_COMMAND_WORDS, VERSION, POOL_ENABLED, UI_BATCH_SIZE, RESULTS_DIR, RESULTS_FORMAT,
+    PRESCAN_ENABLED, CACHE_MODE, RESULT_CACHE_PATH, HISTORY_ENABLED, HISTORY_PATH, CATALOGUE_WATCH_INTERVAL,
+    HOST_KEY_MODE, KNOWN_HOSTS_PATH, GROUP_HOSTS_SHOWN, TRANSFER_DIR
+)
+
+from catalogue import CommandCatalogue
+from file_handler import save_results, resolve_commands, open_result_writer
+from history import RunHistory, format_diff
+from grouping import OutputGroups, format_groups
+from host_table import VirtualHostTable
+from inventory import InventoryError, jump_host_key, load_inventory
+from parsing import compile_parse, GENERIC_PATTERN
+from result_cache import ResultCache, CACHE_MODES
+from telemetry import format_summary, save_summary
+from transfer import transfer_command
 
 class HostLoggerApp:
 
@@ -23,10 +39,25 @@ class HostLoggerApp:
         self.root = root
         self.queue = queue.Queue()
         self.hosts = []
+        self.output_groups = OutputGroups()  # one copy per distinct output, hosts grouped by result
+        self.username_overrides = {}  # row_id -> username column of the inventory
+        self.catalogue = None
         self.commands = {}
 
         self.selected_command_key = None
-        self.tree_items = {}  # maps item IDs to host indices
+        self.selected_command_keys = []  # multi-select / bundle selection
+        self.dispatcher = None  # background run, if any
+        self.result_writer = None  # results file of the latest run
+        self.run_summary = None  # telemetry summary of the latest finished run
+        self.last_command_info = None  # command of the latest run, for "Re-run Failed"
+        self.partial_run = False  # the latest run re-ran failed hosts only; its file lacks the others
+        self.result_cache = self._open_result_cache()
+        self.history = self._open_history() if HISTORY_ENABLED else None
+        # SSH session objects, created on the first run (see _open_ssh_session)
+        self.ssh_pool = None  # reused across runs
+        self.host_keys = None  # loaded once per session
+        self.auth = None  # keys decrypted once per session
+        self.bastions = None  # jump host logins kept across runs
 
         self.setup_ui()
         self.username_entry.insert(0, "root")
@@ -52,18 +83,11 @@ class HostLoggerApp:
         self.load_button = ttk.Button(self.left_frame, text="Load Hosts CSV", command=self.browse_csv)
         self.load_button.pack(fill="x", pady=(5, 5))
 
-        ## Treeview
-        self.tree = ttk.Treeview(self.left_frame, columns=("Hostname", "IP", "Port", "Status"), show="headings")
-        self.tree.heading("Hostname", text="Hostname", anchor="w")
-        self.tree.heading("IP", text="IP", anchor="w")
-        self.tree.heading("Port", text="Port", anchor="w")
-        self.tree.heading("Status", text="Status", anchor="w")
-        self.tree.column("Hostname", anchor="w")
-        self.tree.column("IP", anchor="w")
-        self.tree.column("Port", anchor="w")
-        self.tree.column("Status", anchor="w")
-        self.tree.pack(fill="both", expand=True)
-        self.tree.bind("<<TreeviewSelect>>", self.display_output)
+        ## Host table (virtualized Treeview: only visible rows exist)
+        self.host_table = VirtualHostTable(self.left_frame, on_select=self.display_output,
+                                           on_group_select=self.display_group)
+        self.host_table.set_groups(self.output_groups)
+        self.host_table.pack(fill="both", expand=True)
 
 
         ## Description Field 
@@ -90,7 +114,7 @@ class HostLoggerApp:
         self.command_entry.bind("<KeyRelease>", self.filter_commands)
 
         ## Filtered ListBox
-        self.command_listbox = tk.Listbox(self.right_frame, height=5)
+        self.command_listbox = tk.Listbox(self.right_frame, height=5, selectmode="extended", exportselection=False)
         self.command_listbox.pack(fill="x", pady=(0, 5))
         self.command_listbox.bind("<<ListboxSelect>>", self.select_command_from_list)
 
@@ -129,15 +153,60 @@ class HostLoggerApp:
         self.export_button = ttk.Button(button_frame, text="Export", command=self.export_results)
         self.export_button.pack(side="left", expand=True, fill="x")
 
+        self.transfer_button = ttk.Button(self.right_frame, text="Transfer Files...", command=self.open_transfer_dialog)
+        self.transfer_button.pack(fill="x", pady=(0, 5))
+
+        # Diff against the previous run of the same command(s)
+        diff_frame = ttk.Frame(self.right_frame)
+        diff_frame.pack(fill="x", pady=(0, 5))
+
+        self.diff_button = ttk.Button(diff_frame, text="Diff vs Previous Run", command=self.diff_previous_run)
+        self.diff_button.pack(side="left", expand=True, fill="x", padx=(0, 5))
+        ttk.Label(diff_frame, text="Threshold:").pack(side="left")
+        self.diff_threshold_entry = ttk.Entry(diff_frame, width=8)
+        self.diff_threshold_entry.pack(side="left", padx=(5, 0))
+
+        # Run controls
+        run_frame = ttk.Frame(self.right_frame)
+        run_frame.pack(fill="x", pady=(0, 5))
+
+        self.pause_button = ttk.Button(run_frame, text="Pause", command=self.toggle_pause, state="disabled")
+        self.pause_button.pack(side="left", expand=True, fill="x", padx=(0, 5))
+
+        self.cancel_button = ttk.Button(run_frame, text="Cancel", command=self.cancel_execution, state="disabled")
+        self.cancel_button.pack(side="left", expand=True, fill="x", padx=(0, 5))
+
+        self.rerun_button = ttk.Button(run_frame, text="Re-run Failed", command=self.rerun_failed, state="disabled")
+        self.rerun_button.pack(side="left", expand=True, fill="x")
+
+        self.prescan_var = tk.BooleanVar(value=PRESCAN_ENABLED)
+        self.prescan_checkbox = ttk.Checkbutton(
+            self.right_frame,
+            text="Pre-scan reachability (skip dead hosts)",
+            variable=self.prescan_var
+        )
+        self.prescan_checkbox.pack(fill="x", pady=(0, 5))
+
+        cache_frame = ttk.Frame(self.right_frame)
+        cache_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(cache_frame, text="Result cache:").pack(side="left")
+        self.cache_mode_var = tk.StringVar(value=CACHE_MODE)
+        self.cache_mode_box = ttk.Combobox(
+            cache_frame, textvariable=self.cache_mode_var, values=CACHE_MODES, state="readonly", width=14
+        )
+        self.cache_mode_box.pack(side="left", padx=(5, 0))
+
+        self.progress_label = ttk.Label(self.right_frame, text="Idle")
+        self.progress_label.pack(fill="x")
+
 
     def filter_commands(self, event=None):
-        typed = self.command_entry.get().lower()
+        if self.catalogue is None:
+            return  # still loading; the list is filled once it is
+        matches = self.catalogue.search(self.command_entry.get())
         self.command_listbox.delete(0, tk.END)
-
-        for key in sorted(self.commands.keys()):
-            command = self.commands[key].get("command", "").lower()
-            if typed in key.lower() or typed in command:
-                self.command_listbox.insert(tk.END, key)
+        if matches:
+            self.command_listbox.insert(tk.END, *matches)
 
 
     def browse_csv(self):
@@ -167,60 +236,132 @@ class HostLoggerApp:
             )
             return
 
-        # Proceed with file dialog
-        file_path = filedialog.askopenfilename(
-            title="Select Host CSV File",
+        # Proceed with file dialog; several inventories may be selected at once
+        file_paths = filedialog.askopenfilenames(
+            title="Select Host CSV File(s)",
             filetypes=[("CSV Files", "*.csv")],
             initialdir=assets_dir
         )
-        if file_path:
-            self.load_hosts(file_path)
+        if file_paths:
+            self.load_hosts(list(file_paths))
 
 
     def select_command_from_list(self, event=None):
         if not self.command_listbox.curselection():
             return
 
-        index = self.command_listbox.curselection()[0]
-        selected = self.command_listbox.get(index)
-        self.command_entry.delete(0, tk.END)
-        self.command_entry.insert(0, selected)
-        self.selected_command_key = selected
+        selected_keys = [self.command_listbox.get(i) for i in self.command_listbox.curselection()]
+        self.selected_command_keys = selected_keys
+
+        if len(selected_keys) == 1:
+            selected = selected_keys[0]
+            self.command_entry.delete(0, tk.END)
+            self.command_entry.insert(0, selected)
+            self.selected_command_key = selected
+        else:
+            self.selected_command_key = None
         self.update_command_preview()
 
 
-    def load_hosts(self, file_path):
-        self.hosts = load_csv(file_path)
-        for idx, host in enumerate(self.hosts):
-            item_id = self.tree.insert("", "end", values=(host["hostname"], host["ip"], host["port"], "Pending"))
-            self.tree_items[item_id] = idx
+    def resolve_selected_commands(self):
+        """
+        Expand the selection (including bundles) into an ordered
+        {full_key: command_info} map of runnable catalogue entries.
+        """
+        return resolve_commands(self.commands, self.selected_command_keys)
+
+
+    def load_hosts(self, file_paths):
+        if self.dispatcher and not self.dispatcher.done:
+            messagebox.showwarning("Run In Progress", "Wait for the current run to finish or cancel it first.")
+            return
+
+        try:
+            hosts, skipped = load_inventory(file_paths)
+        except InventoryError as e:
+            messagebox.showerror("Invalid Hosts File", str(e))
+            return
+        self.hosts = hosts
+        self.output_groups.clear()
+        self.last_command_info = None
+        self.rerun_button.config(state="disabled")
+        self.username_overrides = {host["row_id"]: host["username"] for host in hosts if host.get("username")}
+        self.host_table.set_hosts(self.hosts)
+        if skipped:
+            for row in skipped:
+                print(f"Skipping host row {row}")
+            shown = "\n".join(skipped[:15]) + (f"\n... and {len(skipped) - 15} more" if len(skipped) > 15 else "")
+            messagebox.showwarning("Host Rows Skipped", f"{len(hosts)} hosts loaded, {len(skipped)} rows skipped:\n{shown}")
 
 
     def load_commands(self, directory_path):
-        categorized = load_json_commands(directory_path)
-        self.commands = {}  # Flattened command map with full keys
+        """Parse the command files on a background thread; the list is filled when they are read."""
+        self.command_label.config(text="Filter Commands by Keyword (loading...):")
+        loaded = queue.Queue()
 
-        dropdown_items = []
-        for category in sorted(categorized.keys()):
-            for label in sorted(categorized[category].keys()):
-                full_key = f"{category}: {label}"
-                self.commands[full_key] = categorized[category][label]
-                dropdown_items.append(full_key)
+        def load():
+            try:
+                loaded.put(CommandCatalogue(directory_path))
+            except Exception as e:
+                print(f"Cannot load commands from {directory_path}: {e}")
+                loaded.put(None)
+            # Warm the SSH backend while the user picks hosts and a command
+            import dispatcher
 
-        # Update Listbox instead of old Combobox
-        self.command_listbox.delete(0, tk.END)
-        for item in sorted(dropdown_items):
-            self.command_listbox.insert(tk.END, item)
+        threading.Thread(target=load, daemon=True).start()
+        self.root.after(20, self._commands_loaded, loaded)
+
+
+    def _commands_loaded(self, loaded):
+        try:
+            catalogue = loaded.get_nowait()
+        except queue.Empty:
+            self.root.after(20, self._commands_loaded, loaded)
+            return
+        self.command_label.config(text="Filter Commands by Keyword:")
+        if catalogue is None:
+            return
+        self.catalogue = catalogue
+        self.commands = self.catalogue.commands  # Flattened command map with full keys
+        self.filter_commands()
+        if CATALOGUE_WATCH_INTERVAL > 0:
+            self.root.after(int(CATALOGUE_WATCH_INTERVAL * 1000), self.watch_commands)
+
+
+    def watch_commands(self):
+        """Pick up added, changed or removed command files without a restart."""
+        if self.catalogue.refresh():
+            self.commands = self.catalogue.commands
+            # Keep the current filter and whatever of the selection still exists
+            self.selected_command_keys = [key for key in self.selected_command_keys if key in self.commands]
+            if self.selected_command_key not in self.commands:
+                self.selected_command_key = None
+            self.filter_commands()
+            listed = self.command_listbox.get(0, tk.END)
+            for index, key in enumerate(listed):
+                if key in self.selected_command_keys:
+                    self.command_listbox.selection_set(index)
+            self.update_command_preview()
+        self.root.after(int(CATALOGUE_WATCH_INTERVAL * 1000), self.watch_commands)
 
 
     def update_command_preview(self, event=None):
-        key = getattr(self, 'selected_command_key', None)
-        if not key:
+        if not self.selected_command_keys:
             return
 
-        command_info = self.commands.get(key, {})
-        command = command_info.get("command", "")
-        description = command_info.get("description", "No description provided.")
+        resolved = self.resolve_selected_commands()
+        key = self.selected_command_key
+        if key and "command" in self.commands.get(key, {}):
+            command_info = self.commands[key]
+            command = command_info.get("command", "")
+            description = command_info.get("description", "No description provided.")
+        else:
+            command = "\n".join(f"{k}: {info['command']}" for k, info in resolved.items())
+            descriptions = [
+                self.commands[k]["description"] for k in self.selected_command_keys
+                if "bundle" in self.commands.get(k, {})
+            ]
+            description = "\n".join(descriptions) or f"{len(resolved)} commands selected, run over one connection per host."
 
         # Update command preview
         self.command_preview.config(state="normal")
@@ -235,23 +376,29 @@ class HostLoggerApp:
         self.command_description.config(state="disabled")
 
 
-    def start_execution(self):
+    def start_execution(self, command_info=None):
+        """Run command_info, or the manual command / selected catalogue commands, on every host."""
         username = self.username_entry.get()
         password = getattr(self, 'ssh_password', '')
 
+        if self.dispatcher and not self.dispatcher.done:
+            messagebox.showwarning("Run In Progress", "Wait for the current run to finish or cancel it first.")
+            return
+
         if not self.hosts:
             messagebox.showerror("No Hosts Loaded", "You must load a hosts CSV file before running a command.")
             return
 
-        if not username or not password:
-            messagebox.showerror("Missing Credentials", "Username or password is missing.")
+        if not username:
+            messagebox.showerror("Missing Credentials", "Username is missing.")
             return
 
         # Check for manual command
         manual_command = self.manual_command_entry.get().strip()
-        command_info = {}
 
-        if manual_command:
+        if command_info is not None:
+            pass  # a file transfer, confirmed in its dialog
+        elif manual_command:
             confirm = messagebox.askyesno(
                 "Manual Command Confirmation",
                 "You are about to run a manual command on all hosts. Are you sure?"
@@ -267,37 +414,148 @@ class HostLoggerApp:
 
             command_info = {
                 "command": manual_command,
-                "parse": "(.+)"  # generic fallback regex
+                "parse": GENERIC_PATTERN,  # generic fallback regex
+                "regex": compile_parse(GENERIC_PATTERN),
             }
         else:
-            command_info = self.commands.get(self.selected_command_key)
-            if not command_info:
+            resolved = self.resolve_selected_commands()
+            if not resolved:
                 messagebox.showerror("Command Error", "No command selected.")
                 return
+            if len(resolved) == 1:
+                command_info = next(iter(resolved.values()))
+            else:
+                command_info = {"batch": resolved}
+
+        self.output_groups.clear()
+        self.host_table.reset_statuses()
 
         for host in self.hosts:
             host.update({
-                "username": username,
+                "username": self.username_overrides.get(host["row_id"], username),
                 "password": password,
+                "use_agent": not password,  # blank password: ssh-agent / key files
             })
+            self._clear_result(host)
+        self._launch(self.hosts, command_info)
+
+
+    def rerun_failed(self):
+        """
+        Run the latest command again on the hosts that failed (Error or
+        Unreachable) with the same credentials, keeping every other host's result.
+        """
+        if self.dispatcher and not self.dispatcher.done:
+            messagebox.showwarning("Run In Progress", "Wait for the current run to finish or cancel it first.")
+            return
+        if self.last_command_info is None:
+            messagebox.showinfo("No Previous Run", "Run a command first.")
+            return
+        failed = [host for host in self.hosts if host.get("status") in ("Error", "Unreachable")]
+        if not failed:
+            messagebox.showinfo("Nothing To Re-run", "No host failed in the latest run.")
+            return
+
+        for host in failed:
+            self.output_groups.discard(host["row_id"])
+            self._clear_result(host)
+            self.host_table.set_status(host["row_id"], "Pending")
+        self.host_table.refresh()
+        self._launch(failed, self.last_command_info, partial=True)
+
+
+    @staticmethod
+    def _clear_result(host):
+        """Drop what a previous run left on host."""
+        host.update({"output": "", "error": ""})
+        for field in ("results", "timings", "unreachable", "cached", "cached_at", "error_code", "attempts", "path"):
+            host.pop(field, None)
+
 
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            for host in self.hosts:
-                executor.submit(run_ssh_task, host, command_info, self.queue)
+    def _launch(self, hosts, command_info, partial=False):
+        """Start a run of command_info over hosts (all loaded hosts, or the failed ones: partial)."""
+        from dispatcher import FleetDispatcher
 
+        self._open_ssh_session()
+        # A re-run's results replace the failed ones in the run it re-runs, rather than
+        # recording a partial run that later diffs would be made against
+        history_run = self.dispatcher.history_run if partial and self.dispatcher else None
+        history = self.history if not partial or history_run is not None else None
+        self.run_summary = None
+        self.last_command_info = command_info
+        self.partial_run = partial
+
+        # Stream results to disk as hosts complete so a crash loses nothing already done
+        script_dir = os.path.dirname(os.path.realpath(__file__))
+        run_file = os.path.join(
+            script_dir, RESULTS_DIR, f"results_{self._get_timestamp_for_filename()}.{RESULTS_FORMAT}"
+        )
+        command_keys = list(command_info["batch"]) if "batch" in command_info else []
+        try:
+            self.result_writer = open_result_writer(run_file, command_keys)
+        except Exception as e:
+            messagebox.showerror("Results File Error", f"Cannot create {run_file}:\n{e}")
+            return
+
+        self.dispatcher = FleetDispatcher(hosts, command_info, self.queue, pool=self.ssh_pool,
+                                          writer=self.result_writer, prescan=self.prescan_var.get(),
+                                          cache=self.result_cache, cache_mode=self.cache_mode_var.get(),
+                                          history=history, history_run=history_run,
+                                          host_keys=self.host_keys, auth=self.auth,
+                                          bastions=self.bastions)
+        self.dispatcher.start()
+
+        self.go_button.config(state="disabled")
+        self.rerun_button.config(state="disabled")
+        self.pause_button.config(state="normal", text="Pause")
+        self.cancel_button.config(state="normal")
         self.root.after(100, self.poll_queue)
 
 
+    def toggle_pause(self):
+        if not self.dispatcher or self.dispatcher.done:
+            return
+        if self.dispatcher.paused:
+            self.dispatcher.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            self.dispatcher.pause()
+            self.pause_button.config(text="Resume")
+        self.update_progress()
+
+
+    def cancel_execution(self):
+        if self.dispatcher and not self.dispatcher.done:
+            self.dispatcher.cancel()
+            self.cancel_button.config(state="disabled")
+            self.pause_button.config(state="disabled")
+            self.update_progress()
+
+
     def export_results(self):
-        """Export current SSH results to an XLSX file."""
+        """
+        Export current SSH results.  After a run this copies the file the run
+        already streamed to disk; with no run yet, or after re-running the
+        failed hosts, an XLSX is built from the hosts.
+        """
         if not self.hosts:
             messagebox.showwarning("No Data", "No host data available to export.")
             return
 
-        filetypes = [("Excel files", "*.xlsx")]
-        default_filename = f"results_{self._get_timestamp_for_filename()}.xlsx"
+        if self.dispatcher and not self.dispatcher.done:
+            messagebox.showwarning("Run In Progress", "Results can be exported once the run has finished.")
+            return
+
+        run_file = self.result_writer.path if self.result_writer and not self.partial_run else None
+        ext = os.path.splitext(run_file)[1] if run_file else ".xlsx"
+        filetypes = {
+            ".xlsx": [("Excel files", "*.xlsx")],
+            ".csv": [("CSV files", "*.csv")],
+            ".jsonl": [("JSON Lines files", "*.jsonl")],
+        }[ext]
+        default_filename = f"results_{self._get_timestamp_for_filename()}{ext}"
         filepath = filedialog.asksaveasfilename(
-            defaultextension=".xlsx",
+            defaultextension=ext,
             filetypes=filetypes,
             initialfile=default_filename
         )
@@ -306,13 +564,114 @@ class HostLoggerApp:
             return  # User canceled
 
         try:
-            save_results(self.hosts, filepath)
+            if run_file:
+                self.finish_results_file()
+                if os.path.abspath(filepath) != os.path.abspath(run_file):
+                    shutil.copyfile(run_file, filepath)
+                    summary_file = self._summary_path(run_file)
+                    if os.path.exists(summary_file):
+                        shutil.copyfile(summary_file, self._summary_path(filepath))
+            else:
+                save_results(self.hosts, filepath)
             messagebox.showinfo("Export Successful", f"Results saved to:\n{filepath}")
             os.startfile(filepath)
         except Exception as e:
             messagebox.showerror("Export Failed", str(e))
 
 
+    def _open_result_cache(self):
+        """Open the SQLite result cache next to the script (None if it cannot be opened)."""
+        path = RESULT_CACHE_PATH
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
+        try:
+            return ResultCache(path)
+        except Exception as e:
+            print(f"Result cache disabled, cannot open {path}: {e}")
+            return None
+
+
+    def _open_history(self):
+        """Open the SQLite run history next to the script (None if it cannot be opened)."""
+        path = HISTORY_PATH
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
+        try:
+            return RunHistory(path)
+        except Exception as e:
+            print(f"Run history disabled, cannot open {path}: {e}")
+            return None
+
+
+    def _open_ssh_session(self):
+        """Create the connection pool, host key store, credentials and jump host pool on the first run."""
+        if self.auth is not None:
+            return
+        from bastion import BastionPool
+        from credentials import SessionAuth
+        from ssh_pool import SSHConnectionPool
+
+        self.ssh_pool = SSHConnectionPool() if POOL_ENABLED else None
+        self.host_keys = self._open_host_keys() if HOST_KEY_MODE != "off" else None
+        self.auth = SessionAuth(passphrase=os.environ.get("SSHLOOP_KEY_PASSPHRASE"))
+        self.bastions = BastionPool(host_keys=self.host_keys, auth=self.auth)
+
+
+    def _open_host_keys(self):
+        """Load known_hosts once for the session (None, i.e. no checking, if it cannot be loaded)."""
+        from hostkeys import HostKeyStore
+
+        path = KNOWN_HOSTS_PATH
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
+        try:
+            return HostKeyStore(path)
+        except Exception as e:
+            print(f"Host key checking disabled, cannot load {path}: {e}")
+            return None
+
+
+    def diff_previous_run(self):
+        """
+        Compare the latest run with the previous run of the same command(s):
+        list the hosts whose parsed value changed and filter the table to them.
+        """
+        if not self.history:
+            messagebox.showwarning("No History", "Run history is disabled (HISTORY_ENABLED in config.py).")
+            return
+        if self.dispatcher and not self.dispatcher.done:
+            messagebox.showwarning("Run In Progress", "Runs can be compared once the run has finished.")
+            return
+        run_id = self.dispatcher.history_run if self.dispatcher else None
+        if run_id is None:
+            messagebox.showinfo("No Run", "Run a command first; it is then compared with its previous run.")
+            return
+        previous = self.history.previous_run(run_id)
+        if previous is None:
+            messagebox.showinfo("No Previous Run", "There is no earlier run of the same command(s) to compare with.")
+            return
+
+        threshold = self.diff_threshold_entry.get().strip()
+        try:
+            threshold = float(threshold) if threshold else None
+        except ValueError:
+            messagebox.showerror("Invalid Threshold", "The threshold must be a number, e.g. 90.")
+            return
+
+        diff = self.history.diff(previous, run_id, threshold=threshold)
+        rows = {
+            (str(host.get("ip")), int(host.get("port") or 0), jump_host_key(host.get("jump_host"))): idx
+            for idx, host in enumerate(self.hosts)
+        }
+        keys = [(row["ip"], row["port"], row["jump_host"]) for row in diff["changed"]]
+        self.host_table.set_changed(rows[key] for key in keys if key in rows)
+
+        self.output_display.config(state="normal")
+        self.output_display.delete("1.0", tk.END)
+        self.output_display.insert(tk.END, format_diff(diff))
+        self.output_display.config(state="disabled")
+
+
     def _get_timestamp_for_filename(self):
         """Utility to create timestamp string for filenames."""
         from datetime import datetime
@@ -320,30 +679,193 @@ class HostLoggerApp:
 
 
     def poll_queue(self):
+        # Apply at most UI_BATCH_SIZE results per tick so a burst of completions
+        # never holds the Tk thread long enough to stutter
+        backlog = False
         try:
-            while True:
+            for _ in range(UI_BATCH_SIZE):
                 result = self.queue.get_nowait()
                 self.update_tree(result)
+            backlog = True
         except queue.Empty:
-            self.root.after(100, self.poll_queue)
+            pass
 
+        self.host_table.refresh()
+        self.update_progress()
 
-    def ask_password_then_execute(self):
+        # Keep polling until the dispatcher has finished and the queue is drained
+        if self.dispatcher and (not self.dispatcher.done or not self.queue.empty()):
+            self.root.after(10 if backlog else 100, self.poll_queue)
+        else:
+            self.go_button.config(state="normal")
+            failed = self.host_table.counts["Error"] + self.host_table.counts["Unreachable"]
+            self.rerun_button.config(state="normal" if failed else "disabled")
+            self.pause_button.config(state="disabled", text="Pause")
+            self.cancel_button.config(state="disabled")
+            if self.ssh_pool:
+                self.ssh_pool.evict_idle()
+            self.finish_results_file()
+            self.update_progress()
+            self.show_run_summary()
+
+
+    def finish_results_file(self):
+        """
+        Finalize the streamed results file once the run is over, adding the
+        run summary to it and writing the summary as JSON alongside.
+        """
+        if self.result_writer and not self.result_writer.closed:
+            if self.dispatcher and self.dispatcher.done:
+                self.run_summary = self.dispatcher.telemetry.summary()
+            try:
+                self.result_writer.close(self.run_summary)
+                print(f"Results saved to: {self.result_writer.path}")
+            except Exception as e:
+                print(f"Failed to finalize {self.result_writer.path}: {e}")
+            if self.run_summary:
+                summary_file = self._summary_path(self.result_writer.path)
+                try:
+                    save_summary(self.run_summary, summary_file)
+                    print(f"Run summary saved to: {summary_file}")
+                except OSError as e:
+                    print(f"Failed to save run summary {summary_file}: {e}")
+
+
+    @staticmethod
+    def _summary_path(results_path):
+        return os.path.splitext(results_path)[0] + ".summary.json"
+
+
+    def show_run_summary(self):
+        """
+        Show the latest run's telemetry, and the hosts grouped by result, in
+        the output pane (until a host is selected).
+        """
+        if not self.run_summary:
+            return
+        text = format_summary(self.run_summary)
+        if self.output_groups:
+            groups = format_groups(self.output_groups.groups(), limit=10)
+            text = f"Results ({len(self.output_groups)} distinct):\n{groups}\n\n{text}"
+        self.output_display.config(state="normal")
+        self.output_display.delete("1.0", tk.END)
+        self.output_display.insert(tk.END, text)
+        self.output_display.config(state="disabled")
+
+
+    def update_progress(self):
+        """Refresh the run counter label from the dispatcher."""
+        if not self.dispatcher:
+            return
+        p = self.dispatcher.progress()
+        if p["done"]:
+            state = "Cancelled" if p["cancelled"] else "Finished"
+        elif p["cancelled"]:
+            state = "Cancelling"
+        elif p["paused"]:
+            state = "Paused"
+        elif p["stage"] == "cache":
+            state = "Checking cache"
+        elif p["stage"] == "prescan":
+            state = "Pre-scanning"
+        else:
+            state = "Running"
+        telemetry = self.dispatcher.telemetry
+        rate = p["completed"] / telemetry.elapsed if telemetry.elapsed > 0 else 0.0
+        text = f"{state}: {p['completed']}/{p['total']} complete, {p['errors']} errors, {rate:.1f} hosts/s"
+        if p["retrying"] and not p["done"]:
+            text += f", {p['retrying']} waiting to retry"
+        if self.dispatcher.scheduler and not p["done"]:
+            text += f", limit {p['limit']}"
+        if p["done"] and self.run_summary:
+            total = self.run_summary["latency"].get("total")
+            if total:
+                text += f", p95 {total['p95']:.2f}s"
+            text += f", utilization {self.run_summary['utilization']:.0%}"
+        self.progress_label.config(text=text)
+
+
+    def open_transfer_dialog(self):
+        """Ask for a file to push to, or pull from, every host and run the transfer."""
+        if not self.hosts:
+            messagebox.showerror("No Hosts Loaded", "You must load a hosts CSV file before transferring files.")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Transfer Files")
+        dialog.geometry("480x260")
+        dialog.grab_set()
+
+        direction_var = tk.StringVar(value="push")
+        direction_frame = ttk.Frame(dialog)
+        direction_frame.pack(fill="x", padx=10, pady=(10, 5))
+        ttk.Radiobutton(direction_frame, text="Push (upload to hosts)", variable=direction_var,
+                        value="push").pack(side="left")
+        ttk.Radiobutton(direction_frame, text="Pull (download from hosts)", variable=direction_var,
+                        value="pull").pack(side="left", padx=(10, 0))
+
+        def path_row(label, browse):
+            ttk.Label(dialog, text=label).pack(anchor="w", padx=10)
+            row = ttk.Frame(dialog)
+            row.pack(fill="x", padx=10, pady=(0, 5))
+            entry = ttk.Entry(row)
+            entry.pack(side="left", expand=True, fill="x")
+            if browse:
+                ttk.Button(row, text="Browse", command=lambda: self._browse_into(entry, browse)).pack(
+                    side="left", padx=(5, 0))
+            return entry
+
+        local_entry = path_row("Local file (push):", "file")
+        remote_entry = path_row("Remote path on every host:", None)
+        dest_entry = path_row("Save pulled files under (one folder per host):", "directory")
+        dest_entry.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), TRANSFER_DIR))
+
+        def on_start():
+            direction = direction_var.get()
+            try:
+                command_info = transfer_command(direction, remote_entry.get(), local=local_entry.get().strip(),
+                                                dest=dest_entry.get().strip() or TRANSFER_DIR)
+            except ValueError as e:
+                messagebox.showerror("Transfer Error", str(e), parent=dialog)
+                return
+            if direction == "push" and not messagebox.askyesno(
+                "Push Confirmation",
+                f"{command_info['description']}\non all {len(self.hosts):,} hosts, replacing any file there. "
+                "Are you sure?",
+                parent=dialog
+            ):
+                return
+            dialog.destroy()
+            self.ask_password_then_execute(command_info)
+
+        ttk.Button(dialog, text="Start Transfer", command=on_start).pack(pady=10)
+
+
+    @staticmethod
+    def _browse_into(entry, kind):
+        path = filedialog.askopenfilename() if kind == "file" else filedialog.askdirectory()
+        if path:
+            entry.delete(0, tk.END)
+            entry.insert(0, path)
+
+
+    def ask_password_then_execute(self, command_info=None):
+        """Get the SSH password (unless saved for the session), then start command_info or the selected command."""
         if not self.hosts:
             messagebox.showerror("No Hosts Loaded", "You must load a hosts CSV file before running a command.")
             return
 
         if self.cached_password and self.save_password_session.get():
             self.ssh_password = self.cached_password
-            self.start_execution()
+            self.start_execution(command_info)
             return
 
         password_popup = tk.Toplevel(self.root)
         password_popup.title("Enter SSH Password")
-        password_popup.geometry("300x150")
+        password_popup.geometry("340x150")
         password_popup.grab_set()
 
-        label = ttk.Label(password_popup, text="SSH Password:")
+        label = ttk.Label(password_popup, text="SSH Password (blank for ssh-agent / keys):")
         label.pack(pady=(10, 5))
 
         password_entry = ttk.Entry(password_popup, show="*")
@@ -362,7 +884,7 @@ class HostLoggerApp:
             if self.save_password_session.get():
                 self.cached_password = self.ssh_password
             password_popup.destroy()
-            self.start_execution()
+            self.start_execution(command_info)
 
         submit_btn = ttk.Button(password_popup, text="Submit", command=on_submit)
         submit_btn.pack(pady=10)
@@ -371,24 +893,67 @@ class HostLoggerApp:
 
 
     def update_tree(self, result):
-        for item_id, idx in self.tree_items.items():
-            if self.hosts[idx]["ip"] == result["ip"]:
-                self.hosts[idx].update(result)
-                if result["error"]:
-                    status = "Error"
-                else:
-                    status = "Complete"
-                self.tree.set(item_id, "Status", status)
-                break
-
-
-    def display_output(self, event):
-        selected = self.tree.focus()
-        if selected:
-            idx = self.tree_items[selected]
+        """Apply one result to its host; poll_queue redraws the table once per batch."""
+        idx = result.get("row_id")
+        if idx is None or not 0 <= idx < len(self.hosts):
+            return  # not a row of the current host list
+        self.output_groups.add(idx, result)  # hosts with the same output share one copy of it
+        self.hosts[idx].update(result)
+        if result.get("unreachable"):
+            status = "Unreachable"
+        else:
+            status = "Error" if result["error"] else "Complete"
+        self.host_table.set_status(idx, status)
+
+
+    def on_close(self):
+        """Stop any run, close pooled connections and the results file before exiting."""
+        if self.dispatcher and not self.dispatcher.done:
+            self.dispatcher.cancel()
+        if self.ssh_pool:
+            self.ssh_pool.close_all()
+        if self.bastions:
+            self.bastions.close_all()
+        self.finish_results_file()
+        if self.result_cache:
+            self.result_cache.close()
+        if self.history:
+            self.history.close()
+        if self.auth:
+            self.auth.close()
+        self.root.destroy()
+
+
+    def display_output(self, idx):
+        if idx is not None:
             output = self.hosts[idx].get("output", "")
             error = self.hosts[idx].get("error", "")
             display_text = f"Output:\n{output}\n\nError:\n{error}" if error else f"Output:\n{output}"
+            if error and self.hosts[idx].get("error_code"):
+                display_text += f"\n({self.hosts[idx]['error_code']})"
+
+            results = self.hosts[idx].get("results")
+            if results:
+                sections = []
+                for key, sub in results.items():
+                    section = f"[{key}]\n{sub.get('output', '')}"
+                    if sub.get("error"):
+                        section += f"\nError: {sub['error']}"
+                    sections.append(section)
+                display_text = "\n\n".join(sections)
+
+            if self.hosts[idx].get("path"):
+                display_text += f"\n\nSaved to: {self.hosts[idx]['path']}"
+
+            if self.hosts[idx].get("attempts"):
+                display_text += f"\n\n(tried {self.hosts[idx]['attempts']} times)"
+
+            if self.hosts[idx].get("cached") and self.hosts[idx].get("cached_at"):
+                display_text += f"\n\n(from cache, {self.hosts[idx]['cached_at']})"
+
+            timings = self.hosts[idx].get("timings")
+            if timings:
+                display_text += "\n\nTimings (s): " + ", ".join(f"{k} {v:.3f}" for k, v in timings.items())
 
             self.output_display.config(state="normal")
             self.output_display.delete("1.0", tk.END)
@@ -396,8 +961,33 @@ class HostLoggerApp:
             self.output_display.config(state="disabled")
 
 
+    def display_group(self, key, indices):
+        """Show a group's shared result and its hosts (key None: hosts without a result yet)."""
+        if key is None:
+            display_text = f"{len(indices):,} hosts without a result yet"
+        else:
+            output, error = key
+            display_text = f"{len(indices):,} hosts:\n\nOutput:\n{output}"
+            if error:
+                display_text += f"\n\nError:\n{error}"
+        shown = [self.hosts[i] for i in indices[:GROUP_HOSTS_SHOWN]]
+        display_text += "\n\nHosts:\n" + "\n".join(
+            f"{host.get('hostname', '')} ({host.get('ip')}:{host.get('port')})" for host in shown
+        )
+        if len(indices) > len(shown):
+            display_text += f"\n... and {len(indices) - len(shown):,} more (expand the group to list them)"
+
+        self.output_display.config(state="normal")
+        self.output_display.delete("1.0", tk.END)
+        self.output_display.insert(tk.END, display_text)
+        self.output_display.config(state="disabled")
+
+
 if __name__ == "__main__":
+    from ttkbootstrap import Style
+
     root = tk.Tk()
     Style("darkly")
     app = HostLoggerApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
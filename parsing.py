@@ -0,0 +1,186 @@
+# parsing.py
+"""
+Turns raw command output into results.
+Compiles catalogue parse patterns once and applies them; shared by the
+thread and asyncio engines and by the command loader.
+"""
+
+import re
+import uuid
+
+GENERIC_PATTERN = "(.+)"
+
+
+def compile_parse(parse):
+    """
+    Compile a catalogue "parse" value: one pattern string or a list of them.
+
+    Every pattern must have at least one capture group.  Named groups become
+    separate fields, so one command can yield several values.
+
+    Returns:
+        list: Compiled re.Pattern objects.
+
+    Raises:
+        ValueError: If the value or any pattern is invalid.
+    """
+    patterns = [parse] if isinstance(parse, str) else parse
+    if not isinstance(patterns, list) or not patterns or not all(isinstance(p, str) for p in patterns):
+        raise ValueError("'parse' must be a pattern string or a non-empty list of them")
+
+    compiled = []
+    for pattern in patterns:
+        try:
+            regex = re.compile(pattern)
+        except re.error as re_err:
+            raise ValueError(f"invalid regex {pattern!r}: {re_err}") from None
+        if regex.groups == 0:
+            raise ValueError(f"regex {pattern!r} has no capture group")
+        compiled.append(regex)
+    return compiled
+
+
+def get_patterns(command_info):
+    """Return the compiled patterns for command_info, compiling on first use."""
+    patterns = command_info.get("regex")
+    if patterns is None:
+        patterns = compile_parse(command_info["parse"])
+    return patterns
+
+
+def parse_output(output, error_output, exit_status, command_info, result, note=""):
+    """
+    Apply the command's parse regex to raw output and fill in result.
+    Shared by the thread and asyncio engines so both report identically.
+    exit_status is None when the command did not finish; note (timeout or
+    truncation) is put in front of any error.  Named groups are also stored
+    in result["fields"].  A failure's error_code is "exec" or "parse".
+    """
+    result["output"] = "PARSE_ERROR" if output == "" else output
+
+    if exit_status not in (0, None) or error_output:
+        result["error"] = f"Exit Code {exit_status}: {error_output}".strip()
+        result["error_code"] = "exec"
+
+    try:
+        patterns = get_patterns(command_info)
+        if len(patterns) == 1 and patterns[0].pattern == GENERIC_PATTERN:
+            # Generic multi-line capture for manual or fallback commands
+            matches = patterns[0].findall(output)
+            if matches:
+                result["output"] = "\n".join(matches)
+            else:
+                result["error"] = "Parse failed: no matches found"
+                result["error_code"] = "parse"
+        else:
+            values, fields, missed = [], {}, 0
+            for regex in patterns:
+                match = regex.search(output)
+                if not match:
+                    missed += 1
+                elif regex.groupindex:
+                    captured = {k: v for k, v in match.groupdict().items() if v is not None}
+                    fields.update(captured)
+                    values.extend(f"{k}: {v}" for k, v in captured.items())
+                else:
+                    values.append(match.group(1))
+
+            if values:
+                result["output"] = "\n".join(values)
+            if fields:
+                result["fields"] = fields
+            if missed and not result["error"]:
+                if len(patterns) == 1:
+                    result["error"] = "Parse failed: pattern not found"
+                else:
+                    result["error"] = f"Parse failed: {missed} of {len(patterns)} patterns not found"
+                result["error_code"] = "parse"
+    except ValueError as re_err:
+        result["error"] = f"Regex error: {re_err}"
+        result["error_code"] = "parse"
+
+    if note:
+        result["error"] = f"{note}; {result['error']}" if result["error"] else note
+        result.setdefault("error_code", "exec")
+
+
+def build_batch_command(commands):
+    """
+    Combine several catalogue commands into one POSIX shell invocation.
+
+    Each command runs in its own subshell between marker lines written to both
+    stdout and stderr, with its exit status on the closing stdout marker.
+
+    Returns:
+        tuple: (script, token) where token is the per-run marker prefix.
+    """
+    token = f"__SSHLOOP_{uuid.uuid4().hex[:12]}__"
+    parts = []
+    for i, info in enumerate(commands.values()):
+        parts.append(
+            f'echo "{token}:{i}:BEGIN"; echo "{token}:{i}:BEGIN" >&2\n'
+            f'( {info["command"]}\n)\n'
+            f'rc=$?; echo; echo "{token}:{i}:END:$rc"; echo >&2; echo "{token}:{i}:END" >&2'
+        )
+    return "\n".join(parts), token
+
+
+def parse_batch_output(output, error_output, token, commands, result, note=""):
+    """
+    Split combined batch output on its markers and parse each section.
+    note (timeout or truncation of the combined read) is added to the summary error.
+    """
+    out_sections = {
+        int(m.group(1)): (m.group(2), int(m.group(3)))
+        for m in re.finditer(rf"{token}:(\d+):BEGIN\n(.*?){token}:\1:END:(\d+)", output, re.S)
+    }
+    err_sections = {
+        int(m.group(1)): m.group(2)
+        for m in re.finditer(rf"{token}:(\d+):BEGIN\n(.*?){token}:\1:END", error_output, re.S)
+    }
+
+    outputs = {}
+    for i, key in enumerate(commands):
+        if i in out_sections:
+            text, exit_status = out_sections[i]
+            outputs[key] = (text.strip(), err_sections.get(i, "").strip(), exit_status, "")
+        else:
+            outputs[key] = None
+    parse_batch_results(outputs, commands, result)
+
+    if note:
+        result["error"] = f"{note}; {result['error']}" if result["error"] else note
+        result.setdefault("error_code", "exec")
+
+
+def parse_batch_results(outputs, commands, result):
+    """
+    Parse per-command (stdout, stderr, exit status, note) tuples into result["results"]
+    and summarise them in result["output"] / result["error"].
+    A missing tuple (None) means the command never reported back.
+    """
+    result["results"] = {}
+    for key, info in commands.items():
+        sub = {"output": "", "error": ""}
+        if outputs.get(key) is None:
+            sub["error"] = "No result returned for this command"
+            sub["error_code"] = "exec"
+        else:
+            output, error_output, exit_status, note = outputs[key]
+            parse_output(output, error_output, exit_status, info, sub, note)
+        result["results"][key] = sub
+    summarize_batch(result)
+
+
+def summarize_batch(result):
+    """
+    Fill result["output"] / result["error"] with one line per command of
+    result["results"]; error_code is that of the first failed command.
+    """
+    result["output"] = "\n".join(f"{key}: {sub['output']}" for key, sub in result["results"].items())
+    result["error"] = "; ".join(
+        f"{key}: {sub['error']}" for key, sub in result["results"].items() if sub["error"]
+    )
+    codes = [sub.get("error_code") for sub in result["results"].values() if sub["error"]]
+    if codes:
+        result["error_code"] = codes[0] or "other"
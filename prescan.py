@@ -0,0 +1,97 @@
+# prescan.py
+"""
+Reachability pre-scan.
+Probes every ip:port with a non-blocking TCP connect (and optionally waits
+for the SSH banner) under a short deadline, all in parallel on one event
+loop.  Dead hosts can then be reported at once instead of each holding a
+worker for the full TIMEOUT, and live hosts can be started slowest first.
+Only a host that does not answer in time, or has no route, counts as dead
+("unreachable"); a refused or reset connection or a missing banner gets its
+failures.py code, so the run can retry it like any other transient failure.
+"""
+
+import asyncio
+import time
+
+from config import PRESCAN_TIMEOUT, PRESCAN_BANNER, PRESCAN_CONCURRENCY
+from failures import classify_exception
+
+
+class ProbeResult:
+    """
+    Outcome of probing one host: alive, rtt (seconds to connect or banner),
+    error and, for a failed probe, its error code.
+    """
+
+    __slots__ = ("alive", "rtt", "error", "banner", "code")
+
+    def __init__(self, alive, rtt, error="", banner="", code=""):
+        self.alive = alive
+        self.rtt = rtt
+        self.error = error
+        self.banner = banner
+        self.code = code
+
+
+async def _probe(host, timeout, read_banner):
+    if not host.get("ip") or not host.get("port"):
+        return ProbeResult(True, 0.0)  # left to the worker to report the missing fields
+    if host.get("jump_host"):
+        return ProbeResult(True, 0.0)  # only reachable through its bastion; the worker finds out
+    start = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host["ip"], int(host["port"])), timeout
+        )
+    except asyncio.TimeoutError:
+        return ProbeResult(False, time.perf_counter() - start, f"No response within {timeout}s", code="unreachable")
+    except (OSError, ValueError, TypeError) as e:
+        code = classify_exception(e, "unreachable" if isinstance(e, OSError) else "input")
+        return ProbeResult(False, time.perf_counter() - start, str(e) or type(e).__name__, code=code)
+    try:
+        banner = ""
+        if read_banner:
+            # The port answered: whatever goes wrong from here is the server, not the route
+            remaining = max(0.0, timeout - (time.perf_counter() - start))
+            line = await asyncio.wait_for(reader.readline(), remaining)
+            banner = line.decode(errors="replace").strip()
+            if not banner.startswith("SSH-"):
+                return ProbeResult(False, time.perf_counter() - start,
+                                   f"No SSH banner ({banner[:40]!r})" if banner else "No SSH banner", code="banner")
+        return ProbeResult(True, time.perf_counter() - start, banner=banner)
+    except asyncio.TimeoutError:
+        return ProbeResult(False, time.perf_counter() - start, f"No SSH banner within {timeout}s", code="banner")
+    except OSError as e:
+        return ProbeResult(False, time.perf_counter() - start, str(e) or type(e).__name__,
+                           code=classify_exception(e, "reset"))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def probe_hosts_async(hosts, timeout=PRESCAN_TIMEOUT, read_banner=PRESCAN_BANNER,
+                            concurrency=PRESCAN_CONCURRENCY, cancel_event=None):
+    """
+    Probe hosts with at most `concurrency` sockets open at once.
+
+    Returns:
+        list: One ProbeResult per host, in the order of hosts.  Hosts skipped
+        because cancel_event was set are None.
+    """
+    results = [None] * len(hosts)
+    positions = iter(range(len(hosts)))
+
+    async def worker():
+        for i in positions:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            results[i] = await _probe(hosts[i], timeout, read_banner)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(hosts)) or 1)))
+    return results
+
+
+def probe_hosts(hosts, **kwargs):
+    """Blocking wrapper around probe_hosts_async (runs its own event loop)."""
+    return asyncio.run(probe_hosts_async(hosts, **kwargs))
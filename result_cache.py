@@ -0,0 +1,203 @@
+# result_cache.py
+"""
+On-disk cache of parsed results (SQLite), so repeat audits of slow-changing
+facts (kernel, CPU model, OS release) are answered without an SSH sweep.
+
+Entries are keyed by (ip, port, jump_host, username, command, parse), so
+the same private address behind two bastions is two entries, and editing a
+catalogue command or its pattern never serves an old answer.  A command is
+cached only when its catalogue JSON declares "cache_ttl" (seconds), and only
+results without an error are stored.
+
+Modes (CACHE_MODE in config.py, the GUI's Cache box, cli.py --cache):
+    refresh-stale  serve entries younger than their TTL, run the rest
+    cache-only     never connect; serve any entry regardless of age
+    force          run every host and refresh the cache
+    off            neither read nor write the cache
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import RESULT_CACHE_PATH, CACHE_DEFAULT_TTL
+from inventory import jump_host_key
+from parsing import summarize_batch
+
+CACHE_MODES = ("refresh-stale", "cache-only", "force", "off")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    jump_host TEXT NOT NULL,
+    username TEXT NOT NULL,
+    command TEXT NOT NULL,
+    parse TEXT NOT NULL,
+    output TEXT NOT NULL,
+    fields TEXT,
+    cached_at REAL NOT NULL,
+    PRIMARY KEY (ip, port, jump_host, username, command, parse)
+)
+"""
+
+
+def command_ttl(info):
+    """Seconds a command's result stays fresh (0 = not cached)."""
+    return info.get("cache_ttl", CACHE_DEFAULT_TTL) or 0
+
+
+def _commands(command_info):
+    """{key: entry} for a batch, {None: entry} for a single command."""
+    return command_info["batch"] if "batch" in command_info else {None: command_info}
+
+
+class ResultCache:
+    """
+    Thread-safe wrapper around one SQLite file.
+
+    put() buffers rows and commits every `batch` rows (and on flush/close),
+    so a large sweep does not pay a disk sync per host.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, batch=200):
+        self.path = path
+        self.batch = batch
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(results)")]
+        if columns and "jump_host" not in columns:
+            # Written by a version that keyed hosts without their jump host; it is only a cache
+            self._db.execute("DROP TABLE results")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(host, info):
+        return (str(host.get("ip")), int(host.get("port") or 0), jump_host_key(host.get("jump_host")),
+                host.get("username") or "", info["command"], json.dumps(info["parse"]))
+
+    def get(self, host, info):
+        """
+        Returns:
+            tuple: (output, fields or None, cached_at) or None when not cached.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT output, fields, cached_at FROM results "
+                "WHERE ip=? AND port=? AND jump_host=? AND username=? AND command=? AND parse=?",
+                self.key(host, info),
+            ).fetchone()
+        if row is None:
+            return None
+        output, fields, cached_at = row
+        return output, json.loads(fields) if fields else None, cached_at
+
+    def put(self, host, info, sub):
+        """Store one command's parsed result (sub has output and optional fields)."""
+        row = self.key(host, info) + (sub.get("output", ""), json.dumps(sub["fields"]) if sub.get("fields") else None,
+                                      time.time())
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        try:
+            self._db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Failed to write result cache {self.path}: {e}")
+        self._pending = []
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._db.close()
+
+    def lookup(self, host, command_info, mode, now=None):
+        """
+        Build a result for host from the cache, if mode allows serving it.
+
+        Every command of command_info must be cached (and fresh, unless
+        mode is "cache-only"); otherwise None is returned and the host runs.
+        In cache-only mode a miss yields an error result instead.
+        """
+        if mode in ("force", "off"):
+            return None
+        now = time.time() if now is None else now
+        commands = _commands(command_info)
+
+        hits, missing = {}, []
+        for key, info in commands.items():
+            entry = self.get(host, info)
+            fresh = entry is not None and now - entry[2] < command_ttl(info)
+            if entry is None or (mode != "cache-only" and not fresh):
+                missing.append(key)
+            else:
+                hits[key] = entry
+
+        if missing and mode != "cache-only":
+            return None
+
+        result = {
+            "hostname": host.get("hostname"),
+            "ip": host.get("ip"),
+            "port": host.get("port"),
+            "row_id": host.get("row_id"),
+            "output": "",
+            "error": "",
+            "cached": True,
+            "timings": {},
+        }
+        if host.get("jump_host"):
+            result["jump_host"] = host["jump_host"]
+        if hits:
+            oldest = min(entry[2] for entry in hits.values())
+            result["cached_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(oldest))
+
+        def sub_result(key):
+            if key not in hits:
+                return {"output": "", "error": "Not in cache (cache-only mode)"}
+            output, fields, _ = hits[key]
+            sub = {"output": output, "error": ""}
+            if fields:
+                sub["fields"] = fields
+            return sub
+
+        if "batch" in command_info:
+            result["results"] = {key: sub_result(key) for key in commands}
+            summarize_batch(result)
+        else:
+            result.update(sub_result(None))
+        return result
+
+    def store(self, host, command_info, result):
+        """Cache the error-free, cacheable parts of a result fresh from the host."""
+        if result.get("cached"):
+            return
+        for key, info in _commands(command_info).items():
+            if not command_ttl(info):
+                continue
+            sub = result if key is None else result.get("results", {}).get(key)
+            if sub and not sub.get("error"):
+                self.put(host, info, sub)
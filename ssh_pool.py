@@ -0,0 +1,147 @@
+# ssh_pool.py
+"""
+Session-wide pool of authenticated paramiko Transports.
+Keyed by (ip, port, username, jump_host) so successive commands against
+the same hosts open new channels on an existing connection instead of
+repeating the TCP connect, key exchange and password auth.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from config import DEBUG, POOL_MAX_SIZE, POOL_IDLE_TIMEOUT
+from credentials import default_auth
+from ssh_worker import start_transport
+
+
+class _PoolEntry:
+    def __init__(self, transport):
+        self.transport = transport
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+class SSHConnectionPool:
+    """
+    Thread-safe cache of live Transports.
+
+    Entries idle for longer than idle_timeout are closed, and once the pool
+    holds more than max_size entries the least recently used idle ones are
+    closed.  Transports currently lent out are never closed by eviction.
+    """
+
+    def __init__(self, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(host_info):
+        return (host_info["ip"], int(host_info["port"]), host_info["username"], host_info.get("jump_host") or "")
+
+    @contextmanager
+    def session(self, host_info, timings=None, host_keys=None, auth=None, bastions=None):
+        """
+        Lend out a live Transport for host_info, connecting if needed.
+        A new connection records its dns / connect / kex / auth phases in
+        timings; a reused one records none.  host_keys (HostKeyStore) verifies
+        the server of a new connection and auth (SessionAuth) logs it in; a
+        reused one needs neither.  bastions (BastionPool) carries a new
+        connection to a host with a jump_host.
+        """
+        key = self.key_for(host_info)
+        entry = self._acquire(key, host_info, timings, host_keys, auth, bastions)
+        try:
+            yield entry.transport
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def discard(self, host_info):
+        """Drop and close the pooled Transport for host_info (e.g. it went stale)."""
+        key = self.key_for(host_info)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            self._close(key, entry)
+
+    def evict_idle(self):
+        """Close entries that are dead, idle too long, or over the size cap."""
+        now = time.monotonic()
+        doomed = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.in_use:
+                    continue
+                if not entry.transport.is_active() or now - entry.last_used > self.idle_timeout:
+                    doomed.append((key, self._entries.pop(key)))
+
+            overflow = len(self._entries) - self.max_size
+            if overflow > 0:
+                idle = sorted(
+                    (item for item in self._entries.items() if not item[1].in_use),
+                    key=lambda item: item[1].last_used,
+                )
+                for key, _ in idle[:overflow]:
+                    doomed.append((key, self._entries.pop(key)))
+
+        for key, entry in doomed:
+            self._close(key, entry)
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for key, entry in entries:
+            self._close(key, entry)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _acquire(self, key, host_info, timings=None, host_keys=None, auth=None, bastions=None):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # One connect per key at a time; other keys connect in parallel
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry.transport.is_active():
+                    entry.in_use += 1
+                    entry.last_used = time.monotonic()
+                    return entry
+                stale = self._entries.pop(key, None)
+            if stale:
+                self._close(key, stale)
+
+            entry = _PoolEntry(self._connect(host_info, timings, host_keys, auth, bastions))
+            with self._lock:
+                entry.in_use += 1
+                self._entries[key] = entry
+
+        self.evict_idle()
+        return entry
+
+    def _connect(self, host_info, timings=None, host_keys=None, auth=None, bastions=None):
+        if DEBUG:
+            print(f"[DEBUG] Pool connecting to {host_info['ip']}:{host_info['port']} as {host_info['username']}")
+
+        transport = start_transport(host_info, timings, host_keys, bastions)
+        try:
+            (auth or default_auth()).authenticate(transport, host_info, timings)
+        except Exception:
+            transport.close()
+            raise
+        return transport
+
+    def _close(self, key, entry):
+        try:
+            entry.transport.close()
+        except Exception:
+            if DEBUG:
+                print(f"[DEBUG] Failed to close pooled transport for {key}")
@@ -5,99 +5,350 @@ Each function should run in a thread and safely report back to the queue.
 """
 
 import paramiko
-import re
-from config import TIMEOUT, DEBUG
+import select
+import socket
+import time
+from config import TIMEOUT, DEBUG, BATCH_COMBINED, MAX_OUTPUT_BYTES, COMMAND_TIMEOUT
+from credentials import default_auth
+from failures import classify_exception
+from hostkeys import HostKeyError
+from parsing import parse_output, build_batch_command, parse_batch_output, parse_batch_results
 
-def run_ssh_task(host_info, command_info, queue):
+READ_CHUNK = 32768
+
+def run_ssh_task(host_info, command_info, queue, pool=None, host_keys=None, auth=None, bastions=None):
     """
     Connect to a single host, execute command, parse result, and return output.
 
     Args:
         host_info (dict): Contains 'ip', 'port', 'username', 'password', and 'hostname'.
-        command_info (dict): Contains 'command' and 'parse' regex.
-        queue (Queue): Shared queue to return results to the GUI.
+        command_info (dict): Contains 'command' and 'parse' regex, or 'batch'
+            mapping command keys to such dicts to run several over one connection.
+        queue (Queue): Shared queue to return results to the GUI, or None to
+            only return the result (the dispatcher may retry it first).
+        pool (SSHConnectionPool): Optional.  Reuse an authenticated transport
+            for this host instead of connecting and closing a fresh client.
+        host_keys (HostKeyStore): Optional.  Verify (and learn) the server's
+            host key before authenticating; without it any key is accepted.
+        auth (SessionAuth): Session keys, agent and login throttle.  Without
+            it, an unthrottled process-wide one is used.
+        bastions (BastionPool): Optional.  A host with a jump_host is reached
+            through it; without it, every host is connected to directly.
+
+    Returns:
+        dict: The same result that was put on the queue.  A failure has an
+        "error_code" (see failures.py) as well as its "error" message.
     """
-    import paramiko
-    import re
-    from config import TIMEOUT, DEBUG
+    from bastion import JumpHostError  # bastion.py builds on this module
 
+    started = time.time()
     result = {
         "hostname": host_info.get("hostname"),
         "ip": host_info.get("ip"),
         "port": host_info.get("port"),
+        "row_id": host_info.get("row_id"),
         "output": "",
-        "error": ""
+        "error": "",
+        "timings": {}
     }
+    if host_info.get("jump_host"):
+        result["jump_host"] = host_info["jump_host"]  # part of the host's identity (history, cache)
 
-    required_fields = ["ip", "port", "username", "password"]
+    # With use_agent or a key_file the password may be empty: keys are used instead
+    key_auth = host_info.get("use_agent") or host_info.get("key_file")
+    required_fields = ["ip", "port", "username"] + ([] if key_auth else ["password"])
     missing_fields = [field for field in required_fields if not host_info.get(field)]
     if missing_fields:
         result["error"] = f"Missing required fields: {', '.join(missing_fields)}"
-        queue.put(result)
-        return
+        result["error_code"] = "input"
+        stamp_times(result, started)
+        if queue is not None:
+            queue.put(result)
+        return result
 
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    transport = None
+    auth = auth or default_auth()
 
     try:
-        if DEBUG:
-            print(f"[DEBUG] Connecting to {host_info['ip']}:{host_info['port']} as {host_info['username']}")
-
-        ssh.connect(
-            hostname=host_info["ip"],
-            port=int(host_info["port"]),
-            username=host_info["username"],
-            password=host_info["password"],
-            timeout=TIMEOUT
-        )
-
-        if DEBUG:
-            print(f"[DEBUG] Executing command: {command_info['command']}")
-
-        stdin, stdout, stderr = ssh.exec_command(command_info["command"])
-        output = stdout.read().decode().strip()
-        error_output = stderr.read().decode().strip()
-        exit_status = stdout.channel.recv_exit_status()
-
-        if DEBUG:
-            print(f"[DEBUG] Raw stdout from {host_info['ip']}:\n{output}")
-            print(f"[DEBUG] Raw stderr from {host_info['ip']}:\n{error_output}")
-            print(f"[DEBUG] Exit status: {exit_status}")
+        if pool is not None:
+            _exec_pooled(pool, host_info, command_info, result, host_keys, auth, bastions)
+        else:
+            if DEBUG:
+                print(f"[DEBUG] Connecting to {host_info['ip']}:{host_info['port']} as {host_info['username']}")
 
-        result["output"] = "PARSE_ERROR" if output == "" else output
+            timings = result["timings"]
+            transport = start_transport(host_info, timings, host_keys, bastions)
+            auth.authenticate(transport, host_info, timings)
 
-        if exit_status != 0 or error_output:
-            result["error"] = f"Exit Code {exit_status}: {error_output}".strip()
-
-        try:
-            pattern = command_info["parse"]
-            if pattern == "(.+)":
-                # Generic multi-line capture for manual or fallback commands
-                matches = re.findall(pattern, output)
-                if matches:
-                    result["output"] = "\n".join(matches)
-                else:
-                    result["error"] = "Parse failed: no matches found"
-            else:
-                match = re.search(pattern, output)
-                if match:
-                    result["output"] = match.group(1)
-                elif not result["error"]:
-                    result["error"] = "Parse failed: pattern not found"
-        except re.error as re_err:
-            result["error"] = f"Regex error: {re_err}"
+            _exec_on_transport(transport, host_info, command_info, result)
 
     except paramiko.AuthenticationException:
         result["error"] = "Authentication failed"
+        result["error_code"] = "auth"
+    except HostKeyError as key_err:
+        result["error"] = f"Host key rejected: {key_err}"
+        result["error_code"] = "hostkey"
+    except JumpHostError as jump_err:
+        result["error"] = f"SSH error: {jump_err}"
+        result["error_code"] = "jump"
     except paramiko.SSHException as ssh_err:
         result["error"] = f"SSH error: {ssh_err}"
+        result["error_code"] = classify_exception(ssh_err, "ssh")
     except Exception as e:
         result["error"] = f"Unexpected error: {e}"
+        result["error_code"] = classify_exception(e)
     finally:
         try:
-            ssh.close()
+            if transport is not None:
+                transport.close()
         except Exception:
             if DEBUG:
                 print(f"[DEBUG] Failed to close SSH connection for {host_info['ip']}")
 
-    queue.put(result)
+    stamp_times(result, started)
+    if queue is not None:
+        queue.put(result)
+    return result
+
+
+def stamp_times(result, started):
+    """
+    Record this host's own start/end wall-clock times and duration on result,
+    and round its phase timings, adding "total".
+    """
+    finished = time.time()
+    result["started_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started))
+    result["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(finished))
+    result["duration"] = round(finished - started, 3)
+    timings = result.setdefault("timings", {})
+    for phase in timings:
+        timings[phase] = round(timings[phase], 4)
+    timings["total"] = result["duration"]
+
+
+def lap(timings, phase, mark):
+    """
+    Add the seconds since mark (a time.perf_counter() value) to timings[phase].
+
+    Returns:
+        float: The current perf_counter, to use as the next mark.
+    """
+    now = time.perf_counter()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + now - mark
+    return now
+
+
+def open_socket(host_info, timings=None):
+    """
+    Resolve and TCP-connect to host_info, recording the "dns" and "connect"
+    phases in timings.
+
+    Returns:
+        socket.socket: Connected socket with TIMEOUT applied.
+    """
+    port = int(host_info["port"])
+    mark = time.perf_counter()
+    family, socktype, proto, _, address = socket.getaddrinfo(host_info["ip"], port, type=socket.SOCK_STREAM)[0]
+    mark = lap(timings, "dns", mark)
+
+    sock = socket.socket(family, socktype, proto)
+    sock.settimeout(TIMEOUT)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    lap(timings, "connect", mark)
+    return sock
+
+
+def start_transport(host_info, timings=None, host_keys=None, bastions=None):
+    """
+    Connect to host_info and run the key exchange, recording the "dns",
+    "connect" and "kex" phases in timings.  With host_keys the server's key is
+    verified before anything is sent to it; no authentication happens here.
+    With bastions (BastionPool), a host with a jump_host is connected to
+    through a channel on the bastion's connection instead of a socket.
+
+    Returns:
+        paramiko.Transport: Negotiated, not yet authenticated.
+    """
+    if bastions is not None and host_info.get("jump_host"):
+        sock = bastions.tunnel(host_info, timings)
+    else:
+        sock = open_socket(host_info, timings)
+    transport = paramiko.Transport(sock)
+    try:
+        if host_keys is not None:
+            host_keys.prefer(transport, host_info)
+        mark = time.perf_counter()
+        transport.start_client(timeout=TIMEOUT)
+        lap(timings, "kex", mark)
+        if host_keys is not None:
+            host_keys.check(transport, host_info)
+    except Exception:
+        transport.close()
+        raise
+    return transport
+
+
+def _exec_channel(chan, command, timings=None):
+    """
+    Run command on an open session channel.  The exec request counts towards
+    the "exec" phase in timings, draining the output towards "read".
+
+    Returns:
+        tuple: (stdout, stderr, exit status, note) where note is "" or explains
+        a truncated or timed out read.
+    """
+    if DEBUG:
+        print(f"[DEBUG] Executing command: {command}")
+
+    try:
+        mark = time.perf_counter()
+        chan.exec_command(command)
+        mark = lap(timings, "exec", mark)
+        stdout, stderr, exit_status, note = read_channel(chan)
+        lap(timings, "read", mark)
+    finally:
+        chan.close()
+    return stdout.decode(errors="replace").strip(), stderr.decode(errors="replace").strip(), exit_status, note
+
+
+def read_channel(chan, max_bytes=MAX_OUTPUT_BYTES, timeout=COMMAND_TIMEOUT):
+    """
+    Drain stdout and stderr of a running channel together, chunk by chunk.
+
+    Reading both streams as data arrives keeps the remote side from blocking
+    on a full stderr window.  Each stream keeps at most max_bytes; anything
+    beyond is read and discarded.  After timeout seconds the partial output
+    is returned instead of waiting for the command to finish.
+
+    Returns:
+        tuple: (stdout bytes, stderr bytes, exit status or None, note)
+    """
+    deadline = time.monotonic() + timeout
+    streams = {
+        "stdout": {"recv": chan.recv, "ready": chan.recv_ready, "chunks": [], "size": 0},
+        "stderr": {"recv": chan.recv_stderr, "ready": chan.recv_stderr_ready, "chunks": [], "size": 0},
+    }
+    truncated = False
+    timed_out = False
+
+    while True:
+        progressed = False
+        for stream in streams.values():
+            if stream["ready"]():
+                data = stream["recv"](READ_CHUNK)
+                progressed = True
+                keep = data[:max(0, max_bytes - stream["size"])]
+                if keep:
+                    stream["chunks"].append(keep)
+                    stream["size"] += len(keep)
+                truncated = truncated or len(keep) < len(data)
+        if progressed:
+            continue
+
+        # exit_status_ready() is also true once the channel closes
+        if chan.exit_status_ready() and not chan.recv_ready() and not chan.recv_stderr_ready():
+            break
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        # The channel's pipe is signalled on new data on either stream and on EOF
+        select.select([chan], [], [], min(remaining, 1.0))
+
+    notes = []
+    if timed_out:
+        notes.append(f"Command timed out after {timeout}s (partial output)")
+    if truncated:
+        notes.append(f"Output truncated at {max_bytes} bytes")
+
+    exit_status = None if timed_out else chan.recv_exit_status()
+    return (
+        b"".join(streams["stdout"]["chunks"]),
+        b"".join(streams["stderr"]["chunks"]),
+        exit_status,
+        "; ".join(notes),
+    )
+
+
+def _exec_on_transport(transport, host_info, command_info, result, chan=None):
+    """
+    Run command_info (single, batch or file transfer) over transport and
+    parse into result.  chan, if given, is an already opened session channel
+    to use first.  Opening channels counts towards the "exec" phase, parsing
+    towards "parse".
+    """
+    timings = result.setdefault("timings", {})
+
+    if "transfer" in command_info:
+        from transfer import run_transfer  # transfer.py builds on this module
+        run_transfer(transport, host_info, command_info["transfer"], result, chan)
+        return
+
+    def open_channel():
+        nonlocal chan
+        if chan is not None:
+            opened, chan = chan, None
+            return opened
+        mark = time.perf_counter()
+        opened = transport.open_session(timeout=TIMEOUT)
+        lap(timings, "exec", mark)
+        return opened
+
+    if "batch" in command_info:
+        commands = command_info["batch"]
+        if BATCH_COMBINED:
+            script, token = build_batch_command(commands)
+            output, error_output, _, note = _exec_channel(open_channel(), script, timings)
+            mark = time.perf_counter()
+            parse_batch_output(output, error_output, token, commands, result, note)
+        else:
+            outputs = {
+                key: _exec_channel(open_channel(), info["command"], timings)
+                for key, info in commands.items()
+            }
+            mark = time.perf_counter()
+            parse_batch_results(outputs, commands, result)
+        lap(timings, "parse", mark)
+        return
+
+    output, error_output, exit_status, note = _exec_channel(open_channel(), command_info["command"], timings)
+
+    if DEBUG:
+        print(f"[DEBUG] Raw stdout from {host_info['ip']}:\n{output}")
+        print(f"[DEBUG] Raw stderr from {host_info['ip']}:\n{error_output}")
+        print(f"[DEBUG] Exit status: {exit_status}")
+
+    mark = time.perf_counter()
+    parse_output(output, error_output, exit_status, command_info, result, note)
+    lap(timings, "parse", mark)
+
+
+def _exec_pooled(pool, host_info, command_info, result, host_keys=None, auth=None, bastions=None):
+    """
+    Open a channel on the pooled transport for host_info and run command_info.
+    A transport the server has quietly dropped is replaced once; the command
+    itself is never sent twice.
+    """
+    timings = result.setdefault("timings", {})
+    for attempt in range(2):
+        with pool.session(host_info, timings, host_keys, auth, bastions) as transport:
+            try:
+                mark = time.perf_counter()
+                chan = transport.open_session(timeout=TIMEOUT)
+                lap(timings, "exec", mark)
+            except (paramiko.SSHException, EOFError, OSError):
+                if attempt:
+                    raise
+                chan = None
+            if chan is not None:
+                return _exec_on_transport(transport, host_info, command_info, result, chan=chan)
+
+        if DEBUG:
+            print(f"[DEBUG] Pooled transport for {host_info['ip']} went stale, reconnecting")
+        pool.discard(host_info)
@@ -0,0 +1,204 @@
+# telemetry.py
+"""
+Run-level telemetry built from the per-host phase timings the workers record
+in result["timings"] (seconds):
+
+    dns      name resolution
+    connect  TCP connect
+    kex      SSH key exchange (thread engine; the async engine counts it in auth)
+    auth     authentication
+    exec     opening the channel and starting the command
+    read     waiting for and draining the command's output
+    parse    applying the parse patterns
+    total    the host's whole run, same as result["duration"]
+
+Hosts reusing a pooled connection have no dns/connect/kex/auth entries.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+from failures import classify
+
+PHASES = ("dns", "connect", "kex", "auth", "exec", "read", "parse", "total")
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def error_kind(error):
+    """
+    Group an error message for the breakdown.  Connection level errors keep
+    their detail ("Unexpected error: timed out"), minus trailing
+    parentheticals such as the peer address; the rest collapse to their prefix ("Parse failed").
+    """
+    line = error.strip().splitlines()[0] if error.strip() else "Unknown error"
+    prefix, _, detail = line.partition(":")
+    if prefix in ("SSH error", "Unexpected error", "Unreachable") and detail.strip():
+        return re.sub(r"(\s*\([^()]*\))+$", "", line)[:80]
+    return prefix
+
+
+class RunTelemetry:
+    """
+    Collects results as they complete and summarizes the run.
+
+    record() is thread-safe and cheap (appends only); summary() sorts the
+    samples and may be called at any time, including mid-run.
+    """
+
+    def __init__(self, total, max_workers, engine):
+        self.total = total
+        self.max_workers = max_workers
+        self.engine = engine
+        self.started_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+        self.completed = 0
+        self.cached = 0
+        self.errors = Counter()
+        self.error_codes = Counter()  # failures.py error_code -> hosts
+        self.samples = {phase: [] for phase in PHASES}
+        self.extra = {}  # further sections for summary(), e.g. the dispatcher's concurrency stats
+        self._start = time.monotonic()
+        self._end = None
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        timings = result.get("timings") or {}
+        with self._lock:
+            self.completed += 1
+            if result.get("error"):
+                self.errors[error_kind(result["error"])] += 1
+                self.error_codes[classify(result)] += 1
+            if result.get("cached"):
+                self.cached += 1
+                return  # answered without a connection; would skew the latencies
+            for phase, seconds in timings.items():
+                if phase in self.samples:
+                    self.samples[phase].append(seconds)
+
+    def finish(self, cancelled=False):
+        """Stop the wall clock (first call wins)."""
+        with self._lock:
+            if self._end is None:
+                self._end = time.monotonic()
+                self.finished_at = time.time()
+                self.cancelled = cancelled
+
+    @property
+    def elapsed(self):
+        end = self._end if self._end is not None else time.monotonic()
+        return end - self._start
+
+    def summary(self):
+        """
+        Returns:
+            dict: JSON-serializable run summary.  "utilization" is the share of
+            worker slots that were busy (sum of host totals / (wall * workers));
+            near 1.0 the run was limited by max_workers, well below it the
+            hosts themselves were the bottleneck.
+        """
+        with self._lock:
+            samples = {phase: sorted(values) for phase, values in self.samples.items()}
+            completed = self.completed
+            cached = self.cached
+            errors = dict(self.errors.most_common())
+            error_codes = dict(self.error_codes.most_common())
+
+        wall = self.elapsed
+        busy = sum(samples["total"])
+        latency = {}
+        for phase in PHASES:
+            values = samples[phase]
+            if not values:
+                continue
+            stats = {"count": len(values), "mean": round(sum(values) / len(values), 4)}
+            for pct in PERCENTILES:
+                stats[f"p{pct}"] = percentile(values, pct)
+            stats["max"] = values[-1]
+            latency[phase] = stats
+
+        return {
+            "engine": self.engine,
+            "max_workers": self.max_workers,
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "finished_at": (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.finished_at))
+                            if self.finished_at else None),
+            "cancelled": self.cancelled,
+            "total": self.total,
+            "completed": completed,
+            "cached": cached,
+            "succeeded": completed - sum(errors.values()),
+            "failed": sum(errors.values()),
+            "wall_s": round(wall, 3),
+            "hosts_per_s": round(completed / wall, 2) if wall > 0 else 0.0,
+            "mean_concurrency": round(busy / wall, 2) if wall > 0 else 0.0,
+            "utilization": round(busy / (wall * self.max_workers), 3) if wall > 0 and self.max_workers else 0.0,
+            "latency": latency,
+            "errors": errors,
+            "error_codes": error_codes,
+            **self.extra,
+        }
+
+
+def format_summary(summary):
+    """Human-readable multi-line rendering of summary() for the GUI and CLI."""
+    lines = [
+        f"Run: {summary['completed']}/{summary['total']} hosts in {summary['wall_s']}s "
+        f"({summary['hosts_per_s']} hosts/s), {summary['failed']} failed"
+        + (f", {summary['cached']} from cache" if summary.get("cached") else "")
+        + (" [cancelled]" if summary["cancelled"] else ""),
+        f"Workers: {summary['max_workers']} ({summary['engine']}), mean busy {summary['mean_concurrency']}, "
+        f"utilization {summary['utilization']:.0%}",
+        "",
+        f"{'Phase':<8} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}",
+    ]
+    for phase, stats in summary["latency"].items():
+        lines.append(
+            f"{phase:<8} {stats['count']:>6} {stats['p50']:>8.3f} {stats['p95']:>8.3f} "
+            f"{stats['p99']:>8.3f} {stats['max']:>8.3f}"
+        )
+    concurrency = summary.get("concurrency")
+    if concurrency:
+        lines.insert(2, f"Adaptive limit: {concurrency['limit']} at the end, peak {concurrency['peak']}, "
+                        f"{concurrency['backoffs']} backoffs")
+    prescan = summary.get("prescan")
+    if prescan:
+        lines.insert(2, f"Pre-scan: {prescan['alive']}/{prescan['probed']} reachable in {prescan['elapsed_s']}s, "
+                        f"{prescan['unreachable']} skipped")
+    host_keys = summary.get("host_keys")
+    if host_keys and host_keys["mode"] != "off":
+        lines.insert(2, f"Host keys ({host_keys['mode']}): {host_keys['verified']} verified, "
+                        f"{host_keys['learned']} learned, {host_keys['changed']} changed, "
+                        f"{host_keys['rejected']} rejected")
+    jump_hosts = summary.get("jump_hosts")
+    if jump_hosts:
+        lines.insert(2, f"Jump hosts: {jump_hosts['tunnels']} tunnels over {jump_hosts['logins']} bastion logins "
+                        f"(up to {jump_hosts['fan_out']} each), {jump_hosts['failed']} failed logins")
+    retries = summary.get("retries")
+    if retries:
+        codes = ", ".join(f"{code} {count}" for code, count in retries["codes"].items())
+        lines.insert(2, f"Retries: {retries['retried']} ({codes}), {retries['recovered']} hosts recovered, "
+                        f"{retries['exhausted']} still failing, budget {retries['budget']}")
+    if summary.get("error_codes"):
+        lines += ["", "Failures: " + ", ".join(f"{code} {count}" for code, count in summary["error_codes"].items())]
+    if summary["errors"]:
+        lines += ["", "Errors:"]
+        lines += [f"{count:>6}  {kind}" for kind, count in summary["errors"].items()]
+    return "\n".join(lines)
+
+
+def save_summary(summary, path):
+    """Write summary as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
@@ -0,0 +1,12 @@
+# tests/conftest.py
+"""
+Unit tests for the pure logic behind a sweep (no SSH, no GUI).
+The modules live at the repository root, so it goes on sys.path first.
+
+    python -m pytest -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+# tests/test_catalogue.py
+import json
+
+from catalogue import CommandCatalogue
+
+
+def _write(directory, name, commands):
+    for details in commands.values():
+        details.setdefault("description", "")
+    (directory / name).write_text(json.dumps(commands))
+
+
+def test_search_by_name_or_command(tmp_path):
+    _write(tmp_path, "posix_disk.json", {"Disk Free": {"command": "df -hP", "parse": "(.+)"}})
+    _write(tmp_path, "posix_memory.json", {"Memory Usage": {"command": "free -m", "parse": "(.+)"}})
+    _write(tmp_path, "debian_kernel.json", {"Swappiness": {"command": "sysctl vm.swappiness", "parse": "(.+)"}})
+    catalogue = CommandCatalogue(str(tmp_path))
+    assert catalogue.search("") == ["DEBIAN: Swappiness", "POSIX: Disk Free", "POSIX: Memory Usage"]
+    assert catalogue.search("posix") == ["POSIX: Disk Free", "POSIX: Memory Usage"]
+    # Narrowing reuses the previous matches; widening searches everything again
+    assert catalogue.search("posix: d") == ["POSIX: Disk Free"]
+    assert catalogue.search("FREE") == ["POSIX: Disk Free", "POSIX: Memory Usage"]
+    assert catalogue.search("sysctl") == ["DEBIAN: Swappiness"]
+    assert catalogue.search("nothing") == []
+
+
+def test_bad_files_are_skipped(tmp_path):
+    _write(tmp_path, "posix_date.json", {"System Time": {"command": "/bin/date", "parse": "(.+)"}})
+    (tmp_path / "error_blank.json").write_text("")
+    (tmp_path / "error_bad.json").write_text("{not json")
+    catalogue = CommandCatalogue(str(tmp_path))
+    assert list(catalogue.commands) == ["POSIX: System Time"]
@@ -0,0 +1,57 @@
+# tests/test_concurrency.py
+import pytest
+
+from concurrency import AdaptiveLimit, group_for, handshake_signal
+
+
+def _window(limit, latency=0.1, congested=0):
+    """Feed one full window of observations (limit completions)."""
+    size = limit.limit
+    for i in range(size):
+        limit.observe(latency, i < congested)
+
+
+def test_slow_start_doubles_then_backs_off_then_grows_by_one():
+    limit = AdaptiveLimit(floor=2, ceiling=100, initial=5)
+    _window(limit)
+    assert limit.limit == 10
+    _window(limit)
+    assert limit.limit == 20
+    _window(limit, latency=1.0)  # ten times the best median
+    assert limit.limit == 14 and limit.backoffs == 1
+    _window(limit)
+    assert limit.limit == 15
+    assert limit.peak == 20
+
+
+def test_congestion_errors_cut_the_limit():
+    limit = AdaptiveLimit(floor=2, ceiling=100, initial=10)
+    _window(limit, congested=2)  # 20% > CONGESTION_ERROR_RATE
+    assert limit.limit == 7
+
+
+def test_floor_and_ceiling():
+    limit = AdaptiveLimit(floor=4, ceiling=12, initial=50)
+    assert limit.limit == 12
+    _window(limit)
+    assert limit.limit == 12
+    for _ in range(5):
+        _window(limit, congested=limit.limit)
+    assert limit.limit == 4
+
+
+def test_handshake_signal():
+    latency, congested = handshake_signal({"timings": {"dns": 0.01, "connect": 0.1, "auth": 0.2, "exec": 5.0}})
+    assert latency == pytest.approx(0.31) and not congested
+    assert handshake_signal({"timings": {"exec": 5.0}}) == (None, False)  # pooled connection
+    assert handshake_signal({"error": "SSH error: Error reading SSH protocol banner"}) == (None, True)
+    assert handshake_signal({"error": "SSH error: timed out"}) == (None, True)
+    assert handshake_signal({"error": "Authentication failed."}) == (None, False)
+    assert handshake_signal({"error": "Exit Code 1: oops", "timings": {"connect": 0.1}}) == (None, False)
+
+
+def test_group_for():
+    assert group_for({"ip": "10.1.2.3"}) == "10.1.2.0/24"
+    assert group_for({"ip": "10.1.2.3", "jump_host": "east"}) == "via east"
+    assert group_for({"ip": "2001:db8::5"}) == "2001:db8::/64"
+    assert group_for({"ip": "web-01"}) == "web-01"
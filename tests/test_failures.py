@@ -0,0 +1,129 @@
+# tests/test_failures.py
+import errno
+import socket
+
+import pytest
+
+from failures import RetryQueue, classify, classify_exception
+
+
+@pytest.mark.parametrize("result, code", [
+    ({"error": ""}, ""),
+    ({}, ""),
+    ({"error": "anything", "error_code": "jump"}, "jump"),
+    ({"error": "Unreachable: No response within 2.0s (pre-scan)"}, "unreachable"),
+    ({"error": "x", "unreachable": True}, "unreachable"),
+    ({"error": "Authentication failed."}, "auth"),
+    ({"error": "Host key rejected: host key changed"}, "hostkey"),
+    ({"error": "Missing required fields: username"}, "input"),
+    ({"error": "Parse failed: pattern not found"}, "parse"),
+    ({"error": "Regex error: invalid regex"}, "parse"),
+    ({"error": "Exit Code 1: No such file"}, "exec"),
+    ({"error": "Transfer failed: permission denied"}, "transfer"),
+    ({"error": "SSH error: Error reading SSH protocol banner"}, "banner"),
+    ({"error": "SSH error: Connection reset by peer"}, "reset"),
+    ({"error": "SSH error: timed out"}, "timeout"),
+    ({"error": "SSH error: Connection refused"}, "refused"),
+    ({"error": "SSH error: Incompatible ssh peer"}, "ssh"),
+    ({"error": "Unexpected error: something odd"}, "other"),
+])
+def test_classify(result, code):
+    assert classify(result) == code
+
+
+@pytest.mark.parametrize("exc, code", [
+    (socket.timeout(), "timeout"),
+    (TimeoutError(), "timeout"),
+    (ConnectionRefusedError(), "refused"),
+    (ConnectionResetError(), "reset"),
+    (EOFError(), "reset"),
+    (socket.gaierror(), "dns"),
+    (OSError(errno.EHOSTUNREACH, "No route to host"), "unreachable"),
+    (Exception("Error reading SSH protocol banner"), "banner"),
+    (Exception("nothing known"), "other"),
+])
+def test_classify_exception(exc, code):
+    assert classify_exception(exc) == code
+
+
+def _failure(error, **extra):
+    return dict({"error": error}, **extra)
+
+
+def test_transient_failure_is_queued_and_recovers():
+    retries = RetryQueue(base=0, budget_min=10)
+    host = {"ip": "10.0.0.1"}
+    assert retries.offer(host, _failure("SSH error: Connection reset by peer")) is True
+    assert len(retries) == 1
+    assert retries.pop_due() is host
+    result = {"error": ""}
+    assert retries.offer(host, result) is False
+    assert result["attempts"] == 2
+    stats = retries.stats()
+    assert stats["retried"] == 1 and stats["recovered"] == 1 and stats["codes"] == {"reset": 1}
+
+
+def test_permanent_failure_is_final():
+    retries = RetryQueue(base=0)
+    result = _failure("Authentication failed.")
+    assert retries.offer({"ip": "10.0.0.1"}, result) is False
+    assert "attempts" not in result
+    assert len(retries) == 0
+
+
+def test_started_command_is_never_retried():
+    retries = RetryQueue(base=0)
+    result = _failure("SSH error: timed out", timings={"connect": 0.1, "exec": 0.2})
+    assert retries.offer({"ip": "10.0.0.1"}, result) is False
+
+
+def test_max_attempts():
+    retries = RetryQueue(base=0, max_attempts=3, budget_min=10)
+    host = {"ip": "10.0.0.1"}
+    assert retries.offer(host, _failure("SSH error: timed out"))
+    assert retries.pop_due() is host
+    assert retries.offer(host, _failure("SSH error: timed out"))
+    assert retries.pop_due() is host
+    last = _failure("SSH error: timed out")
+    assert retries.offer(host, last) is False
+    assert last["attempts"] == 3
+    assert retries.stats()["exhausted"] == 1
+
+
+def test_budget_caps_retries_per_run():
+    # 0.1 retries per host seen so far, never fewer than 2: the third retry
+    # only becomes available with the 30th host
+    retries = RetryQueue(base=0, budget=0.1, budget_min=2)
+    hosts = [{"ip": f"10.0.0.{i}"} for i in range(30)]
+    for host in hosts[:25]:
+        retries.offer(host, {"error": ""})
+    assert retries.allowed() == 2
+    queued = [retries.offer(host, _failure("SSH error: timed out")) for host in hosts[25:]]
+    assert queued == [True, True, False, False, True]
+    stats = retries.stats()
+    assert stats["retried"] == 3 and stats["exhausted"] == 2 and stats["budget"] == 3
+
+
+def test_budget_minimum():
+    retries = RetryQueue(base=0, budget=0.0, budget_min=1)
+    assert retries.offer({"ip": "a"}, _failure("SSH error: timed out"))
+    assert not retries.offer({"ip": "b"}, _failure("SSH error: timed out"))
+
+
+def test_delay_doubles_within_jitter_and_cap():
+    retries = RetryQueue(base=1.0, cap=4.0)
+    for attempt, ceiling in ((1, 1.0), (2, 2.0), (3, 4.0), (6, 4.0)):
+        for _ in range(20):
+            assert ceiling / 2 <= retries.delay(attempt) <= ceiling
+
+
+def test_closed_queue_takes_nothing_and_drain_returns_held():
+    retries = RetryQueue(base=60, budget_min=10)
+    host = {"ip": "10.0.0.1"}
+    held = _failure("SSH error: timed out")
+    assert retries.offer(host, held)
+    retries.close()
+    assert retries.offer({"ip": "10.0.0.2"}, _failure("SSH error: timed out")) is False
+    assert retries.pop_due() is None  # still backing off
+    assert retries.drain() == [held]
+    assert len(retries) == 0
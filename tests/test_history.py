@@ -0,0 +1,152 @@
+# tests/test_history.py
+import sqlite3
+
+import pytest
+
+import inventory
+from history import RunHistory, command_signature, format_diff
+
+COMMAND = {"command": "df -P /", "parse": r"(\d+)%"}
+
+
+@pytest.fixture
+def history():
+    store = RunHistory(":memory:", max_runs=50)
+    yield store
+    store.close()
+
+
+def _host(ip, value=None, error="", jump_host=None, hostname=None):
+    result = {"hostname": hostname or ip, "ip": ip, "port": 22, "output": "" if value is None else value,
+              "error": error}
+    if jump_host:
+        result["jump_host"] = jump_host
+    return result
+
+
+def _run(history, results, command=COMMAND):
+    run_id = history.begin_run(command, len(results), "thread")
+    for result in results:
+        history.record(run_id, result)
+    failed = sum(1 for result in results if result["error"])
+    history.finish_run(run_id, {"total": len(results), "completed": len(results), "failed": failed})
+    return run_id
+
+
+def test_diff_reports_changed_added_and_removed(history):
+    old = _run(history, [_host("10.0.0.1", "40%"), _host("10.0.0.2", "88%"), _host("10.0.0.3", "10%")])
+    new = _run(history, [_host("10.0.0.1", "40%"), _host("10.0.0.2", "93%"), _host("10.0.0.4", "1%")])
+    assert history.previous_run(new) == old
+    diff = history.diff(old, new)
+    assert diff["compared"] == 2
+    assert [(row["ip"], row["old"], row["new"]) for row in diff["changed"]] == [("10.0.0.2", "88%", "93%")]
+    assert diff["added"] == [("10.0.0.4", 22, "")]
+    assert diff["removed"] == [("10.0.0.3", 22, "")]
+    assert format_diff(diff).splitlines()[1] == "10.0.0.2 10.0.0.2:22: '88%' -> '93%'"
+
+
+def test_diff_threshold_and_failures(history):
+    old = _run(history, [_host("10.0.0.1", "85%"), _host("10.0.0.2", "88%"), _host("10.0.0.3", "50%")])
+    new = _run(history, [_host("10.0.0.1", "89%"), _host("10.0.0.2", "93%"),
+                         _host("10.0.0.3", error="Authentication failed.")])
+    changed = history.diff(old, new, threshold=90)["changed"]
+    # 85 -> 89 stays below the threshold; a host that started failing is always reported
+    assert [row["ip"] for row in changed] == ["10.0.0.2", "10.0.0.3"]
+    assert changed[1]["new"] is None and changed[1]["new_error"] == "Authentication failed."
+
+
+def test_previous_run_needs_same_commands(history):
+    first = _run(history, [_host("10.0.0.1", "1%")])
+    _run(history, [_host("10.0.0.1", "5.14")], command={"command": "uname -r", "parse": "(.+)"})
+    latest = _run(history, [_host("10.0.0.1", "2%")])
+    assert history.previous_run(latest) == first
+    assert history.previous_run(first) is None
+
+
+def test_same_address_behind_two_bastions(history):
+    old = _run(history, [_host("10.0.0.5", "1%", jump_host="east"), _host("10.0.0.5", "1%", jump_host="west")])
+    new = _run(history, [_host("10.0.0.5", "1%", jump_host="east"), _host("10.0.0.5", "9%", jump_host="west")])
+    diff = history.diff(old, new)
+    assert diff["compared"] == 2
+    assert [(row["jump_host"], row["new"]) for row in diff["changed"]] == [("west:22", "9%")]
+
+
+def test_jump_host_alias_is_the_same_bastion(history, monkeypatch):
+    monkeypatch.setattr(inventory, "JUMP_HOSTS", {"east": "admin@192.0.2.10:2222"})
+    old = _run(history, [_host("10.0.0.5", "1%", jump_host="east")])
+    new = _run(history, [_host("10.0.0.5", "2%", jump_host="ops@192.0.2.10:2222")])
+    diff = history.diff(old, new)
+    assert diff["compared"] == 1 and not diff["added"]
+    assert diff["changed"][0]["jump_host"] == "192.0.2.10:2222"
+
+
+def test_rerun_merges_into_original_run(history):
+    previous = _run(history, [_host("10.0.0.1", "40%"), _host("10.0.0.2", "50%")])
+    run_id = _run(history, [_host("10.0.0.1", "41%"), _host("10.0.0.2", error="SSH error: timed out")])
+
+    # Re-run Failed: only the failed host, recorded into the same run
+    history.record(run_id, _host("10.0.0.2", "50%"))
+    history.finish_run(run_id, {"total": 1, "completed": 1, "failed": 0}, merged=True)
+
+    runs = history.runs()
+    assert [run["id"] for run in runs] == [run_id, previous]
+    assert runs[0]["total"] == 2 and runs[0]["completed"] == 2 and runs[0]["failed"] == 0
+    assert history.previous_run(run_id) == previous
+    diff = history.diff(previous, run_id)
+    assert diff["compared"] == 2
+    assert [row["ip"] for row in diff["changed"]] == ["10.0.0.1"]
+
+
+def test_rerun_still_failing_keeps_failure_count(history):
+    run_id = _run(history, [_host("10.0.0.1", "40%"), _host("10.0.0.2", error="SSH error: timed out"),
+                            _host("10.0.0.3", error="SSH error: timed out")])
+    history.record(run_id, _host("10.0.0.2", "50%"))
+    history.record(run_id, _host("10.0.0.3", error="SSH error: Connection reset by peer"))
+    history.finish_run(run_id, {"total": 2, "completed": 2, "failed": 1}, merged=True)
+    assert history.runs()[0]["failed"] == 1
+
+
+def test_batch_keys_are_compared_per_command(history):
+    batch = {"batch": {"A": {"command": "a", "parse": "(.+)"}, "B": {"command": "b", "parse": "(.+)"}}}
+
+    def run(b_value):
+        run_id = history.begin_run(batch, 1)
+        history.record(run_id, {"ip": "10.0.0.1", "port": 22, "output": "", "error": "",
+                                "results": {"A": {"output": "x", "error": ""}, "B": {"output": b_value, "error": ""}}},
+                       ["A", "B"])
+        history.finish_run(run_id, {"total": 1})
+        return run_id
+
+    old, new = run("1"), run("2")
+    diff = history.diff(old, new)
+    assert diff["compared"] == 2
+    assert [row["command_key"] for row in diff["changed"]] == ["B"]
+
+
+def test_old_history_file_is_migrated(tmp_path):
+    # A file from before results were keyed by jump host
+    path = str(tmp_path / "history.db")
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE runs (id INTEGER PRIMARY KEY AUTOINCREMENT, started_at REAL NOT NULL, finished_at REAL,
+            label TEXT NOT NULL, signature TEXT NOT NULL, engine TEXT, total INTEGER NOT NULL, completed INTEGER,
+            failed INTEGER, cancelled INTEGER, summary TEXT);
+        CREATE TABLE results (run_id INTEGER NOT NULL, ip TEXT NOT NULL, port INTEGER NOT NULL,
+            command_key TEXT NOT NULL, hostname TEXT, output TEXT, value TEXT, error TEXT, duration REAL,
+            timings TEXT, PRIMARY KEY (run_id, ip, port, command_key));
+    """)
+    db.execute("INSERT INTO runs (id, started_at, finished_at, label, signature, total) VALUES (1, 0, 1, '', ?, 1)",
+               (command_signature(COMMAND),))
+    db.execute("INSERT INTO results (run_id, ip, port, command_key, value) VALUES (1, '10.0.0.1', 22, '', '1%')")
+    db.commit()
+    db.close()
+
+    history = RunHistory(path)
+    try:
+        new = _run(history, [_host("10.0.0.1", "2%")])
+        assert history.previous_run(new) == 1
+        diff = history.diff(1, new)
+        assert diff["compared"] == 1
+        assert diff["changed"][0]["jump_host"] == ""
+    finally:
+        history.close()
@@ -0,0 +1,122 @@
+# tests/test_inventory.py
+import pytest
+
+import inventory
+from inventory import InventoryError, expand_address, iter_hosts, jump_host_key, load_inventory, parse_jump_host
+
+
+def _csv(tmp_path, name, rows, header="hostname,ip,port,jump_host,tags"):
+    path = tmp_path / name
+    path.write_text("\n".join([header] + rows) + "\n")
+    return str(path)
+
+
+def test_cidr_expands_to_its_hosts():
+    assert list(expand_address("10.0.0.0/30")) == ["10.0.0.1", "10.0.0.2"]
+    assert list(expand_address("10.0.0.7/32")) == ["10.0.0.7"]
+    assert list(expand_address("10.0.0.5/30")) == ["10.0.0.5", "10.0.0.6"]  # host bits ignored
+
+
+def test_addresses_and_names_are_normalized():
+    assert expand_address(" 2001:DB8::1 ") == ["2001:db8::1"]
+    assert expand_address("Web-01.Example.com") == ["web-01.example.com"]
+
+
+@pytest.mark.parametrize("value", ["", "10.0.0.0/33", "999.1.1.1", "bad host!"])
+def test_bad_addresses(value):
+    with pytest.raises(ValueError):
+        list(expand_address(value))
+
+
+def test_cidr_size_limit(monkeypatch):
+    monkeypatch.setattr(inventory, "INVENTORY_MAX_CIDR_HOSTS", 16)
+    with pytest.raises(ValueError, match="exceeds 16"):
+        expand_address("10.0.0.0/24")
+
+
+def test_iter_hosts_expands_and_dedupes(tmp_path):
+    first = _csv(tmp_path, "a.csv", [
+        "net,10.0.0.0/30,22,,",
+        "one,10.0.0.2,22,,",  # already in the range
+        "other-port,10.0.0.2,2222,,",
+        "blank-port,10.0.0.9,,,",
+        "",
+    ])
+    second = _csv(tmp_path, "b.csv", ["again,10.0.0.9,22,,"])
+    errors = []
+    hosts = list(iter_hosts([first, second], errors))
+    assert [(host["hostname"], host["ip"], host["port"]) for host in hosts] == [
+        ("net", "10.0.0.1", 22), ("net", "10.0.0.2", 22), ("other-port", "10.0.0.2", 2222),
+        ("blank-port", "10.0.0.9", 22),
+    ]
+    assert [host["row_id"] for host in hosts] == [0, 1, 2, 3]
+    assert errors == [
+        f"{first}:3: duplicate 10.0.0.2:22 (first at {first}:2)",
+        f"{second}:2: duplicate 10.0.0.9:22 (first at {first}:5)",
+    ]
+
+
+def test_same_address_behind_different_bastions_is_kept(tmp_path):
+    path = _csv(tmp_path, "hosts.csv", [
+        "a,10.0.0.5,22,east.example.com,",
+        "b,10.0.0.5,22,west.example.com,",
+        "c,10.0.0.5,22,,",
+        "d,10.0.0.5,22,east.example.com,",
+    ])
+    errors = []
+    hosts = list(iter_hosts([path], errors))
+    assert [host["hostname"] for host in hosts] == ["a", "b", "c"]
+    assert len(errors) == 1 and "duplicate 10.0.0.5:22 via east.example.com" in errors[0]
+
+
+def test_jump_host_alias_and_address_are_one_bastion(tmp_path, monkeypatch):
+    monkeypatch.setattr(inventory, "JUMP_HOSTS", {"bastion-east": "admin@192.0.2.10:2222"})
+    path = _csv(tmp_path, "hosts.csv", [
+        "a,10.0.0.5,22,bastion-east,",
+        "b,10.0.0.5,22,ops@192.0.2.10:2222,",
+        "c,10.0.0.5,22,192.0.2.10,",  # port 22: another bastion
+    ])
+    errors = []
+    hosts = list(iter_hosts([path], errors))
+    assert [host["hostname"] for host in hosts] == ["a", "c"]
+    assert hosts[0]["jump_host"] == "bastion-east"
+    assert len(errors) == 1 and "duplicate 10.0.0.5:22 via ops@192.0.2.10:2222" in errors[0]
+
+
+@pytest.mark.parametrize("value, key", [
+    ("", ""),
+    ("Bastion.example.com", "bastion.example.com:22"),
+    ("admin@192.0.2.10:2222", "192.0.2.10:2222"),
+    ("[2001:db8::1]:2200", "[2001:db8::1]:2200"),
+])
+def test_jump_host_key(value, key):
+    assert jump_host_key(value) == key
+
+
+def test_bad_rows_are_skipped_and_tags_filter(tmp_path):
+    path = _csv(tmp_path, "hosts.csv", [
+        "web,10.0.0.1,22,,web;prod",
+        "db,10.0.0.2,22,,db prod",
+        "badport,10.0.0.3,70000,,web",
+        "badip,10.0.0.300,22,,web",
+        "badjump,10.0.0.4,22,admin@:x,web",
+    ])
+    hosts, errors = load_inventory([path], tags=["web"])
+    assert [host["hostname"] for host in hosts] == ["web"]
+    assert hosts[0]["tags"] == ["web", "prod"]
+    assert len(errors) == 3
+
+
+def test_missing_column(tmp_path):
+    path = _csv(tmp_path, "hosts.csv", ["web,10.0.0.1"], header="hostname,ip")
+    with pytest.raises(InventoryError):
+        load_inventory([path])
+
+
+@pytest.mark.parametrize("value, parsed", [
+    ("bastion", ("", "bastion", 22)),
+    ("admin@Bastion.example.com:2222", ("admin", "bastion.example.com", 2222)),
+    ("[2001:db8::1]:2200", ("", "2001:db8::1", 2200)),
+])
+def test_parse_jump_host(value, parsed):
+    assert parse_jump_host(value) == parsed
@@ -0,0 +1,91 @@
+# tests/test_parsing.py
+import pytest
+
+from parsing import GENERIC_PATTERN, build_batch_command, compile_parse, parse_batch_output, parse_output
+
+
+def _command(command, parse):
+    return {"command": command, "parse": parse, "regex": compile_parse(parse)}
+
+
+COMMANDS = {
+    "POSIX: Hostname": _command("hostname", GENERIC_PATTERN),
+    "POSIX: Disk": _command("df", r"use=(\d+)%"),
+}
+
+
+def _section(token, i, text, status=None):
+    end = f"{token}:{i}:END" + (f":{status}" if status is not None else "")
+    return f"{token}:{i}:BEGIN\n{text}\n\n{end}\n"
+
+
+def _parse(output, error_output="", note=""):
+    result = {"output": "", "error": ""}
+    token = "__SSHLOOP_test__"
+    parse_batch_output(output.replace("TOKEN", token), error_output.replace("TOKEN", token), token,
+                       COMMANDS, result, note)
+    return result
+
+
+def test_build_batch_command_marks_every_command():
+    script, token = build_batch_command(COMMANDS)
+    assert token.startswith("__SSHLOOP_")
+    for i, info in enumerate(COMMANDS.values()):
+        assert f'echo "{token}:{i}:BEGIN"' in script
+        assert f'echo "{token}:{i}:END:$rc"' in script
+        assert info["command"] in script
+
+
+def test_parse_batch_output():
+    result = _parse(_section("TOKEN", 0, "web-01", 0) + _section("TOKEN", 1, "use=87%", 0))
+    assert result["results"]["POSIX: Hostname"] == {"output": "web-01", "error": ""}
+    assert result["results"]["POSIX: Disk"] == {"output": "87", "error": ""}
+    assert result["output"] == "POSIX: Hostname: web-01\nPOSIX: Disk: 87"
+    assert result["error"] == ""
+
+
+def test_exit_status_and_stderr_per_command():
+    result = _parse(_section("TOKEN", 0, "web-01", 0) + _section("TOKEN", 1, "use=87%", 3),
+                    _section("TOKEN", 0, "") + _section("TOKEN", 1, "df: /mnt: stale handle"))
+    disk = result["results"]["POSIX: Disk"]
+    assert disk["error"] == "Exit Code 3: df: /mnt: stale handle"
+    assert disk["error_code"] == "exec"
+    assert result["error"] == "POSIX: Disk: Exit Code 3: df: /mnt: stale handle"
+    assert result["error_code"] == "exec"
+
+
+def test_missing_marker_reports_no_result():
+    # Output cut off inside the second command: its END marker never arrived
+    result = _parse(_section("TOKEN", 0, "web-01", 0) + "TOKEN:1:BEGIN\nuse=87%\n", note="Output truncated")
+    assert result["results"]["POSIX: Hostname"]["output"] == "web-01"
+    assert result["results"]["POSIX: Disk"]["error"] == "No result returned for this command"
+    assert result["error"] == "Output truncated; POSIX: Disk: No result returned for this command"
+    assert result["error_code"] == "exec"
+
+
+@pytest.mark.parametrize("garbled", [
+    "TOKEN:0:BEGIN\nweb-01\nTOKEN:1:END:0\n",  # closed with another command's marker
+    "TOKEN:0:BEGIN\nweb-01\nTOKEN:0:END:\n",  # exit status missing
+    "__SSHLOOP_other__:0:BEGIN\nweb-01\n__SSHLOOP_other__:0:END:0\n",  # another run's token
+])
+def test_garbled_marker_is_not_trusted(garbled):
+    result = _parse(garbled + _section("TOKEN", 1, "use=87%", 0))
+    assert result["results"]["POSIX: Hostname"]["error"] == "No result returned for this command"
+    assert result["results"]["POSIX: Disk"] == {"output": "87", "error": ""}
+
+
+def test_parse_output_named_groups_and_misses():
+    info = _command("uptime", [r"up (?P<days>\d+) days", r"load average: (?P<load>[\d.]+)", r"users=(\d+)"])
+    result = {"output": "", "error": ""}
+    parse_output("up 12 days, load average: 0.42", "", 0, info, result)
+    assert result["fields"] == {"days": "12", "load": "0.42"}
+    assert result["output"] == "days: 12\nload: 0.42"
+    assert result["error"] == "Parse failed: 1 of 3 patterns not found"
+    assert result["error_code"] == "parse"
+
+
+def test_compile_parse_rejects_patterns_without_groups():
+    with pytest.raises(ValueError):
+        compile_parse(r"\d+")
+    with pytest.raises(ValueError):
+        compile_parse([])
@@ -0,0 +1,324 @@
+# transfer.py
+"""
+File push / pull over SFTP across the fleet.
+A transfer is a command_info like any other (see transfer_command), so it
+runs through the same dispatcher, workers, connection pool, jump hosts,
+retries and result files as a command, on either engine.
+
+push  uploads one local file to the same remote path on every host.  The
+      local file is hashed once per run; a host whose file already has that
+      SHA-256 is skipped.  Otherwise the file is uploaded next to the target,
+      its remote hash checked, and renamed over the target (keeping the old
+      file's permissions), so a failed upload never leaves a partial file.
+pull  downloads a remote file from every host into <dest>/<host>/.  A host
+      whose remote hash matches the copy already there is skipped; a
+      download replaces that copy only once its hash matches the remote one.
+
+Writes are pipelined and reads prefetched, with up to
+TRANSFER_MAX_REQUESTS SFTP requests in flight, so a file is not one round
+trip per 32 KiB block.  Remote hashes come from sha256sum (or shasum) on
+the host; where neither exists, files are checked by size and never skipped.
+
+A host's output is "<action> <size> bytes, sha256 <hash>", so hosts holding
+the same file fall into one result group, and "fields" has sha256 and bytes
+for run history diffs.  The hash commands count as the "exec" phase, the
+transfer itself as "read".
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import shlex
+import time
+import uuid
+
+from config import TIMEOUT, TRANSFER_DIR, TRANSFER_MAX_REQUESTS, DEBUG
+
+HASH_CHUNK = 1048576
+HASH_COMMAND = "sha256sum -- {path} 2>/dev/null || shasum -a 256 -- {path} 2>/dev/null"
+SHA256_RE = re.compile(r"^([0-9a-f]{64})\b")
+UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class TransferError(Exception):
+    """A file could not be transferred or did not arrive intact."""
+
+
+def file_sha256(path):
+    """(hex SHA-256, size in bytes) of a local file, read in HASH_CHUNK pieces."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def host_dir(host_info):
+    """Directory name for a host's pulled files: hostname (and ip when they differ), port unless 22."""
+    hostname, ip, port = str(host_info.get("hostname") or ""), str(host_info["ip"]), int(host_info["port"])
+    name = ip if hostname in ("", ip) else f"{hostname}_{ip}"
+    if port != 22:
+        name += f"_{port}"
+    return UNSAFE_NAME_RE.sub("_", name)
+
+
+def transfer_command(direction, remote, local=None, dest=TRANSFER_DIR):
+    """
+    command_info for a transfer.
+
+    Args:
+        direction (str): "push" or "pull".
+        remote (str): Path on every host (relative paths are under the login's home).
+        local (str): push only, the file to upload.  It is hashed here, once.
+        dest (str): pull only, the directory the per-host directories go in.
+
+    Raises:
+        ValueError: Unknown direction, no remote path, or an unreadable local file.
+    """
+    remote = (remote or "").strip()
+    if not remote or remote.endswith("/"):
+        raise ValueError("A remote file path is required")
+    if direction == "push":
+        if not local or not os.path.isfile(local):
+            raise ValueError(f"Local file not found: {local}")
+        try:
+            sha256, size = file_sha256(local)
+        except OSError as e:
+            raise ValueError(f"Cannot read {local}: {e}") from None
+        spec = {"direction": "push", "local": os.path.abspath(local), "remote": remote,
+                "sha256": sha256, "bytes": size}
+        command = f"sftp push {local} -> {remote}"
+        description = f"Upload {local} ({size:,} bytes, sha256 {sha256[:12]}) to {remote}"
+    elif direction == "pull":
+        spec = {"direction": "pull", "remote": remote, "dest": os.path.abspath(dest)}
+        command = f"sftp pull {remote} -> {dest}"
+        description = f"Download {remote} from every host into {dest}/<host>/"
+    else:
+        raise ValueError(f"Unknown transfer direction: {direction}")
+    return {"command": command, "parse": "", "description": description, "transfer": spec}
+
+
+def _remote_hash(output):
+    match = SHA256_RE.match(output.strip())
+    return match.group(1) if match else None
+
+
+def _temp_name(path):
+    return f"{path}.sshloop-{uuid.uuid4().hex[:8]}"
+
+
+def _done(result, action, sha256, size, path=None):
+    result["output"] = f"{action} {size:,} bytes, sha256 {sha256}"
+    result["fields"] = {"sha256": sha256, "bytes": str(size)}
+    if path:
+        result["path"] = path
+
+
+def _failed(result, error):
+    result["error"] = f"Transfer failed: {error}"
+    result["error_code"] = "transfer"
+
+
+def _pull_target(host_info, spec):
+    directory = os.path.join(spec["dest"], host_dir(host_info))
+    return directory, os.path.join(directory, os.path.basename(spec["remote"].rstrip("/")))
+
+
+def _identical_copy(target, remote_sha):
+    """(sha256, size) of the local copy at target when it matches remote_sha, else None."""
+    if remote_sha is None or not os.path.isfile(target):
+        return None
+    sha256, size = file_sha256(target)
+    return (sha256, size) if sha256 == remote_sha else None
+
+
+def _keep_download(temp, target, remote_sha):
+    """
+    Check a finished download against the remote hash and move it into place.
+
+    Returns:
+        tuple: (sha256, size) of the file now at target.
+
+    Raises:
+        TransferError: The download does not match the remote hash.
+    """
+    sha256, size = file_sha256(temp)
+    if remote_sha is not None and sha256 != remote_sha:
+        os.remove(temp)
+        raise TransferError(f"checksum mismatch (remote {remote_sha[:12]}, received {sha256[:12]})")
+    os.replace(temp, target)
+    return sha256, size
+
+
+def _discard_download(temp, directory):
+    """Remove a failed download, and the host's directory if that leaves it empty."""
+    if os.path.exists(temp):
+        os.remove(temp)
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass  # holds an earlier copy
+
+
+def _check_upload(spec, uploaded_sha, uploaded_size):
+    """Raises TransferError when the uploaded copy differs from the local file."""
+    if uploaded_sha is not None and uploaded_sha != spec["sha256"]:
+        raise TransferError(f"checksum mismatch (local {spec['sha256'][:12]}, remote {uploaded_sha[:12]})")
+    if uploaded_sha is None and uploaded_size != spec["bytes"]:
+        raise TransferError(f"size mismatch (local {spec['bytes']}, remote {uploaded_size})")
+
+
+def run_transfer(transport, host_info, spec, result, chan=None):
+    """
+    Push or pull spec's file over an authenticated paramiko transport (thread
+    engine).  chan, if given, is an already opened session channel to use for
+    the first remote hash.  Transfer and checksum failures are recorded in
+    result; connection errors are raised as for a command.
+    """
+    import paramiko
+    from ssh_worker import _exec_channel, lap
+
+    timings = result.setdefault("timings", {})
+
+    def remote_sha(path):
+        nonlocal chan
+        opened, chan = chan, None
+        if opened is None:
+            mark = time.perf_counter()
+            opened = transport.open_session(timeout=TIMEOUT)
+            lap(timings, "exec", mark)
+        output, _, _, _ = _exec_channel(opened, HASH_COMMAND.format(path=shlex.quote(path)), timings)
+        return _remote_hash(output)
+
+    current = remote_sha(spec["remote"])
+    sftp = None
+    try:
+        if spec["direction"] == "push":
+            if current == spec["sha256"]:
+                _done(result, "identical", spec["sha256"], spec["bytes"])
+                return
+            mark = time.perf_counter()
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            temp = _temp_name(spec["remote"])
+            try:
+                # putfo pipelines its writes (no round trip per block) and checks the size
+                attrs = sftp.put(spec["local"], temp, confirm=True)
+                lap(timings, "read", mark)
+                _check_upload(spec, remote_sha(temp), attrs.st_size)
+                try:
+                    sftp.chmod(temp, sftp.stat(spec["remote"]).st_mode & 0o7777)
+                except IOError:
+                    pass  # no file to replace: the server's umask applies
+                try:
+                    sftp.posix_rename(temp, spec["remote"])
+                except IOError:
+                    # Without the posix-rename extension a rename cannot replace a file
+                    try:
+                        sftp.remove(spec["remote"])
+                    except IOError:
+                        pass
+                    sftp.rename(temp, spec["remote"])
+            except BaseException:
+                try:
+                    sftp.remove(temp)
+                except Exception:
+                    pass
+                raise
+            _done(result, "pushed", spec["sha256"], spec["bytes"])
+        else:
+            directory, target = _pull_target(host_info, spec)
+            identical = _identical_copy(target, current)
+            if identical:
+                _done(result, "identical", *identical, path=target)
+                return
+            os.makedirs(directory, exist_ok=True)
+            temp = target + ".part"
+            mark = time.perf_counter()
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            try:
+                sftp.get(spec["remote"], temp, prefetch=True, max_concurrent_prefetch_requests=TRANSFER_MAX_REQUESTS)
+            except BaseException:
+                _discard_download(temp, directory)
+                raise
+            lap(timings, "read", mark)
+            _done(result, "pulled", *_keep_download(temp, target, current), path=target)
+    except (TransferError, paramiko.SFTPError, IOError) as e:
+        _failed(result, f"{spec['remote']}: {e}")
+    finally:
+        if sftp is not None:
+            sftp.close()
+    if DEBUG:
+        print(f"[DEBUG] Transfer on {host_info['ip']}: {result['output'] or result['error']}")
+
+
+async def run_transfer_async(conn, host_info, spec, result):
+    """run_transfer for the asyncio engine, on an asyncssh connection."""
+    import asyncssh
+    from async_worker import _run_command
+    from ssh_worker import lap
+
+    timings = result.setdefault("timings", {})
+    loop = asyncio.get_running_loop()
+
+    async def remote_sha(path):
+        output, _, _, _ = await _run_command(conn, HASH_COMMAND.format(path=shlex.quote(path)), timings)
+        return _remote_hash(output)
+
+    current = await remote_sha(spec["remote"])
+    try:
+        if spec["direction"] == "push":
+            if current == spec["sha256"]:
+                _done(result, "identical", spec["sha256"], spec["bytes"])
+                return
+            mark = time.perf_counter()
+            async with conn.start_sftp_client() as sftp:
+                temp = _temp_name(spec["remote"])
+                try:
+                    await sftp.put(spec["local"], temp, max_requests=TRANSFER_MAX_REQUESTS)
+                    lap(timings, "read", mark)
+                    _check_upload(spec, await remote_sha(temp), (await sftp.stat(temp)).size)
+                    try:
+                        await sftp.chmod(temp, (await sftp.stat(spec["remote"])).permissions & 0o7777)
+                    except asyncssh.SFTPError:
+                        pass
+                    try:
+                        await sftp.posix_rename(temp, spec["remote"])
+                    except asyncssh.SFTPError:
+                        try:
+                            await sftp.remove(spec["remote"])
+                        except asyncssh.SFTPError:
+                            pass
+                        await sftp.rename(temp, spec["remote"])
+                except BaseException:
+                    try:
+                        await sftp.remove(temp)
+                    except Exception:
+                        pass
+                    raise
+            _done(result, "pushed", spec["sha256"], spec["bytes"])
+        else:
+            directory, target = _pull_target(host_info, spec)
+            # Local hashing can take a while for big files; keep it off the event loop
+            identical = await loop.run_in_executor(None, _identical_copy, target, current)
+            if identical:
+                _done(result, "identical", *identical, path=target)
+                return
+            os.makedirs(directory, exist_ok=True)
+            temp = target + ".part"
+            mark = time.perf_counter()
+            async with conn.start_sftp_client() as sftp:
+                try:
+                    await sftp.get(spec["remote"], temp, max_requests=TRANSFER_MAX_REQUESTS)
+                except BaseException:
+                    _discard_download(temp, directory)
+                    raise
+            lap(timings, "read", mark)
+            kept = await loop.run_in_executor(None, _keep_download, temp, target, current)
+            _done(result, "pulled", *kept, path=target)
+    except (TransferError, asyncssh.SFTPError, OSError) as e:
+        _failed(result, f"{spec['remote']}: {e}")
+    if DEBUG:
+        print(f"[DEBUG] Transfer on {host_info['ip']}: {result['output'] or result['error']}")